@@ -53,5 +53,11 @@ setup(
         "tinydb==3.1.3",
         "requests==2.20.0",
         "retrying==1.3.3",
-    ]
+    ],
+    extras_require={
+        # Faster literal matching in the blobs scan mode
+        'ahocorasick': ["pyahocorasick==1.4.0"],
+        # Vectorized entropy detection
+        'entropy': ["numpy>=1.11"],
+    }
 )
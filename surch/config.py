@@ -0,0 +1,219 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import re
+from collections import Mapping
+
+import yaml
+
+from . import constants, store
+
+
+SIZE_REGEX = re.compile(r'^\d+(\.\d+)?[KMG]?$', re.IGNORECASE)
+
+
+class ConfigError(Exception):
+    pass
+
+
+def _string(key, value):
+    if not isinstance(value, basestring):
+        raise ConfigError('"{0}" must be a string'.format(key))
+    return value
+
+
+def _strings(key, value):
+    if isinstance(value, basestring):
+        return (value,)
+    if not isinstance(value, (list, tuple)) or \
+            not all(isinstance(item, basestring) for item in value):
+        raise ConfigError('"{0}" must be a list of strings'.format(key))
+    return tuple(value)
+
+
+def _boolean(key, value):
+    if not isinstance(value, bool):
+        raise ConfigError('"{0}" must be true or false'.format(key))
+    return value
+
+
+def _count(key, value):
+    if isinstance(value, bool) or not isinstance(value, (int, long)) or \
+            value < 1:
+        raise ConfigError('"{0}" must be a number above 0'.format(key))
+    return value
+
+
+def _size(key, value):
+    if isinstance(value, bool) or \
+            not isinstance(value, (int, long, basestring)) or \
+            not SIZE_REGEX.match(str(value)):
+        raise ConfigError(
+            '"{0}" must be a number of bytes with an optional K, M or G '
+            'suffix'.format(key))
+    return value
+
+
+def _choice(choices, validate=_string):
+    def validate_choice(key, value):
+        value = validate(key, value)
+        for item in value if isinstance(value, tuple) else (value,):
+            if item not in choices:
+                raise ConfigError('"{0}" must be one of {1}, not {2}'.format(
+                    key, ', '.join(sorted(choices)), item))
+        return value
+    return validate_choice
+
+
+def _section(fields, required=()):
+    def validate_section(key, value):
+        if not isinstance(value, dict):
+            raise ConfigError('"{0}" must be a mapping'.format(key))
+        for name in required:
+            if name not in value:
+                raise ConfigError('"{0}" is missing "{1}"'.format(key, name))
+        return Settings(value, fields)
+    return validate_section
+
+
+VAULT_FIELDS = {
+    'vault_url': _string,
+    'vault_token': _string,
+    'secret_path': _string,
+    'key_list': _strings,
+    'jobs': _count,
+}
+
+PAGERDUTY_FIELDS = {
+    'api_key': _string,
+    'service_key': _string,
+}
+
+# The types of the known fields of the config file. Other fields are kept
+# as they are.
+FIELDS = {
+    'organization': _string,
+    'repo_url': _string,
+    'git_user': _string,
+    'git_password': _string,
+    'results_dir': _string,
+    'cloned_repos_dir': _string,
+    'cloned_repo_dir': _string,
+    'github_api_url': _string,
+    'search_list': _strings,
+    'repos_to_check': _strings,
+    'repos_to_skip': _strings,
+    'pager': _strings,
+    'source': _strings,
+    'refs': _strings,
+    'include_paths': _strings,
+    'exclude_paths': _strings,
+    'detectors': _choice(constants.DETECTORS, _strings),
+    'scan_mode': _choice(constants.SCAN_MODES),
+    'match_mode': _choice(constants.MATCH_MODES),
+    'object_backend': _choice(constants.OBJECT_BACKENDS),
+    'results_store': _choice(store.RESULTS_STORES),
+    'jobs': _count,
+    'clone_jobs': _count,
+    'scan_jobs': _count,
+    'max_blob_size': _size,
+    'print_result': _boolean,
+    'verbose': _boolean,
+    'is_organization': _boolean,
+    'consolidate_log': _boolean,
+    'remove_cloned_dir': _boolean,
+    'incremental': _boolean,
+    'mirror': _boolean,
+    'shared_objects': _boolean,
+    'skip_binary': _boolean,
+    'include_private': _boolean,
+    'include_forks': _boolean,
+    'include_archived': _boolean,
+    'http_cache': _boolean,
+    'vault': _section(
+        VAULT_FIELDS, required=('vault_url', 'vault_token', 'secret_path')),
+    'pagerduty': _section(
+        PAGERDUTY_FIELDS, required=('api_key', 'service_key')),
+}
+
+
+class Settings(Mapping):
+    """The validated, immutable content of a config file.
+
+    Fields are read as items or as attributes, e.g. `settings.search_list`.
+    Lists are turned into tuples and sections, such as `vault`, into
+    settings of their own.
+    """
+
+    def __init__(self, values, fields=FIELDS, path=None):
+        settings = {}
+        for key, value in values.items():
+            if key in fields:
+                if value is not None:
+                    value = fields[key](key, value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            settings[key] = value
+        object.__setattr__(self, '_settings', settings)
+        object.__setattr__(self, 'path', path)
+
+    def __getitem__(self, key):
+        return self._settings[key]
+
+    def __iter__(self):
+        return iter(self._settings)
+
+    def __len__(self):
+        return len(self._settings)
+
+    def __nonzero__(self):
+        # A loaded config file counts as given, even if it's empty
+        return True
+
+    def __getattr__(self, key):
+        try:
+            return self._settings[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __repr__(self):
+        # Without the values, which include credentials
+        return '<Settings {0}>'.format(', '.join(sorted(self._settings)))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Settings are immutable')
+
+    def to_dict(self):
+        """Return the settings as a mutable dict of lists, e.g. to be passed
+        as keyword arguments.
+        """
+        return dict((key, list(value) if isinstance(value, tuple) else value)
+                    for key, value in self._settings.items())
+
+
+def load(config_file):
+    """Return the `Settings` of the config file. Settings are returned as
+    is, so a config file is only read and validated once.
+    """
+    if isinstance(config_file, Settings):
+        return config_file
+    with open(config_file) as config:
+        try:
+            values = yaml.safe_load(config) or {}
+        except yaml.YAMLError as error:
+            raise ConfigError(str(error))
+    if not isinstance(values, dict):
+        raise ConfigError('The config file must be a mapping')
+    return Settings(values, path=config_file)
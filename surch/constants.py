@@ -4,9 +4,27 @@ HOME_DIR = os.path.expanduser("~")
 DEFAULT_PATH = os.path.join(HOME_DIR, '.surch')
 CLONED_REPOS_PATH = os.path.join(DEFAULT_PATH, 'clones')
 RESULTS_PATH = os.path.join(DEFAULT_PATH, 'results')
+STATE_PATH = os.path.join(DEFAULT_PATH, 'state')
+HTTP_CACHE_PATH = os.path.join(DEFAULT_PATH, 'http-cache')
+# Created inside the clones directory of an org
+SHARED_OBJECTS_DIR = '.surch-objects.git'
 
-GITHUB_API_URL = 'https://api.github.com/{0}/{1}'
-GITHUB_REPO_DETAILS_API_URL = \
-    ''.join([GITHUB_API_URL, '/repos?type={2}&per_page={3}&page={4}'])
+SCAN_MODES = ('commits', 'blobs')
+DEFAULT_SCAN_MODE = 'commits'
+DEFAULT_REFS = ('all',)
+MATCH_MODES = ('patterns', 'hashed')
+DEFAULT_MATCH_MODE = 'patterns'
+OBJECT_BACKENDS = ('git', 'packs')
+DEFAULT_OBJECT_BACKEND = 'git'
+DETECTORS = ('entropy',)
+# Files with these extensions are skipped as binary without being read
+BINARY_EXTENSIONS = (
+    '7z', 'a', 'bin', 'bmp', 'bz2', 'class', 'dll', 'dylib', 'ear', 'eot',
+    'exe', 'gif', 'gz', 'ico', 'iso', 'jar', 'jpeg', 'jpg', 'mov', 'mp3',
+    'mp4', 'o', 'otf', 'pdf', 'png', 'psd', 'pyc', 'rar', 'so', 'tar', 'tgz',
+    'tif', 'tiff', 'ttf', 'war', 'webp', 'whl', 'woff', 'woff2', 'xz',
+    'zip')
+
+GITHUB_API_URL = 'https://api.github.com'
 
 GITHUB_BLOB_URL = 'https://github.com/{0}/{1}/blob/{2}/{3}'
@@ -0,0 +1,230 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import re
+import math
+import string
+from collections import defaultdict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The detector of the matches of the search list
+SEARCH_LIST_DETECTOR = 'search_list'
+
+ENTROPY_WINDOW = 32
+# Content is processed in chunks of this many windows to bound memory
+NUMPY_CHUNK_SIZE = 1024 * 1024
+# NumPy has a fixed cost per blob, so it's only used when the runs of a
+# blob add up to this many characters. Most source files have much less,
+# and are faster in pure Python, while NumPy is about 20 times faster on
+# e.g. data files made of long runs.
+NUMPY_MIN_RUNS_SIZE = 64 * 1024
+# Git SHA-1 and SHA-256 object names, e.g. in commit references and GitHub
+# URLs, are random hex strings too, but never secrets
+GIT_OBJECT_NAME_REGEX = re.compile(
+    '(?<![0-9a-fA-F])(?:[0-9a-f]{64}|[0-9a-f]{40})(?![0-9a-fA-F])')
+
+
+class Charset(object):
+    """The characters of a kind of key, and the entropy over a window of
+    `ENTROPY_WINDOW` of them above which a run of them is likely a key.
+
+    Random keys of 32 base64 characters have an entropy of about 4.6 bits
+    per character while identifiers and paths stay around 4.1. For hex
+    keys, these are 3.6 and 3 bits.
+    """
+
+    def __init__(self, name, characters, threshold, required=''):
+        self.name = name
+        self.characters = characters
+        self.threshold = threshold
+        # Windows without any of these characters are never flagged, e.g.
+        # a run of letters is a word rather than a base64 key
+        self.required = required
+        self.regex = re.compile('[{0}]{{{1},}}'.format(
+            re.escape(characters), ENTROPY_WINDOW))
+
+    def get_runs(self, content):
+        """Return the runs of the charset long enough to be checked, split
+        around the git object names they contain
+        """
+        runs = []
+        for match in self.regex.finditer(content):
+            runs.extend(
+                run for run in GIT_OBJECT_NAME_REGEX.split(match.group())
+                if len(run) >= ENTROPY_WINDOW)
+        return runs
+
+
+CHARSETS = (
+    Charset('base64', string.ascii_letters + string.digits + '+/=_-', 4.3,
+            required=string.digits),
+    Charset('hex', string.hexdigits, 3.3),
+)
+
+
+class EntropyDetector(object):
+    """Flag content containing high entropy runs of base64 or hex
+    characters, such as keys and tokens which aren't in the search list.
+
+    The Shannon entropy is computed over every window of `ENTROPY_WINDOW`
+    characters of the runs of a charset. With NumPy, the entropies of all the
+    windows of the runs of a blob are computed at once, if there are enough
+    of them.
+    """
+    name = 'entropy'
+
+    def __init__(self, charsets=CHARSETS):
+        self.charsets = charsets
+        # The entropy contributed by a character appearing n times in a
+        # window, for every n
+        self.entropy_terms = [0.0] + [
+            -(float(count) / ENTROPY_WINDOW) *
+            math.log(float(count) / ENTROPY_WINDOW, 2)
+            for count in range(1, ENTROPY_WINDOW + 1)]
+        if numpy:
+            # c * log2(c) for every count c
+            self._numpy_count_terms = numpy.array([0.0] + [
+                count * math.log(count, 2)
+                for count in range(1, ENTROPY_WINDOW + 1)])
+            self._numpy_codes = dict(
+                (charset.name, self._get_codes(charset))
+                for charset in charsets)
+
+    @staticmethod
+    def _get_codes(charset):
+        # Byte to character index lookup table. Bytes which are not in the
+        # charset get the extra last index.
+        codes = numpy.empty(256, dtype=numpy.intp)
+        codes.fill(len(charset.characters))
+        for index, character in enumerate(charset.characters):
+            codes[ord(character)] = index
+        return codes
+
+    def search(self, content):
+        """Return True if the content contains a high entropy run
+        """
+        for charset in self.charsets:
+            # Most content has no run long enough to check at all
+            if charset.regex.search(content) and self.get_max_entropy(
+                    content, charset, charset.threshold) >= \
+                    charset.threshold:
+                return True
+        return False
+
+    def get_max_entropy(self, content, charset, stop_at=None):
+        """Return the highest entropy of a window of a run of the charset
+        which contains its required characters. Stop as soon as it reaches
+        `stop_at`.
+        """
+        runs = charset.get_runs(content)
+        if numpy and sum(len(run) for run in runs) >= NUMPY_MIN_RUNS_SIZE:
+            return self._get_max_entropy_numpy(runs, charset, stop_at)
+        return self._get_max_entropy_python(runs, charset, stop_at)
+
+    def _get_max_entropy_numpy(self, runs, charset, stop_at):
+        # Only the runs are worth computing, separated by a character which
+        # isn't in the charset
+        codes = self._numpy_codes[charset.name][
+            numpy.frombuffer('\0'.join(runs), dtype=numpy.uint8)]
+        max_entropy = 0.0
+        for start in range(0, len(codes) - ENTROPY_WINDOW + 1,
+                           NUMPY_CHUNK_SIZE):
+            max_entropy = max(max_entropy, self._get_chunk_max_entropy(
+                codes[start:start + NUMPY_CHUNK_SIZE + ENTROPY_WINDOW - 1],
+                charset))
+            if stop_at is not None and max_entropy >= stop_at:
+                break
+        return max_entropy
+
+    def _get_chunk_max_entropy(self, codes, charset):
+        # The entropy of a window is log2(W) - sum(c * log2(c)) / W over the
+        # counts c of its characters. Sliding the window by one character
+        # only changes the counts of the characters entering and leaving it,
+        # which are looked up from the occurrences of every character.
+        symbols = len(charset.characters)
+        size = len(codes)
+        # The occurrences of every character, in order, character by
+        # character. Counting occurrences in a range of positions is a
+        # search in them, and the searches are in order too.
+        order = numpy.argsort(codes, kind='mergesort')
+        occurrences = codes[order] * (size + 1) + order
+        indexes = numpy.arange(size)
+        window_counts = numpy.empty(size, dtype=numpy.intp)
+        # The count of the character of every position in the window ending
+        # at it, and in the window starting at it
+        window_counts[order] = indexes + 1 - numpy.searchsorted(
+            occurrences, occurrences - ENTROPY_WINDOW, side='right')
+        forward_window_counts = numpy.empty(size, dtype=numpy.intp)
+        forward_window_counts[order] = numpy.searchsorted(
+            occurrences, occurrences + ENTROPY_WINDOW - 1,
+            side='right') - indexes
+
+        terms = self._numpy_count_terms
+        # The counts in the window of the leaving character before it
+        # leaves, and of the entering character after it enters
+        leaving_counts = forward_window_counts[:-ENTROPY_WINDOW]
+        entering_counts = window_counts[ENTROPY_WINDOW:]
+        first_sum = terms[numpy.bincount(codes[:ENTROPY_WINDOW])].sum()
+        sums = numpy.concatenate(([first_sum], first_sum + numpy.cumsum(
+            terms[leaving_counts - 1] - terms[leaving_counts] +
+            terms[entering_counts] - terms[entering_counts - 1])))
+        entropies = math.log(ENTROPY_WINDOW, 2) - sums / ENTROPY_WINDOW
+
+        # Only windows inside a run of the charset
+        windows = self._count_windows(codes == symbols) == 0
+        if charset.required:
+            required = numpy.zeros(symbols + 1, dtype=bool)
+            required[[charset.characters.index(character)
+                      for character in charset.required]] = True
+            windows &= self._count_windows(required[codes]) > 0
+        if not windows.any():
+            return 0.0
+        return float(entropies[windows].max())
+
+    @staticmethod
+    def _count_windows(mask):
+        cumulative = numpy.concatenate(([0], numpy.cumsum(mask)))
+        return cumulative[ENTROPY_WINDOW:] - cumulative[:-ENTROPY_WINDOW]
+
+    def _get_max_entropy_python(self, runs, charset, stop_at):
+        max_entropy = 0.0
+        for run in runs:
+            counts = defaultdict(int)
+            required_count = 0
+            for position, character in enumerate(run):
+                counts[character] += 1
+                required_count += character in charset.required
+                if position >= ENTROPY_WINDOW:
+                    dropped = run[position - ENTROPY_WINDOW]
+                    counts[dropped] -= 1
+                    required_count -= dropped in charset.required
+                if position >= ENTROPY_WINDOW - 1 and \
+                        (required_count or not charset.required):
+                    max_entropy = max(max_entropy, sum(
+                        self.entropy_terms[count]
+                        for count in counts.values()))
+            if stop_at is not None and max_entropy >= stop_at:
+                break
+        return max_entropy
+
+
+DETECTORS = {
+    EntropyDetector.name: EntropyDetector,
+}
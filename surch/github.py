@@ -0,0 +1,357 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import time
+import json
+import urllib
+import hashlib
+import urlparse
+import threading
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from . import constants, utils
+
+
+# The maximum page size of the GitHub API
+PER_PAGE = 100
+# The number of pages fetched concurrently, which is also the number of
+# pooled connections
+PAGE_JOBS = 8
+# The headers of the cached responses
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+# Requests are spaced out evenly until the rate limit resets once fewer
+# than this many are left
+SPACING_THRESHOLD = 100
+# Rate limited and failed requests are retried this many times, waiting
+# twice as long as the last time when GitHub doesn't say how long to wait
+MAX_ATTEMPTS = 5
+BACKOFF_DELAY = 1
+
+
+class GitHubError(Exception):
+    pass
+
+
+class NotFoundError(GitHubError):
+    pass
+
+
+class ResponseCache(object):
+    """An on-disk cache of API responses and their validators, i.e. their
+    `ETag` and `Last-Modified` headers.
+
+    Every URL is cached in a file of its own, named after the hash of the
+    URL and of the user the response was sent to, since different users
+    may see different data.
+    """
+
+    def __init__(self, cache_dir, user=None):
+        self.cache_dir = cache_dir
+        self.user = user or ''
+
+    def _get_path(self, url):
+        return os.path.join(self.cache_dir, '{0}.json'.format(
+            hashlib.sha256('{0}\n{1}'.format(self.user, url)).hexdigest()))
+
+    def get(self, url):
+        """Return the cached entry of the URL, or None
+        """
+        try:
+            with open(self._get_path(url)) as cache_file:
+                entry = json.load(cache_file)
+        except (IOError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def get_validators(self, entry):
+        """Return the headers making a request conditional on the cached
+        response being stale.
+        """
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def set(self, url, response):
+        """Cache the response if it can be validated later
+        """
+        headers = dict((header, response.headers[header])
+                       for header in CACHED_HEADERS
+                       if header in response.headers)
+        if 'ETag' not in headers and 'Last-Modified' not in headers:
+            return
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Created by another thread in the meantime
+                pass
+        path = self._get_path(url)
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as cache_file:
+            json.dump(dict(url=url, headers=headers, body=response.text),
+                      cache_file)
+        os.rename(temp_path, path)
+
+    @staticmethod
+    def get_response(url, entry):
+        """Return the response the entry was cached from
+        """
+        response = requests.Response()
+        response.status_code = requests.codes.OK
+        response.url = url
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = 'utf-8'
+        response._content = entry['body'].encode('utf-8')
+        return response
+
+
+class RateLimiter(object):
+    """Schedule the API requests according to the rate limit headers of
+    the responses.
+
+    While plenty of requests are left, they are sent right away. Once fewer
+    than `SPACING_THRESHOLD` are left, they are spaced out evenly until the
+    limit resets, and once none are left, they wait for the reset. The
+    requests of all the threads are scheduled together.
+    """
+
+    def __init__(self):
+        self.remaining = None
+        self.reset_time = None
+        self.next_request_time = 0
+        self.calls = 0
+        self.wait_time = 0.0
+        self._lock = threading.Lock()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.wait_time += seconds
+            time.sleep(seconds)
+
+    def back_off(self, seconds):
+        """Hold all the requests for a while
+        """
+        with self._lock:
+            self.sleep(seconds)
+
+    def wait(self):
+        """Wait until the next request may be sent
+        """
+        with self._lock:
+            now = time.time()
+            if self.remaining is not None and self.reset_time > now and \
+                    self.remaining < SPACING_THRESHOLD:
+                if self.remaining <= 0:
+                    # Wait for the reset, plus a second for clock skew,
+                    # after which the limit is unknown until the next
+                    # response
+                    self.next_request_time = self.reset_time + 1
+                    self.remaining = None
+                else:
+                    self.next_request_time = max(
+                        self.next_request_time,
+                        now + (self.reset_time - now) / self.remaining)
+                    self.remaining -= 1
+            self.sleep(self.next_request_time - now)
+            self.calls += 1
+
+    def update(self, response):
+        """Track the rate limit from the headers of a response
+        """
+        try:
+            remaining = int(response.headers['X-RateLimit-Remaining'])
+            reset_time = int(response.headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            self.remaining = remaining
+            self.reset_time = reset_time
+
+    def get_retry_delay(self, response, attempt):
+        """Return how long to wait before sending a request again, or None
+        if it shouldn't be retried.
+        """
+        if attempt + 1 >= MAX_ATTEMPTS:
+            return None
+        status_code = response.status_code
+        if status_code in (requests.codes.FORBIDDEN,
+                           requests.codes.TOO_MANY_REQUESTS):
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return int(retry_after)
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                # Waited for by the next `wait`
+                return 0
+            if status_code == requests.codes.FORBIDDEN:
+                # Not rate limited, e.g. missing permissions
+                return None
+        elif status_code < 500:
+            return None
+        return BACKOFF_DELAY * 2 ** attempt
+
+
+class GitHubClient(object):
+    """A GitHub API client keeping its connections alive in a pool.
+
+    Paginated listings are fetched by reading the first page, whose `Link`
+    header points to the last page, and then fetching all the remaining
+    pages concurrently. `api_url` can point to GitHub Enterprise, e.g.
+    https://github.example.com/api/v3, or to a local stand-in.
+
+    With a `cache_dir`, responses are cached in a `ResponseCache` and sent
+    again as conditional requests. GitHub answers them with 304 Not
+    Modified, which doesn't count against the rate limit, if nothing
+    changed.
+
+    The requests are scheduled by a `RateLimiter`, which keeps them within
+    the rate limit and retries the requests failing because of it.
+    """
+
+    def __init__(self, api_url=constants.GITHUB_API_URL, auth=None,
+                 jobs=PAGE_JOBS, cache_dir=None):
+        self.api_url = api_url.rstrip('/')
+        self.jobs = max(1, jobs)
+        self.session = requests.Session()
+        self.session.auth = auth or None
+        self.cache = ResponseCache(
+            cache_dir, user=auth[0] if auth else None) if cache_dir else None
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+        self.rate_limiter = RateLimiter()
+        self.session.headers['Accept'] = 'application/vnd.github.v3+json'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.jobs)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, params=None):
+        """Return the response to a GET of an API path or URL
+        """
+        if not url.startswith(('http://', 'https://')):
+            url = self.api_url + url
+        # The full URL is the cache key
+        url = requests.Request('GET', url, params=params).prepare().url
+        entry = self.cache.get(url) if self.cache else None
+        headers = self.cache.get_validators(entry) if entry else None
+        for attempt in range(MAX_ATTEMPTS):
+            self.rate_limiter.wait()
+            try:
+                response = self.session.get(url, headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                raise GitHubError(str(error))
+            self.rate_limiter.update(response)
+            delay = self.rate_limiter.get_retry_delay(response, attempt)
+            if delay is None:
+                break
+            utils.logger.warn(
+                'GET {0} failed with {1}. Retrying...'.format(
+                    url, response.status_code))
+            self.rate_limiter.back_off(delay)
+        if entry and response.status_code == requests.codes.NOT_MODIFIED:
+            with self._lock:
+                self.cache_hits += 1
+            return self.cache.get_response(url, entry)
+        if response.status_code == requests.codes.NOT_FOUND:
+            raise NotFoundError('{0} not found'.format(url))
+        if not response.ok:
+            raise GitHubError('GET {0} failed with {1}: {2}'.format(
+                url, response.status_code, response.text))
+        if self.cache:
+            self.cache.set(url, response)
+        return response
+
+    def get_summary(self):
+        """Return a summary of the API calls and of the time spent waiting
+        for the rate limit.
+        """
+        return ('{0} GitHub API calls ({1} served from the cache), waited '
+                '{2:.1f} seconds for the rate limit').format(
+                    self.rate_limiter.calls, self.cache_hits,
+                    self.rate_limiter.wait_time)
+
+    def get_all(self, path, params=None):
+        """Return the items of all the pages of an API listing
+        """
+        params = dict(params or {}, per_page=PER_PAGE)
+        response = self.get(path, params=params)
+        items = list(response.json())
+        page_urls = self._get_page_urls(response)
+        if page_urls is None:
+            # No last page link, so the pages can only be followed one by one
+            while 'next' in response.links:
+                response = self.get(response.links['next']['url'])
+                items.extend(response.json())
+            return items
+        pool = ThreadPool(min(self.jobs, len(page_urls)) or 1)
+        try:
+            pages = pool.map(lambda url: self.get(url).json(), page_urls)
+        finally:
+            pool.close()
+            pool.join()
+        for page in pages:
+            items.extend(page)
+        return items
+
+    @staticmethod
+    def _get_page_urls(response):
+        """Return the URLs of the pages after the first one, or None if the
+        response doesn't tell how many pages there are.
+        """
+        if 'next' not in response.links:
+            return []
+        if 'last' not in response.links:
+            return None
+        last_url = response.links['last']['url']
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(last_url)
+        query = urlparse.parse_qs(query)
+        try:
+            last_page = int(query['page'][0])
+        except (KeyError, ValueError):
+            return None
+        urls = []
+        for page in range(2, last_page + 1):
+            query['page'] = [str(page)]
+            urls.append(urlparse.urlunsplit((
+                scheme, netloc, path,
+                urllib.urlencode(sorted(query.items()), doseq=True),
+                fragment)))
+        return urls
+
+    def list_repos(self, owner, is_organization=True, include_private=False):
+        """Return the data of all the repos of an organization or a user.
+
+        Private repos are only listed with `include_private`, and only if
+        the credentials allow it. Those of a user are only listed with the
+        credentials of that user.
+        """
+        if is_organization:
+            return self.get_all(
+                '/orgs/{0}/repos'.format(owner),
+                params=dict(type='all' if include_private else 'public'))
+        if include_private:
+            # Only the authenticated user can list its private repos
+            return [repo for repo in self.get_all(
+                '/user/repos', params=dict(affiliation='owner'))
+                if repo['owner']['login'].lower() == owner.lower()]
+        return self.get_all('/users/{0}/repos'.format(owner),
+                            params=dict(type='owner'))
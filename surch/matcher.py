@@ -0,0 +1,581 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import re
+import math
+import zlib
+import random
+import string
+import hashlib
+import tempfile
+from collections import deque
+
+try:
+    # The C implementation is much faster than the pure Python automaton
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+from . import utils
+
+
+# `git grep` reads search strings as POSIX basic regular expressions with
+# the GNU extensions. In-process, they are translated to Python regular
+# expressions matching the same lines.
+BRE_SPECIAL_CHARS = frozenset('.[]*^$\\')
+PYTHON_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+# Escaped characters which are operators in GNU basic regular expressions
+# rather than the characters themselves
+BRE_OPERATOR_ESCAPES = frozenset('+?|{}()<>`\'123456789bBwWsS')
+# The Python equivalents of the POSIX character classes
+CHARACTER_CLASSES = {
+    'alpha': 'a-zA-Z',
+    'digit': '0-9',
+    'alnum': 'a-zA-Z0-9',
+    'upper': 'A-Z',
+    'lower': 'a-z',
+    'xdigit': '0-9A-Fa-f',
+    # Without newlines, as lines are matched one by one
+    'space': ' \\t\\r\\f\\v',
+    'blank': ' \\t',
+    'punct': re.escape(string.punctuation),
+    'cntrl': '\\x00-\\x1f\\x7f',
+    'print': '\\x20-\\x7e',
+    'graph': '\\x21-\\x7e',
+}
+
+# `git grep` tries every pattern on every line, so bigger lists of plain
+# strings are matched in-process
+GIT_GREP_MAX_PATTERNS = 1000
+
+# Without pyahocorasick, fewer plain strings are matched faster as part of
+# the combined regular expression than by the pure Python automaton, e.g.
+# 0.02s rather than 0.4s for 2 strings in 2MB. They break even at about 100.
+MAX_REGEX_LITERALS = 100
+
+# The matcher of the last compiled pattern set, inherited by the scan worker
+# processes forked after it was built
+_matchers = {}
+
+# Hashed matching looks up every token of the content, i.e. every run of
+# characters other than whitespace, quotes, brackets, commas and semicolons
+TOKEN_REGEX = re.compile(r'[^\s\'"`,;(){}\[\]<>]+')
+# Tokens such as `password=s3cr3t` or `user:s3cr3t` are also split once
+TOKEN_SEPARATORS = ('=', ':')
+BACK_REFERENCE_REGEX = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]')
+
+
+def _to_bytes(item):
+    return item.encode('utf-8') if isinstance(item, unicode) else item
+
+
+def escape(literal):
+    """Return the basic regular expression matching the plain string
+    """
+    return ''.join('\\' + char if char in BRE_SPECIAL_CHARS else char
+                   for char in literal)
+
+
+def _unescape(item):
+    """Return the plain string matched by a regular expression without any
+    operator, e.g. `s3cr3t`, or `s3\\.cr3t` and `s3\\-cr3t` whose special
+    characters are all escaped like `escape` or `re.escape` do, or None.
+    """
+    chars = []
+    position = 0
+    while position < len(item):
+        char = item[position]
+        if char == '\\' and position + 1 < len(item):
+            escaped = item[position + 1]
+            if escaped in BRE_OPERATOR_ESCAPES or escaped.isalnum():
+                return None
+            chars.append(escaped)
+            position += 2
+            continue
+        if char in '.[' or char == '*' and position > 0 or \
+                char == '^' and position == 0 or \
+                char == '$' and position == len(item) - 1:
+            return None
+        chars.append(char)
+        position += 1
+    return ''.join(chars)
+
+
+def get_literal(item):
+    """Return the plain string the search string matches, or None if it's
+    a regular expression.
+
+    Strings which are not valid regular expressions are matched as they
+    are.
+    """
+    literal = _unescape(item)
+    if literal is not None:
+        return literal
+    try:
+        re.compile(bre_to_python(item))
+    except re.error:
+        return item
+    return None
+
+
+def is_literal(item):
+    """Return True if the search string can be matched as a plain string
+    """
+    return get_literal(item) is not None
+
+
+def _translate_bracket(pattern, position):
+    """Return the Python equivalent of the bracket expression at the
+    position, and the position after it.
+    """
+    end = position + 1
+    if pattern[end:end + 1] == '^':
+        end += 1
+    if pattern[end:end + 1] == ']':
+        end += 1
+    while end < len(pattern) and pattern[end] != ']':
+        if pattern[end] == '[' and pattern[end + 1:end + 2] in (':', '=',
+                                                                '.'):
+            close = pattern.find(pattern[end + 1] + ']', end + 2)
+            if close != -1:
+                end = close + 2
+                continue
+        end += 1
+    if end >= len(pattern):
+        raise re.error('Unmatched [')
+    body = pattern[position + 1:end]
+    negated = body.startswith('^')
+    if negated:
+        body = body[1:]
+    items = []
+    index = 0
+    while index < len(body):
+        close = -1
+        if body[index] == '[' and body[index + 1:index + 2] in (':', '=',
+                                                                '.'):
+            close = body.find(body[index + 1] + ']', index + 2)
+        if close != -1:
+            name = body[index + 2:close]
+            if body[index + 1] != ':':
+                items.append(re.escape(name))
+            elif name in CHARACTER_CLASSES:
+                items.append(CHARACTER_CLASSES[name])
+            else:
+                raise re.error('Invalid character class {0}'.format(name))
+            index = close + 2
+            continue
+        char = body[index]
+        # Backslashes are plain characters in bracket expressions
+        items.append('\\' + char if char in '\\[]^' else char)
+        index += 1
+    # Lines are matched one by one, so no character class matches newlines
+    return ('[^{0}\\n]' if negated else '[{0}]').format(''.join(items)), \
+        end + 1
+
+
+def bre_to_python(pattern):
+    """Return the Python regular expression matching the same lines as the
+    GNU basic regular expression, as used by `git grep`. It must be compiled
+    with `re.MULTILINE`.
+    """
+    regex = []
+    position = 0
+    # `*` is a plain character at the start of an expression
+    at_start = True
+    while position < len(pattern):
+        char = pattern[position]
+        start, at_start = at_start, False
+        if char == '\\' and position + 1 < len(pattern):
+            escaped = pattern[position + 1]
+            position += 2
+            if escaped in '(|':
+                regex.append(escaped)
+                at_start = True
+            elif escaped in ')+?{}':
+                regex.append(escaped)
+            elif escaped == '<':
+                regex.append(r'\b(?=\w)')
+            elif escaped == '>':
+                regex.append(r'\b(?<=\w)')
+            elif escaped == '`':
+                regex.append(r'\A')
+            elif escaped == "'":
+                regex.append(r'\Z')
+            elif escaped == 's':
+                regex.append(r'[^\S\n]')
+            elif escaped == 'W':
+                regex.append(r'[^\w\n]')
+            elif escaped in 'bBwS123456789':
+                regex.append('\\' + escaped)
+            else:
+                regex.append(re.escape(escaped))
+            continue
+        position += 1
+        if char == '[':
+            bracket, position = _translate_bracket(pattern, position - 1)
+            regex.append(bracket)
+        elif char == '*':
+            regex.append(r'\*' if start else '*')
+        elif char == '^':
+            regex.append('^' if start else r'\^')
+            at_start = start
+        elif char == '$':
+            regex.append('$' if position == len(pattern) or pattern.startswith(
+                ('\\)', '\\|'), position) else r'\$')
+        elif char == '.':
+            regex.append('.')
+        elif char in PYTHON_SPECIAL_CHARS:
+            regex.append('\\' + char)
+        else:
+            # Including the digits and commas of intervals
+            regex.append(char)
+    return ''.join(regex)
+
+
+class AhoCorasick(object):
+    """A pure Python Aho-Corasick automaton matching any number of
+    literal strings in a single pass over the text.
+    """
+
+    def __init__(self, literals):
+        # Every state is a dict of transitions, with the failure state and
+        # whether a literal ends in it kept in parallel lists
+        self.transitions = [{}]
+        self.fail = [0]
+        self.output = [False]
+        for literal in literals:
+            self._add(literal)
+        self._build_failure_links()
+
+    def _add(self, literal):
+        state = 0
+        for char in literal:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.fail.append(0)
+                self.output.append(False)
+            state = next_state
+        self.output[state] = True
+
+    def _build_failure_links(self):
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.transitions[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = \
+                    self.transitions[fail_state].get(char, 0)
+                # A state matches if any of its suffixes is a literal
+                self.output[next_state] = \
+                    self.output[next_state] or \
+                    self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """Return True if any of the literals appears in the text
+        """
+        transitions, fail, output = self.transitions, self.fail, self.output
+        if output[0]:
+            return True
+        state = 0
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+
+class _PyAhoCorasick(object):
+    """`AhoCorasick` on top of the pyahocorasick C extension
+    """
+
+    def __init__(self, literals):
+        self.automaton = ahocorasick.Automaton()
+        for literal in literals:
+            self.automaton.add_word(literal, literal)
+        self.automaton.make_automaton()
+
+    def search(self, text):
+        for _ in self.automaton.iter(text):
+            return True
+        return False
+
+
+def is_token(item):
+    """Return True if the search string is a single token of the content,
+    so it can be matched by its hash.
+    """
+    match = TOKEN_REGEX.match(item)
+    return bool(match) and match.end() == len(item)
+
+
+def get_candidates(token):
+    """Return the strings a token of the content may be a secret as
+    """
+    candidates = set([token])
+    for separator in TOKEN_SEPARATORS:
+        if separator in token:
+            candidates.update(token.split(separator, 1))
+    return candidates
+
+
+class BloomFilter(object):
+    """A Bloom filter using seeded CRC32 hashes, which are much cheaper
+    than the salted hashes it saves computing for almost every token.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, int(round(
+            float(self.size) / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.seeds = (random.getrandbits(32), random.getrandbits(32))
+
+    def _positions(self, item):
+        first = zlib.crc32(item, self.seeds[0]) & 0xffffffff
+        second = zlib.crc32(item, self.seeds[1]) | 1
+        return [(first + i * second) % self.size
+                for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class HashedMatcher(object):
+    """Match the tokens of the content against secrets which are only kept
+    as salted hashes.
+
+    Tokens are only hashed if a secret has their length and the Bloom
+    filter of the secrets may contain them, and the hash lookup costs the
+    same regardless of the number of secrets.
+    """
+    # Truncated hashes are enough to tell a secret from other tokens
+    digest_size = 16
+
+    def __init__(self, secrets):
+        self.salt = os.urandom(16)
+        self.lengths = set()
+        self.hashes = set()
+        self.bloom_filter = BloomFilter(len(secrets))
+        for secret in secrets:
+            self.lengths.add(len(secret))
+            self.hashes.add(self._hash(secret))
+            self.bloom_filter.add(secret)
+
+    def _hash(self, token):
+        return hashlib.sha256(self.salt + token).digest()[:self.digest_size]
+
+    def search(self, content):
+        """Return True if any token of the content is one of the secrets
+        """
+        lengths, bloom_filter = self.lengths, self.bloom_filter
+        for match in TOKEN_REGEX.finditer(content):
+            for candidate in get_candidates(match.group()):
+                if len(candidate) in lengths and \
+                        candidate in bloom_filter and \
+                        self._hash(candidate) in self.hashes:
+                    return True
+        return False
+
+
+class Matcher(object):
+    """Match content against a search list in a single pass.
+
+    The literal search strings, usually most of a list of secrets, are all
+    matched at once by an Aho-Corasick automaton, so the cost of scanning
+    doesn't grow with their number. The remaining regular expressions are
+    combined into a single one, as are the literals when there are up to
+    `MAX_REGEX_LITERALS` of them and pyahocorasick isn't installed. A
+    `HashedMatcher` of more secrets can be added.
+    """
+
+    def __init__(self, search_list, hashed_matcher=None):
+        self.hashed_matcher = hashed_matcher
+        literals, regexes = set(), set()
+        for item in set(_to_bytes(item) for item in search_list):
+            literal = get_literal(item)
+            if literal is None:
+                regexes.add(item)
+            else:
+                literals.add(literal)
+        self.literals = sorted(literals)
+        self.regexes = sorted(regexes)
+        self.automaton = None
+        if ahocorasick and self.literals:
+            self.automaton = _PyAhoCorasick(self.literals)
+        elif len(self.literals) > MAX_REGEX_LITERALS:
+            self.automaton = AhoCorasick(self.literals)
+        # Back references are numbered by group, so regexes using them
+        # can't be combined
+        translated = [bre_to_python(regex) for regex in self.regexes]
+        combined = [regex for regex in translated
+                    if not BACK_REFERENCE_REGEX.search(regex)]
+        if self.literals and not self.automaton:
+            combined.extend(re.escape(literal) for literal in self.literals)
+        self.regex_list = [re.compile(regex, re.MULTILINE)
+                           for regex in translated if regex not in combined]
+        if combined:
+            self.regex_list.insert(0, re.compile('|'.join(
+                '(?:{0})'.format(regex) for regex in combined), re.MULTILINE))
+
+    def search(self, content):
+        """Return True if the content matches any of the search strings
+        """
+        if self.hashed_matcher and self.hashed_matcher.search(content):
+            return True
+        if self.automaton and self.automaton.search(content):
+            return True
+        return any(regex.search(content) for regex in self.regex_list)
+
+
+class PatternSet(object):
+    """The search list, compiled once per run.
+
+    The patterns are deduplicated and sorted, and their fingerprint
+    identifies the search list regardless of its order. They are handed to
+    `git grep` through a pattern file, which scales beyond command line
+    limits and needs no shell quoting, or matched in-process by a
+    `Matcher`. Both are created on first use.
+
+    With `hashed`, the plain strings which are single tokens once
+    unescaped, i.e. most secrets, are only kept as salted hashes by a
+    `HashedMatcher` and matched against whole tokens of the content. The
+    rest remain plain patterns.
+    Hashed sets are always matched in-process.
+    """
+
+    def __init__(self, search_list, hashed=False):
+        items = set()
+        multi_line_count = 0
+        for item in search_list:
+            # `git grep` matches line by line and reads a pattern per line,
+            # so multi-line strings, e.g. keys, are searched for line by line
+            # by both engines
+            lines = _to_bytes(item).splitlines() if item else []
+            if len(lines) > 1:
+                multi_line_count += 1
+            items.update(line for line in lines if line)
+        if multi_line_count:
+            utils.logger.warn(
+                '{0} search strings span several lines. Their lines are '
+                'searched for separately.'.format(multi_line_count))
+        items = sorted(items)
+        self.hashed = hashed
+        # Hashed sets match differently, so they get a different fingerprint
+        self.fingerprint = hashlib.sha256('\n'.join(
+            (['hashed'] if hashed else []) + items)).hexdigest()
+        self.hashed_count = 0
+        self._matcher = None
+        if hashed:
+            secrets = set()
+            for item in list(items):
+                literal = get_literal(item)
+                if literal is not None and is_token(literal):
+                    secrets.add(literal)
+                    items.remove(item)
+            self.hashed_count = len(secrets)
+            if items:
+                utils.logger.warn(
+                    '{0} search strings are regular expressions or contain '
+                    'whitespace or delimiters, and are kept in '
+                    'plaintext.'.format(len(items)))
+            self._matcher = Matcher(items, HashedMatcher(secrets))
+        self.patterns = items
+        self.literal = all(is_literal(item) for item in self.patterns)
+        self._pattern_file_path = None
+
+    def __len__(self):
+        return len(self.patterns) + self.hashed_count
+
+    def __getstate__(self):
+        # Sent to the scan worker processes without the pattern file
+        return dict(self.__dict__, _pattern_file_path=None)
+
+    @property
+    def matcher(self):
+        if self._matcher:
+            # Hashed matchers can't be compiled again
+            return self._matcher
+        search_matcher = _matchers.get(self.fingerprint)
+        if search_matcher is None:
+            _matchers.clear()
+            search_matcher = _matchers[self.fingerprint] = \
+                Matcher(self.patterns)
+        return search_matcher
+
+    @property
+    def match_in_process(self):
+        """Whether to scan commits in-process rather than with `git grep`,
+        which is slower for large lists of plain strings.
+        """
+        return self.hashed or \
+            self.literal and len(self.patterns) > GIT_GREP_MAX_PATTERNS
+
+    @property
+    def pattern_file_path(self):
+        """Path to a file holding a pattern per line, for `git grep -f`
+        """
+        if self._pattern_file_path is None:
+            handle, path = tempfile.mkstemp(prefix='surch-', suffix='.txt')
+            with os.fdopen(handle, 'wb') as pattern_file:
+                pattern_file.write(''.join(
+                    _to_git_pattern(pattern) + '\n'
+                    for pattern in self.patterns))
+            self._pattern_file_path = path
+        return self._pattern_file_path
+
+    def close(self):
+        if self._pattern_file_path:
+            os.remove(self._pattern_file_path)
+            self._pattern_file_path = None
+
+    def __del__(self):
+        # For pattern sets compiled on the fly, e.g. by `Repo._search`
+        try:
+            self.close()
+        except OSError:
+            pass
+
+
+def _to_git_pattern(pattern):
+    # Plain strings, including invalid regular expressions, are escaped so
+    # `git grep` matches them as such
+    literal = get_literal(pattern)
+    return pattern if literal is None else escape(literal)
+
+
+def compile_patterns(search_list, hashed=False):
+    """Return the `PatternSet` of the search list. Pattern sets are
+    returned as is, so they are only compiled once.
+    """
+    if isinstance(search_list, PatternSet):
+        return search_list
+    return PatternSet(search_list, hashed=hashed)
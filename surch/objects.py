@@ -0,0 +1,236 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import time
+import binascii
+import threading
+import subprocess
+from contextlib import contextmanager
+
+
+TREE_MODE = '40000'
+SUBMODULE_MODE = '160000'
+# Like git, content with a NUL byte in its first bytes is binary
+BINARY_CHECK_SIZE = 8000
+
+# git's default date format is not localized
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+class ObjectReaderError(Exception):
+    pass
+
+
+class ObjectReader(object):
+    """Read objects of a repository through long lived
+    `git cat-file --batch` and `git cat-file --batch-check` processes,
+    instead of running git for every object.
+
+    The processes are started on first use. A reader must not be used by
+    several threads at the same time, see `ObjectReaderPool`.
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._processes = {}
+
+    def _request(self, option, sha):
+        proc = self._processes.get(option)
+        if proc is None:
+            proc = subprocess.Popen(
+                ['git', '-C', self.repo_path, 'cat-file', option],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._processes[option] = proc
+        try:
+            proc.stdin.write(sha + '\n')
+            proc.stdin.flush()
+        except IOError:
+            # git already exited, e.g. if the repo doesn't exist
+            pass
+        header = proc.stdout.readline()
+        if not header:
+            raise ObjectReaderError(
+                'git cat-file {0} exited in {1}'.format(
+                    option, self.repo_path))
+        # `<sha> <type> <size>` or `<sha> missing`
+        fields = header.split()
+        if len(fields) != 3:
+            return proc, None, None
+        return proc, fields[1], int(fields[2])
+
+    def read(self, sha):
+        """Return the type and the content of the object, or
+        (None, None) if it doesn't exist.
+        """
+        proc, object_type, size = self._request('--batch', sha)
+        if object_type is None:
+            return None, None
+        return object_type, proc.stdout.read(size + 1)[:-1]
+
+    def read_header(self, sha):
+        """Return the type and the size of the object without reading it,
+        or (None, None) if it doesn't exist.
+        """
+        _, object_type, size = self._request('--batch-check', sha)
+        return object_type, size
+
+    def close(self):
+        for proc in self._processes.values():
+            proc.stdin.close()
+            proc.wait()
+        self._processes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ObjectReaderPool(object):
+    """Hand out the `ObjectReader`s of a repository to the threads reading
+    from it, so every thread gets a reader of its own while the readers and
+    their processes are reused by all the scan stages.
+    The pool grows up to the number of threads reading concurrently.
+
+    `reader_class` can be any class with the interface of `ObjectReader`,
+    e.g. `packs.PackObjectReader`.
+    """
+
+    def __init__(self, repo_path, reader_class=None):
+        self.repo_path = repo_path
+        self.reader_class = reader_class or ObjectReader
+        self._lock = threading.Lock()
+        self._readers = []
+        self._idle_readers = []
+
+    @contextmanager
+    def reader(self):
+        with self._lock:
+            if self._idle_readers:
+                reader = self._idle_readers.pop()
+            else:
+                reader = self.reader_class(self.repo_path)
+                self._readers.append(reader)
+        try:
+            yield reader
+        finally:
+            with self._lock:
+                self._idle_readers.append(reader)
+
+    def close(self):
+        with self._lock:
+            for reader in self._readers:
+                reader.close()
+
+
+def parse_tree(content):
+    """Return a list of (mode, name, sha) for every entry of a tree object
+    """
+    entries = []
+    position = 0
+    while position < len(content):
+        space = content.index(' ', position)
+        null = content.index('\0', space)
+        entries.append((content[position:space],
+                        content[space + 1:null],
+                        binascii.hexlify(content[null + 1:null + 21])))
+        position = null + 21
+    return entries
+
+
+def parse_commit(content):
+    """Return the tree, the parents and the author (name, email, time) of a
+    commit object. The time is formatted like `git log` formats it by
+    default, without the timezone.
+    """
+    headers = content.split('\n\n', 1)[0]
+    tree, parents, author = None, [], (' ', ' ', ' ')
+    for line in headers.splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'tree':
+            tree = value
+        elif key == 'parent':
+            parents.append(value)
+        elif key == 'author':
+            # `Name <email> 1468307730 +0300`
+            name, _, value = value.partition(' <')
+            email, _, value = value.partition('> ')
+            timestamp, _, timezone = value.partition(' ')
+            author = (name, email, format_git_time(timestamp, timezone))
+    return tree, parents, author
+
+
+def format_git_time(timestamp, timezone):
+    """Return the time in its timezone in git's default format,
+    i.e. `Tue Jul 12 10:15:30 2016`.
+    """
+    try:
+        offset = int(timezone[1:3]) * 3600 + int(timezone[3:5]) * 60
+        if timezone.startswith('-'):
+            offset = -offset
+        local_time = time.gmtime(int(timestamp) + offset)
+    except (ValueError, IndexError):
+        return ' '
+    return '{0} {1} {2} {3:02d}:{4:02d}:{5:02d} {6}'.format(
+        WEEKDAYS[local_time.tm_wday],
+        MONTHS[local_time.tm_mon - 1],
+        local_time.tm_mday,
+        local_time.tm_hour,
+        local_time.tm_min,
+        local_time.tm_sec,
+        local_time.tm_year)
+
+
+def is_binary(content):
+    """Return True if git would consider the content binary
+    """
+    return '\0' in content[:BINARY_CHECK_SIZE]
+
+
+def list_tree(reader, tree_sha, trees_cache, path_filter=None, prefix=''):
+    """Return a list of (blob sha, filepath) for every file in the tree.
+
+    Subtrees are shared by most of the commits of a repository, so their
+    listings are kept in `trees_cache` and every subtree is read only once.
+
+    With a `paths.PathFilter`, only the files it selects are listed and the
+    directories it excludes aren't read at all. The listing of a subtree
+    then also depends on its path, i.e. the `prefix` of its files.
+    """
+    files = []
+    object_type, content = reader.read(tree_sha)
+    if object_type != 'tree':
+        return files
+    for mode, name, sha in parse_tree(content):
+        path = prefix + name
+        if mode == TREE_MODE:
+            if path_filter and path_filter.excludes_directory(path):
+                continue
+            cache_key = (sha, path) if path_filter else sha
+            subtree_files = trees_cache.get(cache_key)
+            if subtree_files is None:
+                subtree_files = list_tree(
+                    reader, sha, trees_cache, path_filter, path + '/')
+                trees_cache[cache_key] = subtree_files
+            files.extend((blob, '{0}/{1}'.format(name, filepath))
+                         for blob, filepath in subtree_files)
+        # Submodules are commits we don't have locally
+        elif mode != SUBMODULE_MODE and \
+                (not path_filter or path_filter.match(path)):
+            files.append((sha, name))
+    return files
@@ -15,12 +15,22 @@
 
 import os
 import sys
+import json
+import time
+import hashlib
 import logging
-
-import requests
+import threading
+from multiprocessing.pool import ThreadPool
 
 from .plugins import handler
-from . import repo, utils, constants
+from . import repo, utils, constants, store, matcher, github
+
+
+# The details of the repos kept between incremental runs
+REPO_DETAILS = ('pushed_at', 'size', 'default_branch')
+# The number of slowest repos whose durations are logged in the summary.
+# The durations of all the repos are logged in verbose mode.
+SLOWEST_REPOS_COUNT = 10
 
 
 class Organization(object):
@@ -42,6 +52,27 @@ class Organization(object):
             consolidate_log=False,
             cloned_repos_dir=None,
             remove_cloned_dir=False,
+            scan_mode=constants.DEFAULT_SCAN_MODE,
+            jobs=1,
+            clone_jobs=1,
+            scan_jobs=1,
+            results_store=store.DEFAULT_RESULTS_STORE,
+            incremental=False,
+            refs=constants.DEFAULT_REFS,
+            mirror=False,
+            shared_objects=False,
+            object_backend=constants.DEFAULT_OBJECT_BACKEND,
+            match_mode=constants.DEFAULT_MATCH_MODE,
+            detectors=(),
+            max_blob_size=None,
+            skip_binary=False,
+            include_paths=(),
+            exclude_paths=(),
+            github_api_url=constants.GITHUB_API_URL,
+            include_private=False,
+            include_forks=True,
+            include_archived=True,
+            http_cache=True,
             **kwargs):
         """Surch org instance init
 
@@ -60,6 +91,41 @@ class Organization(object):
         :param cloned_repos_dir: path for cloned repo (string)
         :param remove_cloned_dir:
                         this flag for removing the clone directory (boolean)
+        :param scan_mode: 'commits' or 'blobs', see `repo.Repo` (string)
+        :param jobs: number of parallel scan workers per repo (int)
+        :param clone_jobs: number of repos fetched concurrently (int)
+        :param scan_jobs: number of repos scanned concurrently (int)
+        :param results_store: 'tinydb', 'sqlite', 'jsonl' or 'jsonl.gz'
+                        (string)
+        :param incremental: see `repo.Repo`. Also skip the repos which
+                        weren't pushed to since their last successful scan
+                        (boolean)
+        :param refs: see `repo.Repo` (list)
+        :param mirror: see `repo.Repo` (boolean)
+        :param shared_objects: back the clones of all the repos with a shared
+                        object store so objects common to several repos, e.g.
+                        forks, are fetched only once (boolean)
+        :param object_backend: see `repo.Repo` (string)
+        :param match_mode: see `repo.Repo` (string)
+        :param detectors: detectors flagging secrets which aren't in the
+                        search list, e.g. 'entropy' (list)
+        :param max_blob_size: skip the blobs bigger than this size, in bytes
+                        or with a K, M or G suffix (int or string)
+        :param skip_binary: skip binary files (boolean)
+        :param include_paths: only scan the files matching any of these globs
+                        (list)
+        :param exclude_paths: skip the files matching any of these globs
+                        (list)
+        :param github_api_url: URL of the GitHub API, e.g.
+                        https://github.example.com/api/v3 for GitHub
+                        Enterprise (string)
+        :param include_private: also scan private repos, which requires
+                        credentials allowed to list them (boolean)
+        :param include_forks: scan forked repos (boolean)
+        :param include_archived: scan archived repos (boolean)
+        :param http_cache: cache the GitHub API responses under
+                        ~/.surch/http-cache and only download them again if
+                        they changed (boolean)
         """
         utils.check_if_executable_exists_else_exit('git')
         self.logger = utils.logger
@@ -76,28 +142,72 @@ class Organization(object):
         else:
             self.git_credentials = (git_user, git_password)
 
-        self.config_file = config_file if config_file else None
+        self.config_file = utils.load_config(config_file) \
+            if config_file else None
         self.pager = handler.plugins_handle(config_file=self.config_file,
                                             plugins_list=pager)
         self.source = handler.plugins_handle(config_file=self.config_file,
                                              plugins_list=source)
-        self.search_list = search_list
         self.print_result = print_result
         self.organization = organization
         self.results_dir = results_dir
         self.repos_to_skip = repos_to_skip
         self.repos_to_check = repos_to_check
         self.remove_cloned_dir = remove_cloned_dir
-        results_dir = \
-            os.path.join(results_dir, 'results.json') if results_dir else None
-        self.results_file_path = results_dir or os.path.join(
-            constants.RESULTS_PATH, self.organization, 'results.json')
+        self.results_store = results_store
+        self.results_file_path = store.get_results_file_path(
+            results_dir or os.path.join(
+                constants.RESULTS_PATH, self.organization),
+            results_store)
         self.consolidate_log = consolidate_log
         self.is_organization = is_organization
         self.item_type = 'orgs' if is_organization else 'users'
         self.cloned_repos_dir = cloned_repos_dir or os.path.join(
             self.organization, constants.CLONED_REPOS_PATH)
         self.verbose = verbose
+        self.http_cache = http_cache
+        self.include_archived = include_archived
+        self.include_forks = include_forks
+        self.include_private = include_private
+        self.github_api_url = github_api_url
+        self.exclude_paths = exclude_paths
+        self.include_paths = include_paths
+        self.skip_binary = skip_binary
+        self.max_blob_size = max_blob_size
+        self.detectors = detectors
+        self.match_mode = match_mode
+        # Only the compiled search list is kept, so hashed search strings
+        # aren't held as plain text for the whole scan
+        self.patterns = matcher.compile_patterns(
+            search_list, hashed=match_mode == 'hashed') \
+            if search_list else None
+        self.object_backend = object_backend
+        self.shared_objects = shared_objects
+        self.mirror = mirror
+        self.refs = refs
+        self.incremental = incremental
+        self.state_file_path = os.path.join(
+            constants.STATE_PATH, '{0}.json'.format(self.organization))
+        self.scan_mode = scan_mode
+        self.jobs = jobs
+        self.clone_jobs = max(1, int(clone_jobs))
+        self.scan_jobs = max(1, int(scan_jobs))
+        self.results_lock = threading.Lock()
+        self.objects_dir = os.path.join(
+            self.cloned_repos_dir, constants.SHARED_OBJECTS_DIR) \
+            if shared_objects else None
+        self.objects_lock = threading.Lock()
+        # Shared by all the repos so commits and blobs common to several
+        # repos are scanned only once
+        self.scanned_objects = {}
+        self.failed_repo_names = set()
+        # The fetch and scan durations of every repo of the last search
+        self.fetch_times = {}
+        self.scan_times = {}
+        self.github = github.GitHubClient(
+            api_url=github_api_url,
+            auth=self.git_credentials,
+            cache_dir=constants.HTTP_CACHE_PATH if http_cache else None)
 
     @classmethod
     def init_with_config_file(cls,
@@ -108,75 +218,106 @@ class Organization(object):
                               search_list=None,
                               print_result=False,
                               is_organization=True,
-                              remove_cloned_dir=False):
+                              remove_cloned_dir=False,
+                              scan_mode=constants.DEFAULT_SCAN_MODE,
+                              jobs=1,
+                              clone_jobs=1,
+                              scan_jobs=1,
+                              results_store=store.DEFAULT_RESULTS_STORE,
+                              incremental=False,
+                              refs=constants.DEFAULT_REFS,
+                              mirror=False,
+                              shared_objects=False,
+                              object_backend=constants.DEFAULT_OBJECT_BACKEND,
+                              match_mode=constants.DEFAULT_MATCH_MODE,
+                              detectors=(),
+                              max_blob_size=None,
+                              skip_binary=False,
+                              include_paths=(),
+                              exclude_paths=(),
+                              github_api_url=constants.GITHUB_API_URL,
+                              include_private=False,
+                              include_forks=True,
+                              include_archived=True,
+                              http_cache=True):
         """Init org instance from config file
         """
         source = handler.plugins_handle(config_file=config_file,
                                         plugins_list=source)
         conf_vars = utils.read_config_file(pager=pager,
+                                           http_cache=http_cache,
+                                           include_archived=include_archived,
+                                           include_forks=include_forks,
+                                           include_private=include_private,
+                                           github_api_url=github_api_url,
+                                           exclude_paths=exclude_paths,
+                                           include_paths=include_paths,
+                                           skip_binary=skip_binary,
+                                           max_blob_size=max_blob_size,
+                                           detectors=detectors,
+                                           match_mode=match_mode,
+                                           object_backend=object_backend,
+                                           shared_objects=shared_objects,
+                                           mirror=mirror,
+                                           refs=refs,
+                                           incremental=incremental,
                                            source=source,
                                            verbose=verbose,
                                            search_list=search_list,
                                            config_file=config_file,
                                            print_result=print_result,
                                            is_organization=is_organization,
-                                           remove_cloned_dir=remove_cloned_dir)
+                                           remove_cloned_dir=remove_cloned_dir,
+                                           scan_mode=scan_mode,
+                                           jobs=jobs,
+                                           clone_jobs=clone_jobs,
+                                           scan_jobs=scan_jobs,
+                                           results_store=results_store)
         return cls(**conf_vars)
 
-    def _get_org_data(self):
-        response = requests.get(constants.GITHUB_API_URL.format(
-            self.item_type, self.organization), auth=self.git_credentials)
-        if response.status_code == requests.codes.NOT_FOUND:
-            self.logger.error(
-                'The organization or user {0} could not be found. '
-                'Please make sure you use the correct type (org/user).'.format(
-                    self.organization))
-            sys.exit(1)
-        return response.json()
-
-    def get_repos_list_per_page(self, repos_per_page, page_num):
-        """Getting repository data from git api per api page
-        """
-        try:
-            response = requests.get(
-                constants.GITHUB_REPO_DETAILS_API_URL.format(
-                    self.item_type,
-                    self.organization,
-                    'public',
-                    repos_per_page,
-                    page_num), auth=self.git_credentials)
-            return response.json()
-        except (requests.ConnectionError, requests.Timeout) as error:
-            self.logger.error(error)
-            sys.exit(1)
-
     def _parse_repo_data(self, repo_data):
-        """Return only name and clone_url from all repo list of dicts
+        """Return only name, clone_url and the details telling whether a
+        repo changed, i.e. pushed_at, size and default_branch, from all repo
+        list of dicts
         """
-        return [dict((key, data[key]) for key in ['name', 'clone_url'])
+        return [dict([(key, data[key]) for key in ['name', 'clone_url']] +
+                     [(key, data.get(key)) for key in REPO_DETAILS])
                 for data in repo_data]
 
-    def _get_all_repos_list(self, repos_per_page=100):
-        """use in 'get_repos_list_per_page' method to get all repositories
-        organization/user data
+    def _select_repos(self, repos_data):
+        """Drop the forked and archived repos unless they should be scanned
+        """
+        return [data for data in repos_data
+                if (self.include_forks or not data.get('fork')) and
+                (self.include_archived or not data.get('archived'))]
+
+    def _get_all_repos_list(self):
+        """Return the name and clone_url of all the repositories of the
+        organization/user
         """
         self.logger.info(
             'Retrieving repository information for this {0}{1}...'.format(
                 'organization:' if self.is_organization else 'user:',
                 self.organization))
-        org_data = self._get_org_data()
-        repo_count = org_data['public_repos']
-        last_page_number = repo_count / repos_per_page
-        if (repo_count % repos_per_page) > 0:
-            # Adding 2 because 1 for the extra repos that mean more page,
-            #  and 1 for the next for loop.
-            last_page_number += 2
-            repos_data = []
-            for page_num in xrange(1, last_page_number):
-                repo_data = self.get_repos_list_per_page(repos_per_page,
-                                                         page_num)
-                repos_data.extend(self._parse_repo_data(repo_data))
-            return repos_data
+        try:
+            repos_data = self.github.list_repos(
+                self.organization,
+                is_organization=self.is_organization,
+                include_private=self.include_private)
+        except github.NotFoundError:
+            self.logger.error(
+                'The organization or user {0} could not be found. '
+                'Please make sure you use the correct type (org/user).'.format(
+                    self.organization))
+            sys.exit(1)
+        except github.GitHubError as error:
+            self.logger.error(error)
+            sys.exit(1)
+        if self.github.cache_hits:
+            self.logger.info(
+                '{0} API responses were unchanged since the last run and '
+                'served from the cache.'.format(self.github.cache_hits))
+        return self._parse_repo_data(self._select_repos(repos_data))
 
     def get_repo_include_list(self,
                               all_repos,
@@ -203,14 +344,247 @@ class Organization(object):
                 repo_url_list.append(repo_data['clone_url'])
         return repo_url_list
 
+    def _init_repo(self, repo_url, search_list):
+        return repo.Repo(
+            exclude_paths=self.exclude_paths,
+            include_paths=self.include_paths,
+            skip_binary=self.skip_binary,
+            max_blob_size=self.max_blob_size,
+            detectors=self.detectors,
+            match_mode=self.match_mode,
+            object_backend=self.object_backend,
+            mirror=self.mirror,
+            refs=self.refs,
+            incremental=self.incremental,
+            print_result=False,
+            repo_url=repo_url,
+            jobs=self.jobs,
+            verbose=self.verbose,
+            scan_mode=self.scan_mode,
+            consolidate_log=True,
+            search_list=search_list,
+            remove_cloned_dir=False,
+            results_dir=self.results_dir,
+            results_lock=self.results_lock,
+            objects_dir=self.objects_dir,
+            objects_lock=self.objects_lock,
+            scanned_objects=self.scanned_objects,
+            results_store=self.results_store,
+            cloned_repo_dir=self.cloned_repos_dir)
+
+    def _fetch_repo(self, repo_instance):
+        """Clone or pull a repo. Return the repo and the error message if
+        it failed.
+        """
+        start = time.time()
+        try:
+            repo_instance.fetch()
+            return repo_instance, None
+        except (Exception, SystemExit) as error:
+            return repo_instance, 'Failed to fetch repo {0}: {1}'.format(
+                repo_instance.repo_name, error)
+        finally:
+            self.fetch_times[repo_instance.repo_name] = time.time() - start
+
+    def _scan_repo(self, repo_instance, search_list):
+        """Scan a fetched repo. Return the error message if it failed.
+        """
+        start = time.time()
+        try:
+            repo_instance.scan(search_list)
+        except (Exception, SystemExit) as error:
+            return 'Failed to scan repo {0}: {1}'.format(
+                repo_instance.repo_name, error)
+        finally:
+            self.scan_times[repo_instance.repo_name] = time.time() - start
+
+    def _search_repos(self, repos, search_list):
+        """Fetch and scan all the repos, overlapping the network bound
+        fetching of some repos with the CPU bound scanning of the others.
+
+        Up to `clone_jobs` repos are fetched and up to `scan_jobs` repos are
+        scanned at the same time. Each repo is handed to the scan pool as
+        soon as it has been fetched. A failing repo is reported and skipped
+        without aborting the run. Return the list of errors.
+        """
+        errors = []
+        clone_pool = ThreadPool(self.clone_jobs)
+        scan_pool = ThreadPool(self.scan_jobs)
+        try:
+            scans = []
+            for repo_instance, error in clone_pool.imap_unordered(
+                    self._fetch_repo, repos):
+                if error:
+                    self.logger.error(error)
+                    errors.append(error)
+                    self.failed_repo_names.add(repo_instance.repo_name)
+                    continue
+                scans.append((repo_instance, scan_pool.apply_async(
+                    self._scan_repo, (repo_instance, search_list))))
+            for repo_instance, scan in scans:
+                error = scan.get()
+                if error:
+                    self.logger.error(error)
+                    errors.append(error)
+                    self.failed_repo_names.add(repo_instance.repo_name)
+        finally:
+            for pool in (clone_pool, scan_pool):
+                pool.close()
+                pool.join()
+        return errors
+
+    def _get_fingerprint(self, repos, patterns):
+        """Return the fingerprint of the scan of the repos, i.e. of the
+        search list, the filters and the refs
+        """
+        return hashlib.sha256('\n'.join(
+            [repos[0]._get_fingerprint(patterns)] +
+            sorted(repos[0].refs))).hexdigest()
+
+    def _load_state(self):
+        """Return what the last runs recorded about the repos, i.e. the
+        details of the repos as of their last successful scan and their
+        scan stats
+        """
+        try:
+            with open(self.state_file_path) as state_file:
+                return json.load(state_file)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        state_dir = os.path.dirname(self.state_file_path)
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        temp_path = self.state_file_path + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file, indent=4, sort_keys=True)
+        os.rename(temp_path, self.state_file_path)
+
+    def _get_scanned_repos(self, state, fingerprint):
+        """Return the details of the repos as of their last successful scan
+        if it searched for the same strings.
+        """
+        if state.get('fingerprint') != fingerprint:
+            if state.get('repos'):
+                self.logger.info(
+                    'The search list changed since the last scan of {0}. '
+                    'Scanning all repositories...'.format(self.organization))
+            return {}
+        return state.get('repos', {})
+
+    @staticmethod
+    def _is_unchanged(repo_data, scanned_repos):
+        """Return True if the repo wasn't pushed to since its last
+        successful scan
+        """
+        scanned = scanned_repos.get(repo_data['name'])
+        return bool(scanned and repo_data.get('pushed_at')) and \
+            scanned.get('pushed_at') == repo_data['pushed_at'] and \
+            scanned.get('default_branch') == repo_data.get('default_branch')
+
+    def _get_changed_repos(self, repos, repos_data, scanned_repos):
+        """Return the repos which changed since their last successful scan
+        """
+        changed_repos = [
+            repo_instance for repo_instance in repos
+            if not self._is_unchanged(
+                repos_data.get(repo_instance.repo_name, {}), scanned_repos)]
+        if len(changed_repos) < len(repos):
+            self.logger.info(
+                'Skipping {0} repositories which were not pushed to since '
+                'their last scan.'.format(len(repos) - len(changed_repos)))
+        return changed_repos
+
+    def _update_scanned_repos(self, repos, repos_data, scanned_repos):
+        """Record the details of the repos scanned successfully, and forget
+        the failed ones so they are scanned again by the next run
+        """
+        for repo_instance in repos:
+            if repo_instance.repo_name in self.failed_repo_names:
+                scanned_repos.pop(repo_instance.repo_name, None)
+            elif repo_instance.repo_name in repos_data:
+                data = repos_data[repo_instance.repo_name]
+                scanned_repos[repo_instance.repo_name] = dict(
+                    (key, data.get(key)) for key in REPO_DETAILS)
+
+    def _order_by_cost(self, repos, repos_data, stats):
+        """Return the repos, the most expensive to search first, so the
+        biggest repos don't end up being searched alone at the end.
+
+        The cost of a repo is the time its last successful search took, or
+        its size according to the API, converted to a time by the average
+        time per KB of the repos searched before.
+        """
+        durations = sizes = 0.0
+        for repo_instance in repos:
+            size = repos_data.get(repo_instance.repo_name, {}).get('size')
+            if size and repo_instance.repo_name in stats:
+                durations += stats[repo_instance.repo_name]['duration']
+                sizes += size
+        time_per_kb = durations / sizes if sizes else 1.0
+
+        def get_cost(repo_instance):
+            if repo_instance.repo_name in stats:
+                return stats[repo_instance.repo_name]['duration']
+            size = repos_data.get(repo_instance.repo_name, {}).get('size')
+            return (size or 0) * time_per_kb
+
+        return sorted(repos, key=get_cost, reverse=True)
+
+    def _update_stats(self, repos, stats):
+        """Record the durations and the commit counts of the repos searched
+        successfully
+        """
+        for repo_instance in repos:
+            name = repo_instance.repo_name
+            if name not in self.failed_repo_names and \
+                    name in self.scan_times:
+                stats[name] = dict(
+                    duration=self.fetch_times.get(name, 0) +
+                    self.scan_times[name],
+                    commits=repo_instance.commits)
+
+    def _log_durations(self, repos, total_time):
+        """Log how long the repos took, the slowest first
+        """
+        durations = sorted(
+            ((self.fetch_times.get(repo_instance.repo_name, 0),
+              self.scan_times.get(repo_instance.repo_name, 0),
+              repo_instance.repo_name) for repo_instance in repos),
+            key=lambda duration: duration[0] + duration[1],
+            reverse=True)
+        if not durations:
+            return
+        self.logger.info(
+            'Searched {0} repositories in {1:.1f} seconds. The slowest '
+            'took:'.format(len(durations), total_time))
+        for index, (fetch_time, scan_time, name) in enumerate(durations):
+            log = self.logger.info if index < SLOWEST_REPOS_COUNT \
+                else self.logger.debug
+            log('  {0}: {1:.1f} seconds (fetch {2:.1f}, scan {3:.1f})'.format(
+                name, fetch_time + scan_time, fetch_time, scan_time))
+
+    def _log_skipped(self, repos):
+        """Log the count and size of the files skipped in all the repos
+        """
+        skipped_blobs = {}
+        for repo_instance in repos:
+            for reason, (count, size) in repo_instance.skipped_blobs.items():
+                total_count, total_size = skipped_blobs.get(reason, (0, 0))
+                skipped_blobs[reason] = (total_count + count,
+                                         total_size + size)
+        for reason, (count, size) in sorted(skipped_blobs.items()):
+            self.logger.info(
+                'Skipped {0} {1} files ({2}) in all repositories.'.format(
+                    count, reason, utils.format_size(size)))
+
     def search(self, search_list=None):
         """This method search the string on the organization/user
         """
-        search_list = search_list or []
-        handler.merge_all_search_list(source=self.source,
-                                      config_file=self.config_file,
-                                      search_list=search_list)
-        if len(search_list) == 0:
+        # The sources were already merged into the search list by `search`
+        search_list = search_list or self.patterns or []
+        if len(search_list) == 0 and not self.detectors:
             self.logger.error(
                 'You must supply at least one string to search for.')
             sys.exit(1)
@@ -224,17 +598,46 @@ class Organization(object):
             repos_to_include=self.repos_to_check,
             repos_to_exclude=self.repos_to_skip)
 
-        for repo_data in repos_url_list:
-            repo.search(
-                print_result=False,
-                repo_url=repo_data,
-                verbose=self.verbose,
-                consolidate_log=True,
-                search_list=search_list,
-                remove_cloned_dir=False,
-                from_organization=True,
-                results_dir=self.results_dir,
-                cloned_repo_dir=self.cloned_repos_dir)
+        # The verdicts are only valid for this search list
+        self.scanned_objects.clear()
+        # Compiled once for all the repos, unless it already was by the
+        # constructor. The repos only get the compiled set, so hashed search
+        # strings aren't kept as plain text.
+        patterns = matcher.compile_patterns(
+            search_list, hashed=self.match_mode == 'hashed')
+        repos = [self._init_repo(repo_url, patterns)
+                 for repo_url in repos_url_list]
+        repos_data = dict((data['name'], data) for data in repos_data)
+        state = self._load_state()
+        stats = state.get('stats', {})
+        incremental = self.incremental and repos
+        if incremental:
+            fingerprint = self._get_fingerprint(repos, patterns)
+            scanned_repos = self._get_scanned_repos(state, fingerprint)
+            repos = self._get_changed_repos(repos, repos_data, scanned_repos)
+        repos = self._order_by_cost(repos, repos_data, stats)
+        self.failed_repo_names.clear()
+        self.fetch_times.clear()
+        self.scan_times.clear()
+        start = time.time()
+        try:
+            failed_repos = self._search_repos(repos, patterns)
+        finally:
+            patterns.close()
+        total_time = time.time() - start
+        self._update_stats(repos, stats)
+        state['stats'] = stats
+        if incremental:
+            self._update_scanned_repos(repos, repos_data, scanned_repos)
+            state.update(fingerprint=fingerprint, repos=scanned_repos)
+        self._save_state(state)
+        self.logger.info('Scanned {0} repositories ({1} failed).'.format(
+            len(repos), len(failed_repos)))
+        self._log_durations(repos, total_time)
+        self.logger.info('Used {0}.'.format(self.github.get_summary()))
+        self._log_skipped(repos)
+        if failed_repos:
+            utils.print_errors_summary(failed_repos)
         if self.print_result:
             utils.print_result_file(self.results_file_path)
         if self.remove_cloned_dir:
@@ -260,11 +663,34 @@ def search(
         is_organization=True,
         cloned_repos_dir=None,
         remove_cloned_dir=False,
+        scan_mode=constants.DEFAULT_SCAN_MODE,
+        jobs=1,
+        clone_jobs=1,
+        scan_jobs=1,
+        results_store=store.DEFAULT_RESULTS_STORE,
+        incremental=False,
+        refs=constants.DEFAULT_REFS,
+        mirror=False,
+        shared_objects=False,
+        object_backend=constants.DEFAULT_OBJECT_BACKEND,
+        match_mode=constants.DEFAULT_MATCH_MODE,
+        detectors=(),
+        max_blob_size=None,
+        skip_binary=False,
+        include_paths=(),
+        exclude_paths=(),
+        github_api_url=constants.GITHUB_API_URL,
+        include_private=False,
+        include_forks=True,
+        include_archived=True,
+        http_cache=True,
         **kwargs):
     """Api method init organization instance and search strings
     """
 
     utils.check_if_executable_exists_else_exit('git')
+    # Read once and passed along
+    config_file = utils.load_config(config_file) if config_file else None
     pager = handler.plugins_handle(config_file=config_file, plugins_list=pager)
     source = handler.plugins_handle(config_file=config_file,
                                     plugins_list=source)
@@ -273,15 +699,35 @@ def search(
         search_list = handler.merge_all_search_list(source=source,
                                                     config_file=config_file,
                                                     search_list=search_list)
-        print search_list
         org = Organization.init_with_config_file(
             pager=pager,
+            http_cache=http_cache,
+            include_archived=include_archived,
+            include_forks=include_forks,
+            include_private=include_private,
+            github_api_url=github_api_url,
+            exclude_paths=exclude_paths,
+            include_paths=include_paths,
+            skip_binary=skip_binary,
+            max_blob_size=max_blob_size,
+            detectors=detectors,
+            match_mode=match_mode,
+            object_backend=object_backend,
+            shared_objects=shared_objects,
+            mirror=mirror,
+            refs=refs,
+            incremental=incremental,
             verbose=verbose,
             config_file=config_file,
             search_list=search_list,
             print_result=print_result,
             is_organization=is_organization,
-            remove_cloned_dir=remove_cloned_dir)
+            remove_cloned_dir=remove_cloned_dir,
+            scan_mode=scan_mode,
+            jobs=jobs,
+            clone_jobs=clone_jobs,
+            scan_jobs=scan_jobs,
+            results_store=results_store)
 
     else:
         search_list = handler.merge_all_search_list(source=source,
@@ -289,6 +735,22 @@ def search(
                                                     search_list=search_list)
         org = Organization(
             pager=pager,
+            http_cache=http_cache,
+            include_archived=include_archived,
+            include_forks=include_forks,
+            include_private=include_private,
+            github_api_url=github_api_url,
+            exclude_paths=exclude_paths,
+            include_paths=include_paths,
+            skip_binary=skip_binary,
+            max_blob_size=max_blob_size,
+            detectors=detectors,
+            match_mode=match_mode,
+            object_backend=object_backend,
+            shared_objects=shared_objects,
+            mirror=mirror,
+            refs=refs,
+            incremental=incremental,
             verbose=verbose,
             git_user=git_user,
             results_dir=results_dir,
@@ -300,6 +762,13 @@ def search(
             repos_to_check=repos_to_check,
             is_organization=is_organization,
             cloned_repos_dir=cloned_repos_dir,
-            remove_cloned_dir=remove_cloned_dir)
+            remove_cloned_dir=remove_cloned_dir,
+            scan_mode=scan_mode,
+            jobs=jobs,
+            clone_jobs=clone_jobs,
+            scan_jobs=scan_jobs,
+            results_store=results_store)
 
-    org.search(search_list=search_list)
+    # The organization already compiled the search list
+    del search_list
+    org.search()
@@ -0,0 +1,367 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import glob
+import mmap
+import zlib
+import struct
+import binascii
+from collections import OrderedDict
+
+from . import objects
+
+
+IDX_V2_MAGIC = '\377tOc'
+PACK_MAGIC = 'PACK'
+OBJECT_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+INFLATE_CHUNK_SIZE = 64 * 1024
+# Bytes of resolved delta bases kept by every reader
+BASE_CACHE_SIZE = 32 * 1024 * 1024
+
+
+class PackError(Exception):
+    pass
+
+
+def _read_size(data, position):
+    """Read a delta header size varint. Return the position after it and
+    the size.
+    """
+    size = shift = 0
+    while True:
+        byte = ord(data[position])
+        position += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return position, size
+
+
+def apply_delta(base, delta):
+    """Return the object the delta creates out of the base object
+    """
+    position, base_size = _read_size(delta, 0)
+    position, result_size = _read_size(delta, position)
+    if base_size != len(base):
+        raise PackError('Delta base size mismatch')
+    pieces = []
+    while position < len(delta):
+        opcode = ord(delta[position])
+        position += 1
+        if opcode & 0x80:
+            # Copy a range of the base
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= ord(delta[position]) << (8 * i)
+                    position += 1
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    size |= ord(delta[position]) << (8 * i)
+                    position += 1
+            pieces.append(base[offset:offset + (size or 0x10000)])
+        elif opcode:
+            # Insert the next `opcode` bytes of the delta
+            pieces.append(delta[position:position + opcode])
+            position += opcode
+        else:
+            raise PackError('Invalid delta opcode')
+    result = ''.join(pieces)
+    if len(result) != result_size:
+        raise PackError('Delta result size mismatch')
+    return result
+
+
+class PackIndex(object):
+    """A memory mapped version 2 pack index
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as index_file:
+            self.map = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:8] != IDX_V2_MAGIC + struct.pack('>I', 2):
+            self.map.close()
+            raise PackError('Unsupported pack index: {0}'.format(path))
+        self.fanout = struct.unpack('>256I', self.map[8:8 + 256 * 4])
+        self.count = self.fanout[-1]
+        self.shas_offset = 8 + 256 * 4
+        self.offsets_offset = self.shas_offset + self.count * 24
+        self.large_offsets_offset = self.offsets_offset + self.count * 4
+
+    def get_offset(self, binary_sha):
+        """Return the offset of the object in the pack, or None
+        """
+        first_byte = ord(binary_sha[0])
+        low = self.fanout[first_byte - 1] if first_byte else 0
+        high = self.fanout[first_byte]
+        while low < high:
+            middle = (low + high) // 2
+            position = self.shas_offset + middle * 20
+            sha = self.map[position:position + 20]
+            if sha < binary_sha:
+                low = middle + 1
+            elif sha > binary_sha:
+                high = middle
+            else:
+                position = self.offsets_offset + middle * 4
+                offset, = struct.unpack('>I', self.map[position:position + 4])
+                if offset & 0x80000000:
+                    position = self.large_offsets_offset + \
+                        (offset & 0x7fffffff) * 8
+                    offset, = struct.unpack(
+                        '>Q', self.map[position:position + 8])
+                return offset
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+class Pack(object):
+    """A memory mapped pack file and its index
+    """
+
+    def __init__(self, index_path):
+        self.index = PackIndex(index_path)
+        try:
+            with open(index_path[:-len('.idx')] + '.pack', 'rb') as pack:
+                self.map = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, mmap.error) as error:
+            self.index.close()
+            raise PackError(str(error))
+        if self.map[:4] != PACK_MAGIC:
+            self.close()
+            raise PackError('Invalid pack: {0}'.format(index_path))
+
+    def read_object_header(self, offset):
+        """Return the type number, the size and the data position of the
+        object at the offset.
+        """
+        byte = ord(self.map[offset])
+        position = offset + 1
+        type_number = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = ord(self.map[position])
+            position += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        return type_number, size, position
+
+    def read_ofs_delta_base(self, offset, position):
+        """Return the offset of the base of an OFS_DELTA and the position of
+        the delta data.
+        """
+        byte = ord(self.map[position])
+        position += 1
+        distance = byte & 0x7f
+        while byte & 0x80:
+            byte = ord(self.map[position])
+            position += 1
+            distance = ((distance + 1) << 7) | (byte & 0x7f)
+        return offset - distance, position
+
+    def inflate(self, position, size, limit=None):
+        """Inflate the zlib stream at the position straight out of the
+        mapping. With a limit, stop once that many bytes are inflated.
+        """
+        wanted = size if limit is None else min(size, limit)
+        if not wanted:
+            return ''
+        decompressor = zlib.decompressobj()
+        pieces = []
+        inflated = 0
+        while inflated < wanted:
+            if position >= len(self.map):
+                raise PackError('Truncated object')
+            chunk = buffer(self.map, position, INFLATE_CHUNK_SIZE)
+            position += INFLATE_CHUNK_SIZE
+            try:
+                piece = decompressor.decompress(chunk, wanted - inflated)
+            except zlib.error as error:
+                raise PackError(str(error))
+            pieces.append(piece)
+            inflated += len(piece)
+            # The rest of the output is waiting for more output space, not
+            # for more input
+            while decompressor.unconsumed_tail and inflated < wanted:
+                piece = decompressor.decompress(
+                    decompressor.unconsumed_tail, wanted - inflated)
+                pieces.append(piece)
+                inflated += len(piece)
+            if decompressor.unused_data:
+                break
+        data = ''.join(pieces)
+        if limit is None and len(data) != size:
+            raise PackError('Object size mismatch')
+        return data
+
+    def close(self):
+        self.map.close()
+        self.index.close()
+
+
+class PackObjectReader(object):
+    """Read objects straight out of the memory mapped pack files of a
+    repository, without copying them through a pipe.
+
+    Delta chains are resolved in-process, with the recently resolved bases
+    kept in a cache of at most `BASE_CACHE_SIZE` bytes. Objects this reader
+    can't handle, e.g. loose objects, objects of packs created after it, or
+    version 1 indexes, are read through an `objects.ObjectReader` instead.
+    It has the same interface as `objects.ObjectReader`.
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.fallback = objects.ObjectReader(repo_path)
+        self.fallback_count = 0
+        self.packs = None
+        self.base_cache = OrderedDict()
+        self.base_cache_size = 0
+
+    def _get_objects_dirs(self):
+        git_dir = os.path.join(self.repo_path, '.git')
+        objects_dir = os.path.join(
+            git_dir if os.path.isdir(git_dir) else self.repo_path, 'objects')
+        objects_dirs = [objects_dir]
+        try:
+            with open(os.path.join(objects_dir, 'info', 'alternates')) as f:
+                objects_dirs.extend(
+                    os.path.join(objects_dir, line.strip())
+                    for line in f if line.strip() and not line.startswith('#'))
+        except IOError:
+            pass
+        return objects_dirs
+
+    def _open_packs(self):
+        self.packs = []
+        for objects_dir in self._get_objects_dirs():
+            for index_path in sorted(glob.glob(
+                    os.path.join(objects_dir, 'pack', '*.idx'))):
+                try:
+                    self.packs.append(Pack(index_path))
+                except (PackError, IOError, OSError, mmap.error):
+                    # Left to the fallback reader
+                    pass
+
+    def _find(self, binary_sha):
+        if self.packs is None:
+            self._open_packs()
+        for pack in self.packs:
+            offset = pack.index.get_offset(binary_sha)
+            if offset is not None:
+                return pack, offset
+        return None, None
+
+    def _cache_base(self, key, object_type, content):
+        if len(content) > BASE_CACHE_SIZE // 4:
+            return
+        self.base_cache[key] = (object_type, content)
+        self.base_cache_size += len(content)
+        while self.base_cache_size > BASE_CACHE_SIZE:
+            _, (_, evicted) = self.base_cache.popitem(last=False)
+            self.base_cache_size -= len(evicted)
+
+    def _get_delta_base(self, pack, offset, type_number, position):
+        """Return the pack, offset and delta data position of the base of a
+        delta.
+        """
+        if type_number == OFS_DELTA:
+            base_offset, position = pack.read_ofs_delta_base(offset, position)
+            return pack, base_offset, position
+        # REF_DELTA bases are referenced by their binary sha
+        base_pack, base_offset = self._find(pack.map[position:position + 20])
+        if base_pack is None:
+            raise PackError('Delta base not in any pack')
+        return base_pack, base_offset, position + 20
+
+    def _read_packed(self, pack, offset):
+        key = (id(pack), offset)
+        cached = self.base_cache.get(key)
+        if cached is not None:
+            # Most recently used last
+            self.base_cache[key] = self.base_cache.pop(key)
+            return cached
+        type_number, size, position = pack.read_object_header(offset)
+        if type_number in OBJECT_TYPES:
+            return OBJECT_TYPES[type_number], pack.inflate(position, size)
+        if type_number not in (OFS_DELTA, REF_DELTA):
+            raise PackError('Unknown object type {0}'.format(type_number))
+        base_pack, base_offset, position = self._get_delta_base(
+            pack, offset, type_number, position)
+        object_type, base = self._read_packed(base_pack, base_offset)
+        self._cache_base((id(base_pack), base_offset), object_type, base)
+        return object_type, apply_delta(base, pack.inflate(position, size))
+
+    def _read_packed_header(self, pack, offset):
+        type_number, size, position = pack.read_object_header(offset)
+        if type_number in OBJECT_TYPES:
+            return OBJECT_TYPES[type_number], size
+        if type_number not in (OFS_DELTA, REF_DELTA):
+            raise PackError('Unknown object type {0}'.format(type_number))
+        base_pack, base_offset, position = self._get_delta_base(
+            pack, offset, type_number, position)
+        object_type, _ = self._read_packed_header(base_pack, base_offset)
+        # The delta starts with the base size and the result size, which
+        # are at most 10 bytes each
+        delta_header = pack.inflate(position, size, limit=20)
+        position, _ = _read_size(delta_header, 0)
+        _, result_size = _read_size(delta_header, position)
+        return object_type, result_size
+
+    def _read(self, sha, packed_reader, fallback_reader):
+        try:
+            pack, offset = self._find(binascii.unhexlify(sha))
+            if pack is not None:
+                return packed_reader(pack, offset)
+        except (PackError, IndexError, TypeError, struct.error):
+            # TypeError: not a hex sha, IndexError: a corrupt object
+            pass
+        self.fallback_count += 1
+        return fallback_reader(sha)
+
+    def read(self, sha):
+        """Return the type and the content of the object, or
+        (None, None) if it doesn't exist.
+        """
+        return self._read(sha, self._read_packed, self.fallback.read)
+
+    def read_header(self, sha):
+        """Return the type and the size of the object, or (None, None) if
+        it doesn't exist.
+        """
+        return self._read(
+            sha, self._read_packed_header, self.fallback.read_header)
+
+    def close(self):
+        for pack in self.packs or []:
+            pack.close()
+        self.packs = None
+        self.base_cache.clear()
+        self.base_cache_size = 0
+        self.fallback.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,123 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import re
+
+
+def _translate(glob):
+    """Return the regular expression of the part of a glob between its
+    leading and trailing slashes.
+    """
+    regex = []
+    position = 0
+    while position < len(glob):
+        if glob.startswith('**/', position):
+            regex.append('(?:.*/)?')
+            position += 3
+        elif glob.startswith('**', position):
+            regex.append('.*')
+            position += 2
+        elif glob[position] == '*':
+            regex.append('[^/]*')
+            position += 1
+        elif glob[position] == '?':
+            regex.append('[^/]')
+            position += 1
+        elif glob[position] == '[' and ']' in glob[position + 2:]:
+            end = glob.index(']', position + 2)
+            characters = glob[position + 1:end]
+            if characters.startswith('!'):
+                characters = '^' + characters[1:]
+            regex.append('[{0}]'.format(characters))
+            position = end + 1
+        else:
+            regex.append(re.escape(glob[position]))
+            position += 1
+    return ''.join(regex)
+
+
+class PathGlob(object):
+    """A path glob with the semantics of .gitignore patterns.
+
+    A glob without a slash, other than a trailing one, matches at any
+    depth, e.g. `*.min.js`, while other globs match from the root of the
+    repo, e.g. `docs/*.md`. A glob ending with a slash only matches
+    directories, e.g. `node_modules/`. A glob matching a directory matches
+    everything in it. `*` and `?` don't match slashes, while `**` does.
+    """
+
+    def __init__(self, glob):
+        self.glob = glob
+        self.directory = glob.endswith('/')
+        body = glob.strip('/')
+        self.anchored = glob.startswith('/') or '/' in body
+        self.body = body
+        self.regex = re.compile('{0}{1}{2}$'.format(
+            '' if self.anchored else '(?:.*/)?',
+            _translate(body),
+            '/.*' if self.directory else '(?:/.*)?'))
+
+    def match(self, path):
+        return bool(self.regex.match(path))
+
+    def get_pathspecs(self):
+        """Return the `:(glob)` git pathspecs matching the same paths,
+        without their magic.
+        """
+        pathspec = self.body if self.anchored else '**/' + self.body
+        if self.directory:
+            return [pathspec + '/**']
+        return [pathspec, pathspec + '/**']
+
+
+class PathFilter(object):
+    """Select the files to scan by their paths.
+
+    A file is scanned if any of the `include` globs matches it, or if there
+    are none, and none of the `exclude` globs matches it. See `PathGlob`.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = [PathGlob(glob) for glob in include or () if glob]
+        self.exclude = [PathGlob(glob) for glob in exclude or () if glob]
+
+    def __nonzero__(self):
+        return bool(self.include or self.exclude)
+
+    def match(self, path):
+        """Return True if the file should be scanned
+        """
+        if self.include and not any(glob.match(path)
+                                    for glob in self.include):
+            return False
+        return not any(glob.match(path) for glob in self.exclude)
+
+    def excludes_directory(self, path):
+        """Return True if nothing in the directory should be scanned, so it
+        doesn't have to be read at all.
+        """
+        return any(glob.match(path + '/') for glob in self.exclude)
+
+    def get_pathspecs(self):
+        """Return the git pathspecs selecting the same files
+        """
+        pathspecs = []
+        for glob in self.include:
+            pathspecs.extend(':(glob){0}'.format(pathspec)
+                             for pathspec in glob.get_pathspecs())
+        for glob in self.exclude:
+            pathspecs.extend(':(exclude,glob){0}'.format(pathspec)
+                             for pathspec in glob.get_pathspecs())
+        return pathspecs
@@ -27,7 +27,7 @@ def plugins_handle(plugins_list, config_file):
 
 def pagerduty_trigger(config_file=None, log=None):
     if config_file:
-        conf_var = utils.read_config_file(config_file=config_file)
+        conf_var = utils.load_config(config_file)
         try:
             conf_var = conf_var['pagerduty']
         except KeyError as e:
@@ -54,7 +54,7 @@ def pagerduty_trigger(config_file=None, log=None):
 
 def vault_trigger(config_file=None):
     if config_file:
-        conf_var = utils.read_config_file(config_file)
+        conf_var = utils.load_config(config_file)
         try:
             conf_var = conf_var['vault']
         except KeyError as e:
@@ -70,7 +70,8 @@ def vault_trigger(config_file=None):
                 vault_url=conf_var['vault_url'],
                 vault_token=conf_var['vault_token'],
                 secret_path=conf_var['secret_path'],
-                key_list=key_list)
+                key_list=key_list,
+                jobs=conf_var.get('jobs', vault.JOBS))
         except KeyError as e:
             logger.error('Vault error: can\'t run vault - "{0}" '
                          'argument is missing.'.format(e.message))
@@ -85,9 +86,11 @@ def vault_trigger(config_file=None):
 
 def merge_all_search_list(source, config_file, search_list):
     if config_file:
-        conf_vars = utils.read_config_file(config_file=config_file)
-        search_list = utils.merge_2_list(search_list, conf_vars['search_list'])
+        config_file = utils.load_config(config_file)
+        search_list = utils.merge_2_list(
+            search_list, config_file.get('search_list', ()))
     if 'vault' in source and config_file:
+        # The config file is only read once
         vault_list = vault_trigger(config_file=config_file)
         search_list = utils.merge_2_list(vault_list, search_list)
     return search_list
@@ -17,7 +17,7 @@ import time
 
 import requests
 
-from .. import utils
+from .. import utils, store
 
 
 logger = utils.logger
@@ -36,8 +36,7 @@ class Pagerduty(object):
     @staticmethod
     def count_dicts_in_results_file(file_path):
         try:
-            with open(file_path, 'r') as results_file:
-                return len(json.load(results_file)['_default'])
+            return store.open_store(file_path).count()
         except:
             return 0
 
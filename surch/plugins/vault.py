@@ -14,62 +14,146 @@
 #    * limitations under the License.
 import re
 import os
-from collections import deque
+from multiprocessing.pool import ThreadPool
 
 import hvac
+import requests
+from requests.adapters import HTTPAdapter
+
+from .. import utils, matcher
 
 KEY_LIST = ('.*password.*', '.*secret.*', '.*id.*', '*endpoint*',
             '*tenant*', '*api*')
+# The number of secrets listed or read concurrently, which is also the
+# number of pooled connections
+JOBS = 8
+
+
+def compile_key_list(key_list):
+    """Return a single regular expression matching the lowercase keys
+    matching any of the key regexes. Invalid regexes are skipped.
+    """
+    regexes = []
+    for regex in key_list:
+        try:
+            re.compile(regex.lower())
+        except re.error:
+            utils.logger.warn(
+                'Vault: skipping invalid key regex {0}'.format(regex))
+            continue
+        regexes.append('(?:{0})'.format(regex.lower()))
+    return re.compile('|'.join(regexes)) if regexes else None
+
+
+class PooledClient(hvac.Client):
+    """An `hvac.Client` sending its requests over a pool of kept alive
+    connections, which can be shared by several threads.
+    """
+
+    def __init__(self, url, token, jobs=JOBS):
+        super(PooledClient, self).__init__(url=url, token=token)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, jobs))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _get(self, url, **kwargs):
+        headers = {'X-Vault-Token': self.token} if self.token else {}
+        response = self.session.get(self._url + url, headers=headers,
+                                    **dict(self._kwargs, **kwargs))
+        if response.status_code == requests.codes.NOT_FOUND:
+            raise hvac.exceptions.InvalidPath()
+        if not response.ok:
+            try:
+                errors = response.json().get('errors')
+            except ValueError:
+                errors = None
+            raise hvac.exceptions.VaultError(
+                message='GET {0} failed with {1}'.format(
+                    url, response.status_code),
+                errors=errors)
+        return response
 
 
 class Vault(object):
-    def __init__(self, vault_url, vault_token, secret_path, key_list=KEY_LIST):
+    def __init__(self, vault_url, vault_token, secret_path, key_list=KEY_LIST,
+                 jobs=JOBS):
         self.secret_path = secret_path
         self.key_list = key_list
-        self.client = hvac.Client(url=vault_url, token=vault_token)
+        # Compiled once rather than for every key of every secret
+        self.key_regex = compile_key_list(key_list)
+        self.jobs = max(1, jobs)
+        self.client = PooledClient(url=vault_url, token=vault_token,
+                                   jobs=self.jobs)
 
     def keys_list(self, extra_path=''):
         all_data = self.client.list(os.path.join(self.secret_path, extra_path))
+        if not all_data:
+            return []
         data = all_data['data']
-        return data['keys']
+        return [key.encode('ascii') for key in data['keys']]
 
-    def get_search_list(self):
-        search_list = []
-        secret_names = deque()
-        secret_names.extend(self.keys_list())
-
-        while len(secret_names) != 0:
-            secret = secret_names.popleft().encode('ascii')
-            if secret.endswith('/'):
-                keys = self.keys_list(extra_path=secret)
-                secret_names.extend(
-                    [os.path.join(secret, key) for key in keys])
+    def read_secret(self, secret):
+        """Return the data of a secret
+        """
+        secret_from_vault = self.client.read(
+            '{0}/{1}'.format(self.secret_path, secret))
+        return (secret_from_vault or {}).get('data') or {}
+
+    def get_values(self, secret_data):
+        """Return the search strings of the values of a secret whose keys
+        match the key list, other than SSH keys and passwords
+        """
+        values = []
+        if not self.key_regex:
+            return values
+        for key, value in secret_data.items():
+            if not value or not self.key_regex.match(key.lower()):
+                continue
+            if not isinstance(value, basestring):
+                values.append(value)
                 continue
-            secret_from_vault = self.client.read(
-                '{0}/{1}'.format(self.secret_path, secret))
-            secret_from_vault = secret_from_vault['data']
-            for key, value in secret_from_vault.items():
-                for regex in self.key_list:
-                    try:
-                        p = re.compile(regex.lower())
-                    except:
-                        pass
-                    if value:
-                        if p.match(key.lower()):
-                            if 'ssh-rsa' not in value.lower():
-                                try:
-                                    value = "{0}".format(value.encode('ascii'))
-                                    if 'password' not in value.lower():
-                                        search_list.append(re.escape(value))
-                                    else:
-                                        pass
-                                except AttributeError:
-                                    search_list.append(value)
+            if 'ssh-rsa' in value.lower() or 'password' in value.lower():
+                continue
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            # Escaped as a basic regular expression, so it's still matched
+            # as a plain string
+            values.append(matcher.escape(value))
+        return values
+
+    def get_search_list(self):
+        """Walk the secret tree level by level, listing the directories of
+        a level concurrently and reading the secrets concurrently with the
+        listing of the next levels.
+        """
+        pool = ThreadPool(self.jobs)
+        try:
+            reads = []
+            directories = ['']
+            while directories:
+                secret_names = [
+                    os.path.join(directory, key)
+                    for directory, keys in zip(
+                        directories, pool.map(self.keys_list, directories))
+                    for key in keys]
+                directories = [secret for secret in secret_names
+                               if secret.endswith('/')]
+                reads.extend(pool.apply_async(self.read_secret, (secret,))
+                             for secret in secret_names
+                             if not secret.endswith('/'))
+            search_list = []
+            for read in reads:
+                search_list.extend(self.get_values(read.get()))
+        finally:
+            pool.close()
+            pool.join()
         return search_list
 
 
-def get_search_list(vault_url, vault_token, secret_path, key_list=None):
+def get_search_list(vault_url, vault_token, secret_path, key_list=None,
+                    jobs=JOBS):
     key_list = KEY_LIST if not key_list else key_list
     vault = Vault(vault_url=vault_url, vault_token=vault_token,
-                  secret_path=secret_path, key_list=key_list)
+                  secret_path=secret_path, key_list=key_list, jobs=jobs)
     return vault.get_search_list()
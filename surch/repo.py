@@ -15,15 +15,81 @@
 
 import os
 import sys
+import json
 import logging
+import hashlib
+import functools
+import itertools
+import threading
 import subprocess
 from time import time
+from collections import OrderedDict
 
 import retrying
-from tinydb import TinyDB
 
 from .plugins import handler
-from . import utils, constants
+from . import utils, constants, store, matcher, objects, packs, detectors
+from . import paths
+
+
+# `git for-each-ref` patterns of the refs selections
+REF_PATTERNS = {
+    'branches': ['refs/remotes/'],
+    'tags': ['refs/tags/'],
+    'all': ['refs/remotes/', 'refs/tags/'],
+}
+# Branches of bare mirrors are local branches
+MIRROR_REFSPECS = ('+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+MIRROR_REF_PATTERNS = {
+    'branches': ['refs/heads/'],
+    'tags': ['refs/tags/'],
+    'all': ['refs/heads/', 'refs/tags/'],
+}
+
+# Splitting the blobs into more chunks than jobs keeps all the workers busy
+# when some chunks take longer than others
+BLOB_CHUNKS_PER_JOB = 4
+
+OBJECT_READERS = {
+    'git': objects.ObjectReader,
+    'packs': packs.PackObjectReader,
+}
+
+
+def grep_blobs(repo_path, patterns, shas, object_backend='git',
+               detector_names=(), skip_binary=False):
+    """Stream the content of the blobs through a single
+    `git cat-file --batch` process.
+
+    Return a list of (sha, detector names) for the blobs matching the search
+    list, whose detector is `detectors.SEARCH_LIST_DETECTOR`, or flagged by
+    any of the detectors, and the list of the sizes of the binary blobs
+    skipped with `skip_binary`.
+    """
+    search_matcher = patterns.matcher
+    blob_detectors = [detectors.DETECTORS[name]() for name in detector_names]
+    matching_blobs = []
+    binary_blob_sizes = []
+    with OBJECT_READERS[object_backend](repo_path) as reader:
+        for sha in shas:
+            _, content = reader.read(sha)
+            if content is None:
+                continue
+            if skip_binary and objects.is_binary(content):
+                binary_blob_sizes.append(len(content))
+                continue
+            found = []
+            if search_matcher.search(content):
+                found.append(detectors.SEARCH_LIST_DETECTOR)
+            found.extend(detector.name for detector in blob_detectors
+                         if detector.search(content))
+            if found:
+                matching_blobs.append((sha, tuple(found)))
+    return matching_blobs, binary_blob_sizes
+
+
+class RepoError(Exception):
+    pass
 
 
 class Repo(object):
@@ -38,11 +104,31 @@ class Repo(object):
                  cloned_repo_dir=None,
                  consolidate_log=False,
                  remove_cloned_dir=False,
+                 scan_mode=constants.DEFAULT_SCAN_MODE,
+                 jobs=1,
+                 results_lock=None,
+                 results_store=store.DEFAULT_RESULTS_STORE,
+                 incremental=False,
+                 state_dir=None,
+                 refs=constants.DEFAULT_REFS,
+                 mirror=False,
+                 objects_dir=None,
+                 objects_lock=None,
+                 scanned_objects=None,
+                 object_backend=constants.DEFAULT_OBJECT_BACKEND,
+                 match_mode=constants.DEFAULT_MATCH_MODE,
+                 detectors=(),
+                 max_blob_size=None,
+                 skip_binary=False,
+                 include_paths=(),
+                 exclude_paths=(),
                  **kwargs):
         """Surch repo instance init
 
         :param repo_url: get http / ssh repository for cloning (string)
-        :param search_list: list of string we want to search (list)
+        :param search_list: list of string we want to search, or their
+                            `matcher.PatternSet`. Only the compiled set
+                            is kept. (list)
         :param verbose: log level (boolean)
         :param results_dir: path to result file (string)
         :param print_result: this flag print result file in the end (boolean)
@@ -51,6 +137,55 @@ class Repo(object):
                         this flag decide if save the old result file (boolean)
         :param remove_cloned_dir:
                         this flag for removing the clone directory (boolean)
+        :param scan_mode: 'commits' to git grep every commit or 'blobs' to
+                        scan every unique blob only once (string)
+        :param jobs: number of parallel scan workers (int)
+        :param results_lock: lock shared by all the repos writing to the
+                        same results file concurrently (threading.Lock)
+        :param results_store: 'tinydb', 'sqlite', 'jsonl' or 'jsonl.gz'
+                        (string)
+        :param incremental: only scan the commits added since the last scan
+                        with the same search list (boolean)
+        :param state_dir: path to the directory keeping the commits already
+                        scanned by incremental scans (string)
+        :param refs: refs to scan, any of 'branches', 'tags', 'all' or a git
+                        ref glob such as 'refs/remotes/origin/release-*'
+                        (list)
+        :param mirror: keep a bare mirror of the repo, refreshed with `git
+                        fetch --prune`, instead of a checked out clone
+                        (boolean)
+        :param objects_dir: path to a bare repo whose objects are shared by
+                        the clones of several repos through git alternates
+                        (string)
+        :param objects_lock: lock shared by all the repos using the same
+                        objects_dir (threading.Lock)
+        :param scanned_objects: verdicts of the commits and blobs already
+                        scanned, shared by the repos scanned for the same
+                        search list (dict)
+        :param object_backend: 'git' to read objects through `git cat-file`
+                        processes or 'packs' to read the pack files
+                        in-process, falling back to git for the objects it
+                        can't read (string)
+        :param match_mode: 'patterns' to match the search strings as they are
+                        or 'hashed' to keep the search strings which are
+                        single tokens only as salted hashes and match them
+                        against whole tokens of the content (string)
+        :param detectors: detectors flagging secrets which aren't in the
+                        search list, e.g. 'entropy' for high entropy base64
+                        and hex strings. Repos are scanned blob by blob when
+                        any detector is used (list)
+        :param max_blob_size: skip the blobs bigger than this size, in bytes
+                        or with a K, M or G suffix, without reading them (int
+                        or string)
+        :param skip_binary: skip binary files, i.e. files with a known binary
+                        extension or containing a NUL byte in their first 8000
+                        bytes (boolean)
+        :param include_paths: only scan the files matching any of these globs,
+                        e.g. 'src/' or '*.py', with .gitignore semantics
+                        (list)
+        :param exclude_paths: skip the files matching any of these globs, e.g.
+                        'node_modules/' or '*.min.js', with .gitignore
+                        semantics (list)
         """
 
         utils.check_if_executable_exists_else_exit('git')
@@ -58,39 +193,131 @@ class Repo(object):
         self.logger = utils.logger
         self.logger.setLevel(logging.DEBUG if verbose else logging.INFO)
 
-        self.config_file = config_file if config_file else None
+        self.config_file = utils.load_config(config_file) \
+            if config_file else None
         self.print_result = print_result
-        self.search_list = search_list
         self.remove_cloned_dir = remove_cloned_dir
         self.repo_url = repo_url
         self.organization = repo_url.rsplit('.com/', 1)[-1].rsplit('/', 1)[0]
         self.repo_name = repo_url.rsplit('/', 1)[-1].rsplit('.', 1)[0]
         self.cloned_repo_dir = cloned_repo_dir or os.path.join(
             self.organization, constants.CLONED_REPOS_PATH)
-        self.repo_path = os.path.join(self.cloned_repo_dir, self.repo_name)
+        self.mirror = mirror
+        self.repo_path = os.path.join(
+            self.cloned_repo_dir,
+            '{0}.git'.format(self.repo_name) if mirror else self.repo_name)
+        # Alternates are resolved relative to the objects directory
+        self.objects_dir = os.path.abspath(objects_dir) if objects_dir \
+            else None
+        self.objects_lock = objects_lock or threading.Lock()
+        self.scanned_objects = {} if scanned_objects is None \
+            else scanned_objects
         self.quiet_git = '--quiet' if not verbose else ''
         self.verbose = verbose
+        if scan_mode not in constants.SCAN_MODES:
+            self.logger.error('Unknown scan mode: {0}. Use one of: {1}'.format(
+                scan_mode, ', '.join(constants.SCAN_MODES)))
+            sys.exit(1)
+        self.scan_mode = scan_mode
+        if object_backend not in constants.OBJECT_BACKENDS:
+            self.logger.error(
+                'Unknown object backend: {0}. Use one of: {1}'.format(
+                    object_backend, ', '.join(constants.OBJECT_BACKENDS)))
+            sys.exit(1)
+        self.object_backend = object_backend
+        if match_mode not in constants.MATCH_MODES:
+            self.logger.error(
+                'Unknown match mode: {0}. Use one of: {1}'.format(
+                    match_mode, ', '.join(constants.MATCH_MODES)))
+            sys.exit(1)
+        self.match_mode = match_mode
+        # Only the compiled search list is kept, so hashed search strings
+        # aren't held as plain text for the whole scan
+        self.patterns = matcher.compile_patterns(
+            search_list, hashed=match_mode == 'hashed') \
+            if search_list else None
+        unknown_detectors = set(detectors or ()) - set(constants.DETECTORS)
+        if unknown_detectors:
+            self.logger.error('Unknown detectors: {0}. Use any of: {1}'.format(
+                ', '.join(sorted(unknown_detectors)),
+                ', '.join(constants.DETECTORS)))
+            sys.exit(1)
+        self.detectors = list(detectors or ())
+        self.max_blob_size = utils.parse_size(max_blob_size)
+        self.skip_binary = skip_binary
+        # The count and total size of the blobs skipped for every reason
+        self.skipped_blobs = {}
+        self.path_filter = paths.PathFilter(include_paths, exclude_paths)
+        self.jobs = max(1, int(jobs))
+        self.scan_speedup = 1.0
         self.pager = handler.plugins_handle(config_file=self.config_file,
                                             plugins_list=pager)
-        results_dir = \
-            os.path.join(results_dir, 'results.json') if results_dir else None
-        self.results_file_path = results_dir or os.path.join(
-                constants.RESULTS_PATH, self.organization, 'results.json')
+        if results_store not in store.RESULTS_STORES:
+            self.logger.error(
+                'Unknown results store: {0}. Use one of: {1}'.format(
+                    results_store, ', '.join(store.RESULTS_STORES)))
+            sys.exit(1)
+        self.results_file_path = store.get_results_file_path(
+            results_dir or os.path.join(
+                constants.RESULTS_PATH, self.organization),
+            results_store)
         utils.handle_results_file(self.results_file_path, consolidate_log)
+        self.results_lock = results_lock or threading.Lock()
+        self.results_store = store.open_store(self.results_file_path,
+                                              results_store,
+                                              lock=self.results_lock)
+
+        self.incremental = incremental
+        self.refs = [refs] if isinstance(refs, basestring) else \
+            list(refs or constants.DEFAULT_REFS)
+        self.state_file_path = os.path.join(
+            state_dir or os.path.join(constants.STATE_PATH, self.organization),
+            '{0}.json'.format(self.repo_name))
 
         self.error_summary = []
         self.result_count = 0
+        self.commits_details = {}
+        # Shared by all the scan stages
+        self.object_readers = objects.ObjectReaderPool(
+            self.repo_path, OBJECT_READERS[self.object_backend])
+        self.trees_cache = {}
 
     @classmethod
     def init_with_config_file(cls,
                               config_file,
                               pager=None,
                               verbose=False,
-                              print_result=False):
+                              print_result=False,
+                              scan_mode=constants.DEFAULT_SCAN_MODE,
+                              jobs=1,
+                              results_store=store.DEFAULT_RESULTS_STORE,
+                              incremental=False,
+                              refs=constants.DEFAULT_REFS,
+                              mirror=False,
+                              object_backend=constants.DEFAULT_OBJECT_BACKEND,
+                              match_mode=constants.DEFAULT_MATCH_MODE,
+                              detectors=(),
+                              max_blob_size=None,
+                              skip_binary=False,
+                              include_paths=(),
+                              exclude_paths=()):
         """Init repo instance from config file
         """
         conf_vars = utils.read_config_file(pager=pager,
+                                           exclude_paths=exclude_paths,
+                                           include_paths=include_paths,
+                                           skip_binary=skip_binary,
+                                           max_blob_size=max_blob_size,
+                                           detectors=detectors,
+                                           match_mode=match_mode,
+                                           object_backend=object_backend,
+                                           mirror=mirror,
+                                           refs=refs,
+                                           incremental=incremental,
+                                           jobs=jobs,
+                                           results_store=results_store,
                                            verbose=verbose,
+                                           scan_mode=scan_mode,
                                            config_file=config_file,
                                            print_result=print_result)
         return cls(**conf_vars)
@@ -101,122 +328,459 @@ class Repo(object):
         Otherwise, pull it.
         """
 
-        def run(command):
+        def run(*args):
+            command = ' '.join(arg for arg in args if arg)
             try:
                 proc = subprocess.Popen(
-                    command, stdout=subprocess.PIPE, shell=True)
+                    [arg for arg in args if arg], stdout=subprocess.PIPE)
                 proc.stdout, proc.stderr = proc.communicate()
                 if self.verbose:
                     self.logger.debug(proc.stdout)
+                if proc.returncode:
+                    raise subprocess.CalledProcessError(
+                        proc.returncode, command)
             except subprocess.CalledProcessError as git_error:
-                err = 'Failed execute {0} on repo {1} ({1})'.format(
+                err = 'Failed execute {0} on repo {1} ({2})'.format(
                     command, self.repo_name, git_error)
                 self.logger.error(err)
                 self.error_summary.append(err)
+                return False
+            return True
 
         if not os.path.isdir(self.cloned_repo_dir):
             os.makedirs(self.cloned_repo_dir)
-        if os.path.isdir(self.repo_path):
+        if os.path.isdir(self.repo_path) and self.mirror:
+            self.logger.debug('Local mirror already exists at: {0}'.format(
+                self.repo_path))
+            self.logger.info('Fetching repo: {0}...'.format(self.repo_name))
+            # Mirrors fetch the branches and tags as they are, so unlike
+            # pulling, diverged branches can't fail the fetch. Mirrors
+            # cloned with `--mirror` get the refspecs too.
+            run('git', '-C', self.repo_path, 'config', '--replace-all',
+                'remote.origin.fetch', MIRROR_REFSPECS[0])
+            for refspec in MIRROR_REFSPECS[1:]:
+                run('git', '-C', self.repo_path, 'config', '--add',
+                    'remote.origin.fetch', refspec)
+            run('git', '-C', self.repo_path, 'fetch', '--prune',
+                self.quiet_git)
+        elif os.path.isdir(self.repo_path):
             self.logger.debug('Local repo already exists at: {0}'.format(
                 self.repo_path))
             self.logger.info('Pulling repo: {0}...'.format(self.repo_name))
-            run('git -C {0} pull {1}'.format(self.repo_path, self.quiet_git))
+            run('git', '-C', self.repo_path, 'pull', self.quiet_git)
         else:
             self.logger.info('Cloning repo {0} from org {1} to {2}...'.format(
                 self.repo_name, self.organization, self.repo_path))
-            run('git clone {0} {1} {2}'.format(
-                self.quiet_git, self.repo_url, self.repo_path))
+            if self.objects_dir:
+                self._init_objects_dir()
+            # Bare clones only fetch the branches and tags, unlike
+            # `--mirror` which also fetches e.g. GitHub's `refs/pull/*`
+            if not run('git', 'clone',
+                       '--bare' if self.mirror else '',
+                       '--reference' if self.objects_dir else '',
+                       self.objects_dir,
+                       self.quiet_git, self.repo_url, self.repo_path):
+                # Raising lets `retrying` try again. A failed pull on the
+                # other hand still leaves us with a repo we can scan.
+                raise RepoError(
+                    'Failed to clone repo {0}'.format(self.repo_name))
+        if self.objects_dir:
+            self._share_objects()
 
-    def _create_search_string(self, search_list):
-        """Create part of the grep command from search list.
-        """
+    def _init_objects_dir(self):
+        with self.objects_lock:
+            if not os.path.isdir(self.objects_dir):
+                self.logger.debug('Creating shared object store at: '
+                                  '{0}...'.format(self.objects_dir))
+                subprocess.check_call(
+                    ['git', 'init', '--quiet', '--bare', self.objects_dir])
 
-        self.logger.debug('Generating git grep-able search string...')
-        unglobbed_search_list = ["'{0}'".format(item) for item in search_list]
-        search_string = ' --or -e '.join(unglobbed_search_list)
-        return search_string
+    def _share_objects(self):
+        """Move the objects of the repo to the shared object store.
+
+        The objects are fetched into the store under refs/surch/<repo>/, so
+        the next clones borrowing from it only download the objects it
+        doesn't have yet, and then dropped from the repo which already
+        borrows them from the store.
+        The store is never pruned, since the repos borrowing from it don't
+        keep its objects alive.
+        """
+        self.logger.debug('Sharing the objects of {0}...'.format(
+            self.repo_name))
+        try:
+            with self.objects_lock:
+                subprocess.check_call(
+                    ['git', '-C', self.objects_dir, 'fetch', '--quiet',
+                     '--no-tags', os.path.abspath(self.repo_path),
+                     '+refs/*:refs/surch/{0}/*'.format(self.repo_name)])
+            subprocess.check_call(
+                ['git', '-C', self.repo_path, 'repack', '-a', '-d', '-l',
+                 '-q'])
+        except subprocess.CalledProcessError as git_error:
+            # The repo can still be scanned, it just keeps its own objects
+            self.logger.warn('Failed to share the objects of {0} ({1})'.format(
+                self.repo_name, git_error))
 
     def _search(self, search_list, commits):
-        """Create list of all commits which contains one of the strings
-        we're searching for.
+        """Return an iterator over the list of matching files of every
+        commit, as soon as each commit has been scanned.
         """
-        search_string = self._create_search_string(list(search_list))
-        matching_commits = []
+        patterns = matcher.compile_patterns(
+            search_list, hashed=self.match_mode == 'hashed')
         self.logger.info('Scanning repo {0} for {1} string(s)...'.format(
-            self.repo_name, len(search_list)))
-        for commit in commits:
-            matching_commits.append(self._search_commit(commit, search_string))
-        return matching_commits
+            self.repo_name, len(patterns)))
+        if self.scan_mode == 'blobs':
+            return iter(self._search_blobs(patterns, commits))
+        if self.detectors:
+            # The search list matches the same files in-process, so
+            # detectors only add to the results of `git grep`
+            self.logger.info('Scanning blobs for the {0} detector(s)...'
+                             .format(', '.join(self.detectors)))
+            return iter(self._search_blobs(patterns, commits))
+        if patterns.match_in_process:
+            # Hashes can't be matched by `git grep`, which also gets slow
+            # with many patterns
+            self.logger.info('Matching the {0} strings in-process...'
+                             .format(len(patterns)))
+            return iter(self._search_blobs(patterns, commits))
+        if self.max_blob_size or self.skip_binary:
+            # The skipped blobs are found once for the whole history rather
+            # than excluded from every `git grep`, and counted like in
+            # blobs mode
+            self.logger.info('Scanning blobs to skip the oversized or '
+                             'binary files...')
+            return iter(self._search_blobs(patterns, commits))
+        return self._search_commits(commits, patterns)
+
+    def _search_commits(self, commits, patterns):
+        self._log_already_scanned(commits, 'commits')
+
+        def search_commit(commit):
+            # A commit sha identifies its whole tree, so a commit shared with
+            # an already scanned repo, e.g. a fork, matches the same files
+            matched_files = self.scanned_objects.get(commit)
+            if matched_files is None:
+                matched_files = self._search_commit(commit, patterns)
+                self.scanned_objects[commit] = matched_files
+            return matched_files
 
-    def _get_all_commits(self):
-        """Get the sha (id) of the commit
+        matching_commits = utils.ParallelMap(
+            search_commit,
+            commits,
+            jobs=self.jobs)
+        for matched_files in matching_commits:
+            yield matched_files
+        self._log_speedup(len(commits), 'commits', matching_commits.speedup)
+
+    def _filter_blobs(self, shas, blobs):
+        """Return a mapping of the blobs to skip to the reason they are
+        skipped, 'oversized' or 'binary', and count them.
+
+        Only `git cat-file --batch-check` metadata and the paths of the
+        blobs are used, so none of them is read. Blobs which turn out to be
+        binary once read are skipped by the scan itself.
+        """
+        skipped = {}
+        if not self.max_blob_size and not self.skip_binary:
+            return skipped
+        with self.object_readers.reader() as reader:
+            for sha in shas:
+                if self.skip_binary and blobs[sha]:
+                    reason = 'binary'
+                elif self.max_blob_size:
+                    reason = 'oversized'
+                else:
+                    continue
+                _, size = reader.read_header(sha)
+                if reason == 'oversized' and size <= self.max_blob_size:
+                    continue
+                skipped[sha] = reason
+                self._count_skipped(reason, size or 0)
+        return skipped
+
+    @staticmethod
+    def _has_binary_extension(filepath):
+        _, dot, extension = filepath.rpartition('.')
+        return bool(dot) and extension.lower() in constants.BINARY_EXTENSIONS
+
+    def _count_skipped(self, reason, size, count=1):
+        skipped_count, skipped_size = self.skipped_blobs.get(reason, (0, 0))
+        self.skipped_blobs[reason] = (skipped_count + count,
+                                      skipped_size + size)
+
+    def _log_skipped(self):
+        for reason, (count, size) in sorted(self.skipped_blobs.items()):
+            self.logger.info('Skipped {0} {1} files ({2}).'.format(
+                count, reason, utils.format_size(size)))
+
+    def _log_already_scanned(self, objects, item_type):
+        scanned = sum(1 for sha in objects if sha in self.scanned_objects)
+        if scanned:
+            self.logger.info('Skipping {0} of {1} {2} already scanned in '
+                             'this run...'.format(
+                                 scanned, len(objects), item_type))
+
+    def _log_speedup(self, count, item_type, speedup):
+        self.scan_speedup = speedup
+        if self.jobs > 1:
+            self.logger.info(
+                'Scanned {0} {1} using {2} jobs ({3:.2f}x speedup)'.format(
+                    count, item_type, self.jobs, speedup))
+
+    def _get_ref_patterns(self):
+        """Translate the refs selection to `git for-each-ref` patterns
+        """
+        ref_patterns = MIRROR_REF_PATTERNS if self.mirror else REF_PATTERNS
+        patterns = []
+        for ref in self.refs:
+            patterns.extend(ref_patterns.get(ref, [ref]))
+        return patterns
+
+    def _get_ref_tips(self):
+        """Return the sorted and deduplicated shas of the commits the
+        selected refs point to.
         """
-        self.logger.debug('Retrieving list of commits...')
         try:
-            commit_list = []
-            branches = subprocess.check_output(
-                "git -C {0} branch -a".format(self.repo_path), shell=True)
-            branches = branches.splitlines()
-            for branch in branches:
-                if "/" in str(branch):
-                    name = str(branch).rsplit('/', 1)[-1]
-                    commits_per_branch = subprocess.check_output(
-                        "git -C {0} rev-list origin/{1}".format(
-                            self.repo_path, name), shell=True)
-                    commits_per_branch = commits_per_branch.splitlines()
-                    for commit_per_branch in commits_per_branch:
-                        commit_list.append(commit_per_branch)
-                    lgr.info('Found {0} commits in {1}...'.format(
-                        len(commit_list), self.repo_name))
-                    self.commits = len(commit_list)
-                    return commit_list
+            refs = subprocess.check_output(
+                ['git', '-C', self.repo_path, 'for-each-ref',
+                 '--format=%(objectname) %(objecttype) %(*objecttype)'] +
+                self._get_ref_patterns())
         except subprocess.CalledProcessError:
             return []
+        tips = set()
+        for ref in refs.splitlines():
+            sha, object_type, peeled_object_type = (ref.split() + [''])[:3]
+            # Skip tags of trees and blobs
+            if 'commit' in (object_type, peeled_object_type):
+                tips.add(sha)
+        return sorted(tips)
+
+    def _get_all_commits(self, tips=None, scanned_tips=()):
+        """Return every commit reachable from the tips of the selected refs
+        (and not from the already scanned tips) using a single
+        `git rev-list` walk, so commits shared by several refs are listed
+        only once.
+        """
+        self.logger.debug('Retrieving list of commits...')
+        tips = self._get_ref_tips() if tips is None else tips
+        commit_list = []
+        if tips:
+            proc = subprocess.Popen(
+                ['git', '-C', self.repo_path, 'rev-list', '--ignore-missing',
+                 '--stdin'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            # Tips which no longer exist, e.g. after a force push, are ignored
+            commits, _ = proc.communicate(''.join(
+                ['{0}\n'.format(tip) for tip in tips] +
+                ['^{0}\n'.format(tip) for tip in scanned_tips]))
+            if proc.returncode == 0:
+                commit_list = commits.splitlines()
+        self.logger.info('Found {0} {1}commits in {2}...'.format(
+            len(commit_list), 'new ' if scanned_tips else '', self.repo_name))
+        self.commits = len(commit_list)
+        return commit_list
 
-    def _search_commit(self, commit, search_string):
+    def _get_fingerprint(self, patterns):
+        """Return the fingerprint of the search list, the detectors and the
+        filters selecting the files to scan.
+        """
+        filters = sorted(self.detectors) + self.path_filter.get_pathspecs()
+        if self.max_blob_size:
+            filters.append('max_blob_size={0}'.format(self.max_blob_size))
+        if self.skip_binary:
+            filters.append('skip_binary')
+        if not filters:
+            return patterns.fingerprint
+        return hashlib.sha256('\n'.join(
+            [patterns.fingerprint] + filters)).hexdigest()
+
+    def _load_scanned_tips(self, fingerprint):
+        """Return the tips scanned by the last incremental scan if it
+        searched for the same strings.
+        """
+        try:
+            with open(self.state_file_path) as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError):
+            return []
+        if state.get('fingerprint') != fingerprint:
+            self.logger.info(
+                'The search list changed since the last scan of {0}. '
+                'Scanning all commits...'.format(self.repo_name))
+            return []
+        return state.get('scanned_tips', [])
+
+    def _save_scanned_tips(self, fingerprint, tips):
+        state_dir = os.path.dirname(self.state_file_path)
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        temp_path = self.state_file_path + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(dict(fingerprint=fingerprint, scanned_tips=tips),
+                      state_file, indent=4)
+        os.rename(temp_path, self.state_file_path)
+
+    def _search_commit(self, commit, patterns):
         """ Run git grep on the commit
         """
+        # Search strings are basic regular expressions, whatever the
+        # `grep.patternType` of the user's git config
+        command = ['git', '-C', self.repo_path, 'grep', '-l',
+                   '--basic-regexp']
+        command.extend(['-f', patterns.pattern_file_path, commit])
+        pathspecs = self.path_filter.get_pathspecs()
+        if pathspecs:
+            command.append('--')
+            command.extend(pathspecs)
         try:
-            matched_files = subprocess.check_output(
-                'git -C {0} grep -l -e {1} {2}'.format(
-                    self.repo_path, search_string, commit), shell=True)
+            matched_files = subprocess.check_output(command)
             return matched_files.splitlines()
         except subprocess.CalledProcessError:
             return []
 
+    def _search_blobs(self, patterns, commits):
+        """Scan every unique blob reachable from the commits exactly once
+        and map the matching blobs back to the commits and paths which
+        contain them.
+
+        Only the ids of the unique blobs are collected before scanning. The
+        commits and paths of the few matching blobs are then found by
+        walking the (cached) trees again, rather than keeping the location
+        of every blob of the history.
+
+        As soon as a chunk of blobs has been scanned, the matching files of
+        every commit containing any of its matching blobs are yielded, like
+        `_search` yields them in commits mode, so they can be passed to
+        `_write_results` as they come. The findings of the detectors are
+        (match, detector name) pairs.
+        """
+        for matching_blobs in self._grep_blobs(
+                patterns, self._get_all_blobs(commits)):
+            for commit, matches in self._locate_blobs(
+                    commits, dict(matching_blobs)):
+                if matches:
+                    yield [self._format_match(commit, filepath, detector)
+                           for filepath, detector in sorted(matches)]
+
+    def _locate_blobs(self, commits, matching_blobs):
+        """Return a list of (commit, matches) for every commit, where the
+        matches are the (filepath, detector name) pairs of the files of the
+        commit which are any of the matching blobs.
+        """
+        if not matching_blobs:
+            return [(commit, []) for commit in commits]
+        trees = utils.ParallelMap(self._list_tree, commits, jobs=self.jobs)
+        return [(commit, [(filepath, detector)
+                          for sha, filepath in tree if sha in matching_blobs
+                          for detector in matching_blobs[sha]])
+                for commit, tree in itertools.izip(commits, trees)]
+
+    @staticmethod
+    def _format_match(commit, filepath, detector):
+        match = '{0}:{1}'.format(commit, filepath)
+        if detector == detectors.SEARCH_LIST_DETECTOR:
+            return match
+        return match, detector
+
+    def _get_all_blobs(self, commits):
+        """Return an ordered mapping of every blob sha reachable from the
+        commits to whether all the paths of the blob have binary extensions.
+
+        The trees are listed one commit at a time, so memory use grows with
+        the number of unique blobs rather than with the size of the history.
+        """
+        blobs = OrderedDict()
+        for tree in utils.ParallelMap(self._list_tree, commits,
+                                      jobs=self.jobs):
+            for sha, filepath in tree:
+                blobs[sha] = blobs.get(sha, True) and \
+                    self._has_binary_extension(filepath)
+        return blobs
+
+    def _list_tree(self, commit):
+        """Return a list of (blob sha, filepath) for every file in the commit
+        """
+        try:
+            with self.object_readers.reader() as reader:
+                object_type, content = reader.read(commit)
+                if object_type != 'commit':
+                    return []
+                tree, _, _ = objects.parse_commit(content)
+                return objects.list_tree(
+                    reader, tree, self.trees_cache, self.path_filter)
+        except objects.ObjectReaderError:
+            return []
+
+    def _grep_blobs(self, patterns, blobs):
+        """Yield a list of (sha, detector names) for the blobs matching the
+        search list or flagged by the detectors, for every chunk of blobs
+        as soon as it has been scanned.
+
+        The blobs are split into chunks which are scanned by a pool of
+        `self.jobs` processes, each one streaming its chunk through its own
+        `git cat-file --batch` process.
+        """
+        self.logger.debug('Found {0} unique blobs...'.format(len(blobs)))
+        self._log_already_scanned(blobs, 'blobs')
+        already_scanned = [(sha, self.scanned_objects[sha]) for sha in blobs
+                           if self.scanned_objects.get(sha)]
+        shas = [sha for sha in blobs if sha not in self.scanned_objects]
+        skipped = self._filter_blobs(shas, blobs)
+        del blobs
+        for sha in skipped:
+            self.scanned_objects[sha] = ()
+        shas = [sha for sha in shas if sha not in skipped]
+        if already_scanned:
+            yield already_scanned
+        # Compiled before the worker processes are forked so they inherit it
+        patterns.matcher
+        # Even serially, the blobs are scanned in chunks so the results of
+        # the first ones are written while the others are scanned
+        chunk_size = max(
+            1, -(-len(shas) // (self.jobs * BLOB_CHUNKS_PER_JOB)))
+        chunks = [shas[i:i + chunk_size]
+                  for i in range(0, len(shas), chunk_size)]
+        results_per_chunk = utils.ParallelMap(
+            functools.partial(grep_blobs, self.repo_path, patterns,
+                              object_backend=self.object_backend,
+                              detector_names=self.detectors,
+                              skip_binary=self.skip_binary),
+            chunks,
+            jobs=self.jobs,
+            processes=True)
+        for chunk, (matches, binary_blob_sizes) in itertools.izip(
+                chunks, results_per_chunk):
+            if binary_blob_sizes:
+                self._count_skipped('binary', sum(binary_blob_sizes),
+                                    len(binary_blob_sizes))
+            matches = dict(matches)
+            for sha in chunk:
+                self.scanned_objects[sha] = matches.get(sha, ())
+            if matches:
+                yield [(sha, matches[sha]) for sha in chunk if sha in matches]
+        self._log_speedup(len(shas), 'blobs', results_per_chunk.speedup)
+
     def _write_results(self, results):
         """ Write the result to DB
         """
-        db = TinyDB(
-            self.results_file_path,
-            indent=4,
-            sort_keys=True,
-            separators=(',', ': '))
-
         self.logger.info('Writing results to: {0}...'.format(
             self.results_file_path))
+        self.results_store.insert_many(self._get_records(results))
+
+    def _get_records(self, results):
+        """Yield a result record for every matching file, as soon as the
+        commit containing it has been scanned.
+        """
         for matched_files in results:
+            matches = []
             for match in matched_files:
+                detector = detectors.SEARCH_LIST_DETECTOR
+                if isinstance(match, tuple):
+                    match, detector = match
                 try:
                     commit_sha, filepath = match.rsplit(':', 1)
-                    username, email, commit_time = \
-                        self._get_user_details(commit_sha)
-                    result = dict(
-                        email=email,
-                        filepath=filepath,
-                        username=username,
-                        commit_sha=commit_sha,
-                        commit_time=commit_time,
-                        repository_name=self.repo_name,
-                        organization_name=self.organization,
-                        blob_url=constants.GITHUB_BLOB_URL.format(
-                            self.organization,
-                            self.repo_name,
-                            commit_sha, filepath)
-                    )
-                    self.result_count += 1
-                    db.insert(result)
-                except IndexError:
+                    matches.append((commit_sha, filepath, detector))
+                except ValueError:
                     # The structre of the output is
                     # sha:filename
                     # sha:filename
@@ -225,33 +789,105 @@ class Repo(object):
                     # and we need both sha and filename and when we don't \
                     #  get them we skip to the next
                     pass
+            self._update_commits_details(
+                set(commit_sha for commit_sha, _, _ in matches))
+
+            for commit_sha, filepath, detector in matches:
+                username, email, commit_time = \
+                    self._get_user_details(commit_sha)
+                self.result_count += 1
+                yield dict(
+                    email=email,
+                    filepath=filepath,
+                    username=username,
+                    commit_sha=commit_sha,
+                    commit_time=commit_time,
+                    repository_name=self.repo_name,
+                    organization_name=self.organization,
+                    blob_url=constants.GITHUB_BLOB_URL.format(
+                        self.organization,
+                        self.repo_name,
+                        commit_sha, filepath),
+                    detector=detector
+                )
+
+    def _update_commits_details(self, commits):
+        missing_commits = [commit for commit in commits
+                           if commit not in self.commits_details]
+        self.commits_details.update(
+            self._get_commits_details(missing_commits))
+
+    def _get_commits_details(self, commits):
+        """Return a mapping of every commit sha to its
+        (user_name, user_email, commit_time), read from the commit objects.
+        """
+        details = {}
+        if not commits:
+            return details
+        try:
+            with self.object_readers.reader() as reader:
+                for commit in commits:
+                    object_type, content = reader.read(commit)
+                    if object_type == 'commit':
+                        _, _, details[commit] = objects.parse_commit(content)
+        except objects.ObjectReaderError:
+            # The repo doesn't exist
+            pass
+        return details
 
     def _get_user_details(self, sha):
         """ Return user_name, user_email, commit_time
         per commit before write to DB
         """
-        details = subprocess.check_output(
-            "git -C {0} show -s  {1}".format(self.repo_path, sha), shell=True)
-        name = utils.find_string_between_strings(details, 'Author: ', ' <')
-        email = utils.find_string_between_strings(details, '<', '>')
-        commit_time = utils.find_string_between_strings(
-            details, 'Date:   ', '+').strip()
-        return name, email, commit_time
-
-    def search(self, search_list):
+        self._update_commits_details([sha])
+        return self.commits_details.get(sha, (' ', ' ', ' '))
+
+    def search(self, search_list=None):
         """Api method init repo instance and search strings
         """
-        search_list = search_list or self.search_list
-        if len(search_list) == 0:
+        search_list = search_list or self.patterns or []
+        if len(search_list) == 0 and not self.detectors:
             self.logger.error(
                 'You must supply at least one string to search for.')
             sys.exit(1)
 
         start = time()
+        self.fetch()
+        self.scan(search_list, start=start)
+
+    def fetch(self):
+        """Clone or pull the repo. This is the network bound part of
+        `search`.
+        """
         self._clone_or_pull()
-        commits = self._get_all_commits()
-        results = self._search(search_list, commits)
-        self._write_results(results)
+
+    def scan(self, search_list, start=None):
+        """Scan an already fetched repo and write the results.
+        This is the CPU bound part of `search`.
+        """
+        start = start or time()
+        patterns = matcher.compile_patterns(
+            search_list, hashed=self.match_mode == 'hashed')
+        tips = self._get_ref_tips()
+        fingerprint = self._get_fingerprint(patterns)
+        if self.incremental:
+            # Commits scanned for a different search list are scanned again
+            commits = self._get_all_commits(
+                tips, self._load_scanned_tips(fingerprint))
+        else:
+            commits = self._get_all_commits(tips)
+        try:
+            self._update_commits_details(commits)
+            results = self._search(patterns, commits)
+            self._write_results(results)
+        finally:
+            self.object_readers.close()
+            self.trees_cache.clear()
+            # Pattern sets passed in are closed by whoever compiled them
+            if patterns is not search_list:
+                patterns.close()
+        if self.incremental:
+            self._save_scanned_tips(fingerprint, tips)
         if self.print_result:
             utils.print_result_file(self.results_file_path)
         if self.remove_cloned_dir:
@@ -261,6 +897,7 @@ class Repo(object):
             utils.print_errors_summary(self.error_summary)
         self.logger.info('Found {0} results in {1} commits.'.format(
             self.result_count, self.commits))
+        self._log_skipped()
         self.logger.debug('Total time: {0} seconds'.format(total_time))
         if 'pagerduty' in self.pager:
             handler.pagerduty_trigger(config_file=self.config_file,
@@ -280,11 +917,26 @@ def search(
         consolidate_log=False,
         from_organization=False,
         remove_cloned_dir=False,
+        scan_mode=constants.DEFAULT_SCAN_MODE,
+        jobs=1,
+        results_store=store.DEFAULT_RESULTS_STORE,
+        incremental=False,
+        refs=constants.DEFAULT_REFS,
+        mirror=False,
+        object_backend=constants.DEFAULT_OBJECT_BACKEND,
+        match_mode=constants.DEFAULT_MATCH_MODE,
+        detectors=(),
+        max_blob_size=None,
+        skip_binary=False,
+        include_paths=(),
+        exclude_paths=(),
         **kwargs):
     """Api method init repo instance and search strings
     """
 
     utils.check_if_executable_exists_else_exit('git')
+    # Read once and passed along
+    config_file = utils.load_config(config_file) if config_file else None
     source = handler.plugins_handle(config_file=config_file,
                                     plugins_list=source)
 
@@ -295,7 +947,20 @@ def search(
                 config_file=config_file,
                 search_list=search_list)
         repo = Repo.init_with_config_file(pager=pager,
+                                          exclude_paths=exclude_paths,
+                                          include_paths=include_paths,
+                                          skip_binary=skip_binary,
+                                          max_blob_size=max_blob_size,
+                                          detectors=detectors,
+                                          match_mode=match_mode,
+                                          object_backend=object_backend,
+                                          mirror=mirror,
+                                          refs=refs,
+                                          incremental=incremental,
+                                          jobs=jobs,
+                                          results_store=results_store,
                                           verbose=verbose,
+                                          scan_mode=scan_mode,
                                           config_file=config_file,
                                           print_result=print_result)
     else:
@@ -305,8 +970,21 @@ def search(
                 config_file=config_file,
                 search_list=search_list)
         repo = Repo(
+            exclude_paths=exclude_paths,
+            include_paths=include_paths,
+            skip_binary=skip_binary,
+            max_blob_size=max_blob_size,
+            detectors=detectors,
+            match_mode=match_mode,
+            object_backend=object_backend,
+            mirror=mirror,
+            refs=refs,
+            incremental=incremental,
+            jobs=jobs,
+            results_store=results_store,
             verbose=verbose,
             repo_url=repo_url,
+            scan_mode=scan_mode,
             results_dir=results_dir,
             search_list=search_list,
             print_result=print_result,
@@ -314,4 +992,6 @@ def search(
             consolidate_log=consolidate_log,
             remove_cloned_dir=remove_cloned_dir)
 
-    repo.search(search_list=search_list)
+    # The repo already compiled the search list
+    del search_list
+    repo.search()
@@ -0,0 +1,283 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import gzip
+import json
+import sqlite3
+import threading
+
+from tinydb import TinyDB
+
+
+RESULT_FIELDS = (
+    'email',
+    'filepath',
+    'username',
+    'commit_sha',
+    'commit_time',
+    'repository_name',
+    'organization_name',
+    'blob_url',
+    # `search_list` or the name of the detector which flagged the file
+    'detector',
+)
+
+
+class TinyDBStore(object):
+    """Store the results in a TinyDB JSON file.
+
+    This is the original results format, so tools reading it keep working.
+    """
+    file_name = 'results.json'
+
+    def __init__(self, path, lock=None):
+        self.path = path
+        self.lock = lock or threading.Lock()
+
+    def _open(self):
+        return TinyDB(
+            self.path,
+            indent=4,
+            sort_keys=True,
+            separators=(',', ': '))
+
+    def insert_many(self, results):
+        # TinyDB rewrites the whole file on every insert, so insert all the
+        # results at once
+        results = list(results)
+        if results:
+            with self.lock:
+                self._open().insert_multiple(results)
+
+    def count(self):
+        try:
+            with open(self.path) as results_file:
+                return len(json.load(results_file)['_default'])
+        except (IOError, ValueError, KeyError):
+            return 0
+
+    def dump(self):
+        with open(self.path) as results_file:
+            return results_file.read()
+
+
+class SQLiteStore(object):
+    """Store the results in an SQLite database, inserting them in batches
+    inside a transaction.
+    """
+    file_name = 'results.db'
+    batch_size = 1000
+    indexed_fields = ('repository_name', 'commit_sha', 'email')
+
+    def __init__(self, path, lock=None):
+        self.path = path
+        self.lock = lock or threading.Lock()
+        self._migrated = False
+
+    def _open(self):
+        db = sqlite3.connect(self.path)
+        if not self._migrated:
+            self._migrate(db)
+            self._migrated = True
+        return db
+
+    def _migrate(self, db):
+        db.execute('CREATE TABLE IF NOT EXISTS results ({0})'.format(
+            ', '.join(['id INTEGER PRIMARY KEY'] +
+                      ['{0} TEXT'.format(field) for field in RESULT_FIELDS])))
+        # Databases written by older versions lack the newer fields
+        columns = set(row[1] for row in db.execute(
+            'PRAGMA table_info(results)'))
+        for field in RESULT_FIELDS:
+            if field not in columns:
+                db.execute(
+                    'ALTER TABLE results ADD COLUMN {0} TEXT'.format(field))
+        for field in self.indexed_fields:
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS results_{0} '
+                'ON results ({0})'.format(field))
+
+    def _get_batches(self, results):
+        batch = []
+        for result in results:
+            batch.append([result.get(field) for field in RESULT_FIELDS])
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def insert_many(self, results):
+        query = 'INSERT INTO results ({0}) VALUES ({1})'.format(
+            ', '.join(RESULT_FIELDS), ', '.join('?' * len(RESULT_FIELDS)))
+        # A single connection for all the batches, opened with the first one
+        db = None
+        try:
+            for batch in self._get_batches(results):
+                with self.lock:
+                    if db is None:
+                        db = self._open()
+                    with db:
+                        db.executemany(query, batch)
+        finally:
+            if db is not None:
+                db.close()
+
+    def _read(self):
+        db = self._open()
+        try:
+            return db.execute('SELECT {0} FROM results ORDER BY id'.format(
+                ', '.join(RESULT_FIELDS))).fetchall()
+        finally:
+            db.close()
+
+    def count(self):
+        if not os.path.isfile(self.path):
+            return 0
+        db = self._open()
+        try:
+            return db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        finally:
+            db.close()
+
+    def dump(self):
+        return json.dumps(
+            [dict(zip(RESULT_FIELDS, row)) for row in self._read()],
+            indent=4,
+            sort_keys=True,
+            separators=(',', ': '))
+
+
+class JSONLinesStore(object):
+    """Append every result to a JSON Lines file as soon as it is found.
+
+    The results are buffered in memory for at most `flush_every` results or
+    `flush_interval` seconds, even while no new result is found, so the
+    file can be followed during long scans while memory use doesn't depend
+    on the number of results.
+    """
+    file_name = 'results.jsonl'
+    flush_every = 100
+    flush_interval = 5
+
+    def __init__(self, path, lock=None):
+        self.path = path
+        self.lock = lock or threading.Lock()
+
+    def _append(self, lines):
+        # Appending all the buffered lines with a single write under the lock
+        # keeps lines written by other repos of the same run from
+        # interleaving with ours
+        with self.lock:
+            with open(self.path, 'ab') as results_file:
+                results_file.write(''.join(lines))
+
+    def _open_for_reading(self):
+        return open(self.path, 'rb')
+
+    def insert_many(self, results):
+        lines = []
+        buffer_lock = threading.Lock()
+        done = threading.Event()
+
+        def flush():
+            with buffer_lock:
+                if lines:
+                    self._append(lines)
+                    del lines[:]
+
+        def flush_periodically():
+            # Results arrive while repos are scanned, possibly long after
+            # the previous one, so the buffer is flushed on a timer
+            while not done.wait(self.flush_interval):
+                flush()
+
+        flusher = threading.Thread(target=flush_periodically)
+        flusher.daemon = True
+        flusher.start()
+        try:
+            for result in results:
+                with buffer_lock:
+                    lines.append(json.dumps(result, sort_keys=True) + '\n')
+                    full = len(lines) >= self.flush_every
+                if full:
+                    flush()
+        finally:
+            done.set()
+            flusher.join()
+            flush()
+
+    def count(self):
+        if not os.path.isfile(self.path):
+            return 0
+        with self._open_for_reading() as results_file:
+            return sum(1 for line in results_file if line.strip())
+
+    def dump(self):
+        with self._open_for_reading() as results_file:
+            return results_file.read()
+
+
+class GzipJSONLinesStore(JSONLinesStore):
+    """A gzip compressed `JSONLinesStore`.
+
+    Every flush appends a complete gzip member to the file, which keeps it a
+    valid (multi-member) gzip file that `zcat` and `gzip.open` can read at
+    any time.
+    """
+    file_name = 'results.jsonl.gz'
+
+    def _append(self, lines):
+        with self.lock:
+            with gzip.open(self.path, 'ab') as results_file:
+                results_file.write(''.join(lines))
+
+    def _open_for_reading(self):
+        return gzip.open(self.path, 'rb')
+
+
+RESULTS_STORES = {
+    'tinydb': TinyDBStore,
+    'sqlite': SQLiteStore,
+    'jsonl': JSONLinesStore,
+    'jsonl.gz': GzipJSONLinesStore,
+}
+DEFAULT_RESULTS_STORE = 'tinydb'
+
+
+def get_results_file_path(results_dir, results_store):
+    return os.path.join(results_dir,
+                        RESULTS_STORES[results_store].file_name)
+
+
+def open_store(path, results_store=None, lock=None):
+    """Return the store of the results file. If `results_store` isn't
+    given, it is detected by the file name.
+
+    :param lock: lock shared by all the stores writing to the same file
+                 concurrently (threading.Lock)
+    """
+    if not results_store:
+        results_store = DEFAULT_RESULTS_STORE
+        # Longest name first so results.jsonl.gz isn't taken for .jsonl
+        for name, store_class in sorted(
+                RESULTS_STORES.items(),
+                key=lambda item: len(item[1].file_name),
+                reverse=True):
+            if os.path.basename(path).startswith(store_class.file_name):
+                results_store = name
+                break
+    return RESULTS_STORES[results_store](path, lock=lock)
@@ -15,7 +15,7 @@
 
 import click
 
-from . import repo, organization, constants
+from . import repo, organization, constants, store
 
 
 @click.group()
@@ -44,10 +44,59 @@ def main():
               help='pager plugins(pagerduty).')
 @click.option('--source', multiple=True, default=[],
               help='source plugins(Vault).')
+@click.option('--scan-mode', default=constants.DEFAULT_SCAN_MODE,
+              type=click.Choice(constants.SCAN_MODES),
+              help='Scan each commit with git grep or scan each unique blob '
+                   'only once. [defaults to {0}]'.format(
+                       constants.DEFAULT_SCAN_MODE))
+@click.option('-j', '--jobs', default=1, type=click.IntRange(min=1),
+              help='Number of parallel scan workers. [defaults to 1]')
+@click.option('--results-store', default=store.DEFAULT_RESULTS_STORE,
+              type=click.Choice(sorted(store.RESULTS_STORES)),
+              help='Format of the results file. [defaults to {0}]'.format(
+                  store.DEFAULT_RESULTS_STORE))
+@click.option('-i', '--incremental', default=False, is_flag=True,
+              help='Only scan commits added since the last scan of the same '
+                   'strings. A full scan is done when the strings change.')
+@click.option('--refs', multiple=True, default=[],
+              help='Refs to scan: branches, tags, all or a ref glob such as '
+                   'refs/remotes/origin/release-*. This can be passed '
+                   'multiple times. [defaults to all]')
+@click.option('--mirror', default=False, is_flag=True,
+              help='Keep bare mirrors of the repositories instead of checked '
+                   'out clones.')
+@click.option('--object-backend', default=constants.DEFAULT_OBJECT_BACKEND,
+              type=click.Choice(constants.OBJECT_BACKENDS),
+              help='Read git objects through git processes or straight out '
+                   'of the pack files. [defaults to git]')
+@click.option('--match-mode', default=constants.DEFAULT_MATCH_MODE,
+              type=click.Choice(constants.MATCH_MODES),
+              help='Match the search strings as patterns or keep only salted '
+                   'hashes of them and match them against whole tokens. '
+                   '[defaults to patterns]')
+@click.option('--detector', 'detectors', multiple=True, default=[],
+              type=click.Choice(constants.DETECTORS),
+              help='Also flag secrets which are not in the search list, '
+                   'e.g. high entropy strings with `entropy`. This can be '
+                   'passed multiple times.')
+@click.option('--max-blob-size', default=None,
+              help='Skip files bigger than this size, in bytes or with a '
+                   'K, M or G suffix, e.g. 10M. [defaults to no limit]')
+@click.option('--skip-binary', default=False, is_flag=True,
+              help='Skip binary files, such as images and archives.')
+@click.option('--include-path', 'include_paths', multiple=True, default=[],
+              help='Only scan the files matching this glob, e.g. src/ or '
+                   '*.py. This can be passed multiple times.')
+@click.option('--exclude-path', 'exclude_paths', multiple=True, default=[],
+              help='Skip the files matching this glob, e.g. node_modules/ '
+                   'or *.min.js. This can be passed multiple times.')
 @click.option('--print-result', default=False, is_flag=True)
 @click.option('-v', '--verbose', default=False, is_flag=True)
 def surch_repo(repo_url, config_file, string, print_result, pager, remove,
-               source, cloned_repo_dir, log, verbose):
+               source, cloned_repo_dir, log, scan_mode, jobs, results_store,
+               incremental, refs, mirror, object_backend, match_mode,
+               detectors, max_blob_size, skip_binary, include_paths,
+               exclude_paths, verbose):
     """Search a single repository
     """
 
@@ -57,6 +106,19 @@ def surch_repo(repo_url, config_file, string, print_result, pager, remove,
         results_dir=log,
         verbose=verbose,
         repo_url=repo_url,
+        jobs=jobs,
+        exclude_paths=exclude_paths,
+        include_paths=include_paths,
+        skip_binary=skip_binary,
+        max_blob_size=max_blob_size,
+        detectors=detectors,
+        match_mode=match_mode,
+        object_backend=object_backend,
+        mirror=mirror,
+        refs=refs,
+        incremental=incremental,
+        results_store=results_store,
+        scan_mode=scan_mode,
         config_file=config_file,
         search_list=list(string),
         remove_cloned_dir=remove,
@@ -95,11 +157,85 @@ def surch_repo(repo_url, config_file, string, print_result, pager, remove,
               help='pager plugins(pagerduty).')
 @click.option('--source', multiple=True, default=[],
               help='source plugins(Vault).')
+@click.option('--scan-mode', default=constants.DEFAULT_SCAN_MODE,
+              type=click.Choice(constants.SCAN_MODES),
+              help='Scan each commit with git grep or scan each unique blob '
+                   'only once. [defaults to {0}]'.format(
+                       constants.DEFAULT_SCAN_MODE))
+@click.option('-j', '--jobs', default=1, type=click.IntRange(min=1),
+              help='Number of parallel scan workers. [defaults to 1]')
+@click.option('--clone-jobs', default=1, type=click.IntRange(min=1),
+              help='Number of repositories to clone or pull concurrently. '
+                   '[defaults to 1]')
+@click.option('--scan-jobs', default=1, type=click.IntRange(min=1),
+              help='Number of repositories to scan concurrently. '
+                   '[defaults to 1]')
+@click.option('--results-store', default=store.DEFAULT_RESULTS_STORE,
+              type=click.Choice(sorted(store.RESULTS_STORES)),
+              help='Format of the results file. [defaults to {0}]'.format(
+                  store.DEFAULT_RESULTS_STORE))
+@click.option('-i', '--incremental', default=False, is_flag=True,
+              help='Only scan commits added since the last scan of the same '
+                   'strings. A full scan is done when the strings change.')
+@click.option('--refs', multiple=True, default=[],
+              help='Refs to scan: branches, tags, all or a ref glob such as '
+                   'refs/remotes/origin/release-*. This can be passed '
+                   'multiple times. [defaults to all]')
+@click.option('--mirror', default=False, is_flag=True,
+              help='Keep bare mirrors of the repositories instead of checked '
+                   'out clones.')
+@click.option('--shared-objects', default=False, is_flag=True,
+              help='Back all the clones with a shared object store so '
+                   'objects common to several repositories, e.g. forks, are '
+                   'fetched only once.')
+@click.option('--object-backend', default=constants.DEFAULT_OBJECT_BACKEND,
+              type=click.Choice(constants.OBJECT_BACKENDS),
+              help='Read git objects through git processes or straight out '
+                   'of the pack files. [defaults to git]')
+@click.option('--match-mode', default=constants.DEFAULT_MATCH_MODE,
+              type=click.Choice(constants.MATCH_MODES),
+              help='Match the search strings as patterns or keep only salted '
+                   'hashes of them and match them against whole tokens. '
+                   '[defaults to patterns]')
+@click.option('--detector', 'detectors', multiple=True, default=[],
+              type=click.Choice(constants.DETECTORS),
+              help='Also flag secrets which are not in the search list, '
+                   'e.g. high entropy strings with `entropy`. This can be '
+                   'passed multiple times.')
+@click.option('--max-blob-size', default=None,
+              help='Skip files bigger than this size, in bytes or with a '
+                   'K, M or G suffix, e.g. 10M. [defaults to no limit]')
+@click.option('--skip-binary', default=False, is_flag=True,
+              help='Skip binary files, such as images and archives.')
+@click.option('--include-path', 'include_paths', multiple=True, default=[],
+              help='Only scan the files matching this glob, e.g. src/ or '
+                   '*.py. This can be passed multiple times.')
+@click.option('--exclude-path', 'exclude_paths', multiple=True, default=[],
+              help='Skip the files matching this glob, e.g. node_modules/ '
+                   'or *.min.js. This can be passed multiple times.')
+@click.option('--github-api-url', default=constants.GITHUB_API_URL,
+              help='URL of the GitHub API, e.g. '
+                   'https://github.example.com/api/v3 for GitHub Enterprise. '
+                   '[defaults to https://api.github.com]')
+@click.option('--include-private', default=False, is_flag=True,
+              help='Also scan private repositories. Requires credentials.')
+@click.option('--forks/--no-forks', 'include_forks', default=True,
+              help='Scan forked repositories. [defaults to --forks]')
+@click.option('--archived/--no-archived', 'include_archived', default=True,
+              help='Scan archived repositories. [defaults to --archived]')
+@click.option('--http-cache/--no-http-cache', default=True,
+              help='Cache the GitHub API responses and only download them '
+                   'again if they changed. [defaults to --http-cache]')
 @click.option('--print-result', default=False, is_flag=True)
 @click.option('-v', '--verbose', default=False, is_flag=True)
 def surch_org(organization_name, config_file, string, include_repo, pager,
               exclude_repo, user, print_result, remove, password, source,
-              cloned_repos_path, log, verbose):
+              cloned_repos_path, log, scan_mode, jobs, clone_jobs, scan_jobs,
+              results_store, incremental, refs, mirror, shared_objects,
+              object_backend, match_mode, detectors, max_blob_size,
+              skip_binary, include_paths, exclude_paths, github_api_url,
+              include_private, include_forks, include_archived, http_cache,
+              verbose):
     """Search all or some repositories in an organization
     """
 
@@ -108,6 +244,27 @@ def surch_org(organization_name, config_file, string, include_repo, pager,
         source=source,
         git_user=user,
         results_dir=log,
+        jobs=jobs,
+        http_cache=http_cache,
+        include_archived=include_archived,
+        include_forks=include_forks,
+        include_private=include_private,
+        github_api_url=github_api_url,
+        exclude_paths=exclude_paths,
+        include_paths=include_paths,
+        skip_binary=skip_binary,
+        max_blob_size=max_blob_size,
+        detectors=detectors,
+        match_mode=match_mode,
+        object_backend=object_backend,
+        shared_objects=shared_objects,
+        mirror=mirror,
+        refs=refs,
+        incremental=incremental,
+        results_store=results_store,
+        clone_jobs=clone_jobs,
+        scan_jobs=scan_jobs,
+        scan_mode=scan_mode,
         verbose=verbose,
         repos_to_skip=exclude_repo,
         repos_to_check=include_repo,
@@ -151,11 +308,85 @@ def surch_org(organization_name, config_file, string, include_repo, pager,
               help='pager plugins(pagerduty).')
 @click.option('--source', multiple=True, default=[],
               help='source plugins(Vault).')
+@click.option('--scan-mode', default=constants.DEFAULT_SCAN_MODE,
+              type=click.Choice(constants.SCAN_MODES),
+              help='Scan each commit with git grep or scan each unique blob '
+                   'only once. [defaults to {0}]'.format(
+                       constants.DEFAULT_SCAN_MODE))
+@click.option('-j', '--jobs', default=1, type=click.IntRange(min=1),
+              help='Number of parallel scan workers. [defaults to 1]')
+@click.option('--clone-jobs', default=1, type=click.IntRange(min=1),
+              help='Number of repositories to clone or pull concurrently. '
+                   '[defaults to 1]')
+@click.option('--scan-jobs', default=1, type=click.IntRange(min=1),
+              help='Number of repositories to scan concurrently. '
+                   '[defaults to 1]')
+@click.option('--results-store', default=store.DEFAULT_RESULTS_STORE,
+              type=click.Choice(sorted(store.RESULTS_STORES)),
+              help='Format of the results file. [defaults to {0}]'.format(
+                  store.DEFAULT_RESULTS_STORE))
+@click.option('-i', '--incremental', default=False, is_flag=True,
+              help='Only scan commits added since the last scan of the same '
+                   'strings. A full scan is done when the strings change.')
+@click.option('--refs', multiple=True, default=[],
+              help='Refs to scan: branches, tags, all or a ref glob such as '
+                   'refs/remotes/origin/release-*. This can be passed '
+                   'multiple times. [defaults to all]')
+@click.option('--mirror', default=False, is_flag=True,
+              help='Keep bare mirrors of the repositories instead of checked '
+                   'out clones.')
+@click.option('--shared-objects', default=False, is_flag=True,
+              help='Back all the clones with a shared object store so '
+                   'objects common to several repositories, e.g. forks, are '
+                   'fetched only once.')
+@click.option('--object-backend', default=constants.DEFAULT_OBJECT_BACKEND,
+              type=click.Choice(constants.OBJECT_BACKENDS),
+              help='Read git objects through git processes or straight out '
+                   'of the pack files. [defaults to git]')
+@click.option('--match-mode', default=constants.DEFAULT_MATCH_MODE,
+              type=click.Choice(constants.MATCH_MODES),
+              help='Match the search strings as patterns or keep only salted '
+                   'hashes of them and match them against whole tokens. '
+                   '[defaults to patterns]')
+@click.option('--detector', 'detectors', multiple=True, default=[],
+              type=click.Choice(constants.DETECTORS),
+              help='Also flag secrets which are not in the search list, '
+                   'e.g. high entropy strings with `entropy`. This can be '
+                   'passed multiple times.')
+@click.option('--max-blob-size', default=None,
+              help='Skip files bigger than this size, in bytes or with a '
+                   'K, M or G suffix, e.g. 10M. [defaults to no limit]')
+@click.option('--skip-binary', default=False, is_flag=True,
+              help='Skip binary files, such as images and archives.')
+@click.option('--include-path', 'include_paths', multiple=True, default=[],
+              help='Only scan the files matching this glob, e.g. src/ or '
+                   '*.py. This can be passed multiple times.')
+@click.option('--exclude-path', 'exclude_paths', multiple=True, default=[],
+              help='Skip the files matching this glob, e.g. node_modules/ '
+                   'or *.min.js. This can be passed multiple times.')
+@click.option('--github-api-url', default=constants.GITHUB_API_URL,
+              help='URL of the GitHub API, e.g. '
+                   'https://github.example.com/api/v3 for GitHub Enterprise. '
+                   '[defaults to https://api.github.com]')
+@click.option('--include-private', default=False, is_flag=True,
+              help='Also scan private repositories. Requires credentials.')
+@click.option('--forks/--no-forks', 'include_forks', default=True,
+              help='Scan forked repositories. [defaults to --forks]')
+@click.option('--archived/--no-archived', 'include_archived', default=True,
+              help='Scan archived repositories. [defaults to --archived]')
+@click.option('--http-cache/--no-http-cache', default=True,
+              help='Cache the GitHub API responses and only download them '
+                   'again if they changed. [defaults to --http-cache]')
 @click.option('--print-result', default=False, is_flag=True)
 @click.option('-v', '--verbose', default=False, is_flag=True)
 def surch_user(organization_name, config_file, string, include_repo, pager,
                exclude_repo, user, remove, password, cloned_repos_path, log,
-               print_result, source, verbose):
+               print_result, source, scan_mode, jobs, clone_jobs, scan_jobs,
+               results_store, incremental, refs, mirror, shared_objects,
+               object_backend, match_mode, detectors, max_blob_size,
+               skip_binary, include_paths, exclude_paths, github_api_url,
+               include_private, include_forks, include_archived, http_cache,
+               verbose):
 
     """Search all or some repositories for a user
     """
@@ -165,6 +396,27 @@ def surch_user(organization_name, config_file, string, include_repo, pager,
         source=source,
         git_user=user,
         results_dir=log,
+        jobs=jobs,
+        http_cache=http_cache,
+        include_archived=include_archived,
+        include_forks=include_forks,
+        include_private=include_private,
+        github_api_url=github_api_url,
+        exclude_paths=exclude_paths,
+        include_paths=include_paths,
+        skip_binary=skip_binary,
+        max_blob_size=max_blob_size,
+        detectors=detectors,
+        match_mode=match_mode,
+        object_backend=object_backend,
+        shared_objects=shared_objects,
+        mirror=mirror,
+        refs=refs,
+        incremental=incremental,
+        results_store=results_store,
+        clone_jobs=clone_jobs,
+        scan_jobs=scan_jobs,
+        scan_mode=scan_mode,
         verbose=verbose,
         repos_to_skip=exclude_repo,
         repos_to_check=include_repo,
@@ -13,18 +13,38 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import re
 import os
 import json
 import mock
+import shutil
+import urllib
+import hashlib
+import urlparse
+import time
+import tempfile
+import threading
+import subprocess
+import BaseHTTPServer
+import SocketServer
 
 import testtools
 import click.testing as clicktest
 
 from surch import repo
+from surch import store
+from surch import matcher
+from surch import detectors
+from surch import objects
+from surch import packs
+from surch import paths
 from surch import utils
 import surch.surch as surch
 from surch import constants
 from surch import organization
+from surch import github
+from surch import config
+from surch.plugins import handler
 
 
 def _invoke_click(func, args=None, opts=None):
@@ -47,6 +67,201 @@ def count_dicts_in_results_file(file_path):
     except:
         return 0
 
+
+def git(repo_path, *args):
+    return subprocess.check_output(
+        ['git', '-C', repo_path, '-c', 'user.name=surch',
+         '-c', 'user.email=surch@surch.com'] + list(args))
+
+
+def commit_file(repo_path, filepath, content, message):
+    full_path = os.path.join(repo_path, filepath)
+    if not os.path.isdir(os.path.dirname(full_path)):
+        os.makedirs(os.path.dirname(full_path))
+    with open(full_path, 'w') as f:
+        f.write(content)
+    git(repo_path, 'add', filepath)
+    git(repo_path, 'commit', '-q', '-m', message)
+
+
+def create_local_repo(repo_path):
+    """Create a git repository with a short history for offline tests.
+    Return the list of commits, newest first.
+    """
+    os.makedirs(repo_path)
+    git(repo_path, 'init', '-q')
+    commit_file(repo_path, 'README.md', 'surch test repo\n', 'Add readme')
+    commit_file(repo_path, 'conf/settings.yaml', 'password: s3cr3t\n',
+                'Add settings')
+    commit_file(repo_path, 'setup.py', 'import os\n', 'Add setup')
+    commit_file(repo_path, 'conf/copy.yaml', 'password: s3cr3t\n',
+                'Copy settings')
+    commit_file(repo_path, 'conf/settings.yaml', 'password: changed\n',
+                'Change settings')
+    return git(repo_path, 'rev-list', 'HEAD').splitlines()
+
+
+def create_cloned_repo_instance(test_case, **kwargs):
+    """Return a `repo.Repo` of a local repository created by
+    `create_local_repo`, which is cloned but not scanned yet, together with
+    the path of the repository it was cloned from.
+    """
+    work_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+    remote_path = os.path.join(work_dir, 'remotes', 'local')
+    create_local_repo(remote_path)
+    repo_instance = repo.Repo(
+        repo_url=remote_path,
+        search_list=['s3cr3t'],
+        results_dir=os.path.join(work_dir, 'results'),
+        cloned_repo_dir=os.path.join(work_dir, 'clones'),
+        state_dir=os.path.join(work_dir, 'state'),
+        **kwargs)
+    repo_instance.fetch()
+    return repo_instance, remote_path
+
+
+def create_local_repo_instance(test_case, **kwargs):
+    """Return a `repo.Repo` on top of a local repository created by
+    `create_local_repo` together with the repository commits.
+    """
+    work_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+    repo_instance = repo.Repo(
+        repo_url='https://github.com/surch-test/local.git',
+        search_list=['s3cr3t'],
+        results_dir=os.path.join(work_dir, 'results'),
+        cloned_repo_dir=os.path.join(work_dir, 'clones'),
+        **kwargs)
+    commits = create_local_repo(repo_instance.repo_path)
+    return repo_instance, commits
+
+
+def get_matches(results):
+    """Return the sorted matches of `Repo._search`, which are grouped by
+    commit in commits mode and by chunk of blobs in blobs mode.
+    """
+    return sorted(match for matches in results for match in matches)
+
+
+class GitHubStandIn(object):
+    """A local stand-in for the GitHub API, listing the repos of an
+    organization in pages linked by `Link` headers like GitHub does.
+    """
+
+    def __init__(self, repos, owner='surch-test'):
+        self.repos = repos
+        self.owner = owner
+        self.requests = []
+        # Failures, i.e. (status, headers), to respond with first
+        self.failures = []
+        # Headers added to every successful response
+        self.headers = []
+        stand_in = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.requests.append(self.path)
+                status, headers, body = stand_in.respond(
+                    self.path, self.headers)
+                self.send_response(status)
+                for header in headers:
+                    self.send_header(*header)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs=dict(poll_interval=0.01))
+        thread.daemon = True
+        thread.start()
+
+    def respond(self, path, request_headers=None):
+        if self.failures:
+            status, headers = self.failures.pop(0)
+            return status, headers, json.dumps(dict(message='Failure'))
+        path, _, query = path.partition('?')
+        query = dict(urlparse.parse_qsl(query))
+        if path != '/orgs/{0}/repos'.format(self.owner):
+            return 404, [], json.dumps(dict(message='Not Found'))
+        repos = [data for data in self.repos
+                 if query.get('type') == 'all' or not data['private']]
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        last_page = max(1, -(-len(repos) // per_page))
+        links = []
+        if page < last_page:
+            for rel, link_page in (('next', page + 1), ('last', last_page)):
+                links.append('<{0}{1}?{2}>; rel="{3}"'.format(
+                    self.url, path,
+                    urllib.urlencode(sorted(dict(query, page=link_page)
+                                            .items())),
+                    rel))
+        body = json.dumps(repos[(page - 1) * per_page:page * per_page])
+        etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+        headers = [('Content-Type', 'application/json'),
+                   ('ETag', etag)] + self.headers
+        if links:
+            headers.append(('Link', ', '.join(links)))
+        if (request_headers or {}).get('If-None-Match') == etag:
+            return 304, [('ETag', etag)], ''
+        return 200, headers, body
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def create_repos_data(count, **kwargs):
+    return [dict(dict(private=False, fork=False, archived=False), **dict(
+        kwargs,
+        name='repo-{0}'.format(index),
+        clone_url='https://github.com/surch-test/repo-{0}.git'.format(index)))
+        for index in range(count)]
+
+
+class FakeClock(object):
+    """Stand-in for the `time` module, whose `sleep` only moves the clock
+    forward and records how long it was asked to sleep.
+    """
+
+    def __init__(self):
+        self.now = time.time()
+        self.waits = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.waits.append(seconds)
+        self.now += seconds
+
+
+def create_org_instance(test_case, repos, **kwargs):
+    """Return an `organization.Organization` listing its repos from a
+    `GitHubStandIn` serving the repos data, together with the stand-in.
+    """
+    stand_in = GitHubStandIn(repos)
+    test_case.addCleanup(stand_in.close)
+    work_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+    kwargs.setdefault('http_cache', False)
+    org = organization.Organization(
+        'surch-test',
+        github_api_url=stand_in.url,
+        results_dir=os.path.join(work_dir, 'results'),
+        cloned_repos_dir=os.path.join(work_dir, 'clones'),
+        **kwargs)
+    return org, stand_in
+
+
 path = os.path.abspath(__file__)
 path = path.rsplit('/', 1)[0]
 test_path = os.path.join(path, 'test')
@@ -106,18 +321,19 @@ class TestRepo(testtools.TestCase):
         self.assertEqual(1, result.exit_code)
         utils.remove_repos_folder(test_path)
 
-    def test_create_search_strings(self):
-        Repo = repo.Repo(repo_url='',
-                         search_list='',
-                         verbose=False,
-                         results_dir=None,
-                         print_result=False,
-                         cloned_repo_dir=None,
-                         consolidate_log=False,
-                         remove_cloned_dir=False)
-        search_list = Repo._create_search_string(['a', 'b', 'c'])
-        success = search_list == "'a' --or -e 'b' --or -e 'c'"
-        self.assertTrue(success)
+    def test_compile_patterns(self):
+        patterns = matcher.compile_patterns(
+            ['b', u'a', "it's", 'b', '--or -e c', ''])
+        self.assertIs(patterns, matcher.compile_patterns(patterns))
+        self.assertEqual(["--or -e c", 'a', 'b', "it's"], patterns.patterns)
+        self.assertEqual(
+            matcher.compile_patterns(["it's", 'a', '--or -e c', 'b'])
+            .fingerprint, patterns.fingerprint)
+        pattern_file_path = patterns.pattern_file_path
+        with open(pattern_file_path) as pattern_file:
+            self.assertEqual("--or -e c\na\nb\nit's\n", pattern_file.read())
+        patterns.close()
+        self.assertFalse(os.path.isfile(pattern_file_path))
 
     def test_clone_or_pull(self):
         repo_class = repo.Repo(
@@ -157,6 +373,698 @@ class TestRepo(testtools.TestCase):
         dicts_num = count_dicts_in_results_file(result_path)
         self.assertTrue(dicts_num > 0)
 
+    def test_search_with_many_patterns(self):
+        repo_class, commits = create_local_repo_instance(self)
+        quoted = ["'s3cr3t'", 'password: "s3cr3t"']
+        expected = get_matches(repo_class._search(['s3cr3t'], commits))
+        self.assertEqual(
+            expected, get_matches(repo_class._search(['s3cr3t'] + quoted,
+                                                     commits)))
+        search_list = ['secret-{0:06d}'.format(i) for i in range(100000)]
+        patterns = matcher.compile_patterns(search_list + ['s3cr3t'])
+        self.assertTrue(patterns.match_in_process)
+        with mock.patch.object(repo_class, '_search_commit') as search_commit:
+            self.assertEqual(
+                expected, get_matches(repo_class._search(patterns, commits)))
+            self.assertFalse(search_commit.called)
+        # A regular expression keeps big lists on git grep
+        patterns = matcher.compile_patterns(
+            ['secret-{0:04d}'.format(i) for i in range(2000)] + ['s3cr.t'])
+        self.assertFalse(patterns.match_in_process)
+        self.assertEqual(
+            expected, get_matches(repo_class._search(patterns, commits)))
+        patterns.close()
+
+    def test_hashed_search_list_isnt_kept_as_plain_text(self):
+        repo_class, commits = create_local_repo_instance(
+            self, match_mode='hashed')
+        org, _ = create_org_instance(
+            self, [], search_list=['s3cr3t'], match_mode='hashed')
+        for instance in (repo_class, org):
+            self.assertFalse(hasattr(instance, 'search_list'))
+            self.assertEqual(1, instance.patterns.hashed_count)
+            self.assertEqual([], instance.patterns.patterns)
+        self.assertEqual(5, len(get_matches(
+            repo_class._search(repo_class.patterns, commits))))
+
+    def test_search_with_hashed_matching(self):
+        repo_class, commits = create_local_repo_instance(self)
+        expected = get_matches(repo_class._search(['s3cr3t'], commits))
+        repo_class.match_mode = 'hashed'
+        self.assertEqual(expected, get_matches(repo_class._search(
+            ['s3cr3t'] + ['secret-{0}'.format(i) for i in range(10000)],
+            commits)))
+
+    def test_search_blobs_matches_search_commits(self):
+        repo_class, commits = create_local_repo_instance(self)
+        by_commit = list(repo_class._search(['s3cr3t', 'impo.t'], commits))
+        repo_class.scan_mode = 'blobs'
+        by_blob = list(repo_class._search(['s3cr3t', 'impo.t'], commits))
+        self.assertEqual(get_matches(by_commit), get_matches(by_blob))
+        self.assertEqual(
+            ['{0}:conf/copy.yaml'.format(commits[0]),
+             '{0}:setup.py'.format(commits[0])], by_commit[0])
+        self.assertEqual([], by_commit[-1])
+
+    def test_search_blobs_matches_search_commits_with_regexes(self):
+        repo_class, commits = create_local_repo_instance(self)
+        for filepath, content in (('a.txt', 'foo|bar'), ('b.txt', 'foobar'),
+                                  ('c.txt', 'ab+c'), ('d.txt', 'abbbc')):
+            commit_file(repo_class.repo_path, filepath, content + '\n',
+                        'Add ' + filepath)
+        commit = git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()
+        # Basic regular expressions, where only `\|` and `\+` are operators
+        search_list = ['foo|bar', 'ab+c', 'ab\\+\\(x\\|c\\)']
+        by_commit = get_matches(repo_class._search(search_list, [commit]))
+        repo_class.scan_mode = 'blobs'
+        by_blob = get_matches(repo_class._search(search_list, [commit]))
+        self.assertEqual(by_commit, by_blob)
+        self.assertEqual(
+            ['{0}:{1}'.format(commit, filepath)
+             for filepath in ('a.txt', 'c.txt', 'd.txt')],
+            by_blob)
+
+    def test_search_multi_line_strings_in_every_mode(self):
+        repo_class, commits = create_local_repo_instance(self)
+        key = '-----BEGIN KEY-----\nMIIEow1AAKCAQ\n\n-----END KEY-----\n'
+        for filepath, content in (('key.pem', key),
+                                  ('begin.txt', '-----BEGIN KEY-----'),
+                                  ('line.txt', 'x = MIIEow1AAKCAQ'),
+                                  ('other.txt', 'MIIEow1')):
+            commit_file(repo_class.repo_path, filepath, content + '\n',
+                        'Add ' + filepath)
+        commit = git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()
+        patterns = matcher.compile_patterns([key])
+        self.assertEqual(
+            ['-----BEGIN KEY-----', '-----END KEY-----', 'MIIEow1AAKCAQ'],
+            patterns.patterns)
+        expected = ['{0}:{1}'.format(commit, filepath)
+                    for filepath in ('begin.txt', 'key.pem', 'line.txt')]
+        self.assertEqual(
+            expected, get_matches(repo_class._search([key], [commit])))
+        repo_class.scan_mode = 'blobs'
+        self.assertEqual(
+            expected, get_matches(repo_class._search([key], [commit])))
+        repo_class.match_mode = 'hashed'
+        repo_class.scanned_objects.clear()
+        self.assertEqual(
+            expected, get_matches(repo_class._search([key], [commit])))
+
+    def test_search_with_entropy_detector(self):
+        repo_class, commits = create_local_repo_instance(
+            self, detectors=['entropy'])
+        commit_file(repo_class.repo_path, 'conf/key.pem',
+                    'key: 9Tz2Qk7WmX4rB1vLc8YdN3pHs6JgE0aF5uKo\n', 'Add key')
+        commit = git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()
+        results = list(repo_class._search(['s3cr3t'], [commit] + commits))
+        self.assertEqual(
+            ['{0}:conf/copy.yaml'.format(commit),
+             ('{0}:conf/key.pem'.format(commit), 'entropy')],
+            [match for match in get_matches(results)
+             if commit in (match[0] if isinstance(match, tuple) else match)])
+        repo_class._write_results(results)
+        records = json.loads(repo_class.results_store.dump())['_default']
+        self.assertEqual(
+            ['entropy'] + ['search_list'] * 6,
+            sorted(record['detector'] for record in records.values()))
+
+    def test_search_with_detector_adds_to_plain_search(self):
+        repo_class, commits = create_local_repo_instance(self)
+        for filepath, content in (
+                ('a.txt', 'foo|bar'), ('b.txt', 'foobar'),
+                ('c.txt', 'key: 9Tz2Qk7WmX4rB1vLc8YdN3pHs6JgE0aF5uKo')):
+            commit_file(repo_class.repo_path, filepath, content + '\n',
+                        'Add ' + filepath)
+        commits = [git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()] + \
+            commits
+        search_list = ['foo|bar', 'impo.t', 'ab\\|s3cr3t']
+        plain = get_matches(repo_class._search(search_list, commits))
+        repo_class.detectors = ['entropy']
+        with_detector = get_matches(repo_class._search(search_list, commits))
+        self.assertEqual(plain, [match for match in with_detector
+                                 if not isinstance(match, tuple)])
+        self.assertIn(('{0}:c.txt'.format(commits[0]), 'entropy'),
+                      with_detector)
+
+    def test_search_only_with_detectors(self):
+        repo_class, commits = create_local_repo_instance(
+            self, detectors=['entropy'])
+        repo_class.patterns = None
+        with mock.patch.object(repo_class, 'fetch'):
+            repo_class.search([])
+        self.assertEqual(0, repo_class.result_count)
+
+    def test_search_skips_oversized_and_binary_files(self):
+        for scan_mode in ('commits', 'blobs'):
+            repo_class, commits = create_local_repo_instance(
+                self, scan_mode=scan_mode, max_blob_size='1K',
+                skip_binary=True)
+            commit_file(repo_class.repo_path, 'data/dump.sql',
+                        'password: s3cr3t\n' * 100, 'Add dump')
+            commit_file(repo_class.repo_path, 'logo.PNG',
+                        '\x89PNG s3cr3t', 'Add logo')
+            commit_file(repo_class.repo_path, 'data/blob.dat',
+                        's3cr3t\0', 'Add binary')
+            commit = git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()
+            results = list(repo_class._search(['s3cr3t'], [commit]))
+            self.assertEqual([['{0}:conf/copy.yaml'.format(commit)]],
+                             results, scan_mode)
+            self.assertEqual((1, 1700),
+                             repo_class.skipped_blobs['oversized'])
+            # Both modes scan blobs, so binary content is counted too
+            self.assertEqual((2, 18), repo_class.skipped_blobs['binary'])
+
+    def test_search_with_path_filters(self):
+        for scan_mode in ('commits', 'blobs'):
+            repo_class, commits = create_local_repo_instance(
+                self, scan_mode=scan_mode, include_paths=['*.yaml', '*.js'],
+                exclude_paths=['node_modules/', 'copy.yaml'])
+            commit_file(repo_class.repo_path, 'node_modules/lib/index.js',
+                        's3cr3t', 'Add dependency')
+            commit_file(repo_class.repo_path, 'web/app.js', 's3cr3t',
+                        'Add app')
+            commit_file(repo_class.repo_path, 'web/app.md', 's3cr3t',
+                        'Add docs')
+            commit = git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()
+            self.assertEqual(
+                [['{0}:web/app.js'.format(commit)]],
+                list(repo_class._search(['s3cr3t'], [commit])), scan_mode)
+        # The excluded directory isn't even read
+        self.assertNotIn('node_modules', [
+            path for _, path in repo_class.trees_cache])
+
+    def test_get_all_blobs_deduplicates_blobs(self):
+        repo_class, commits = create_local_repo_instance(self)
+        blobs = repo_class._get_all_blobs(commits)
+        # Two different settings.yaml versions, readme, setup.py and the
+        # copy which is identical to the first settings.yaml
+        self.assertEqual(4, len(blobs))
+        self.assertEqual([False] * 4, list(blobs.values()))
+
+    def test_search_blobs_locates_only_matching_blobs(self):
+        repo_class, commits = create_local_repo_instance(
+            self, scan_mode='blobs')
+        with mock.patch.object(repo_class, '_locate_blobs',
+                               wraps=repo_class._locate_blobs) as locate:
+            results = list(repo_class._search(['s3cr3t'], commits))
+        self.assertEqual(5, sum(len(matches) for matches in results))
+        # Only the id of the matching blob, in two files, is looked up in
+        # the trees
+        self.assertEqual(1, len(locate.call_args[0][1]))
+
+    def test_parallel_search_is_deterministic(self):
+        repo_class, commits = create_local_repo_instance(self)
+        serial = list(repo_class._search(['s3cr3t', 'import'], commits))
+        repo_class.jobs = 3
+        self.assertEqual(serial, list(
+            repo_class._search(['s3cr3t', 'import'], commits)))
+        repo_class.scan_mode = 'blobs'
+        repo_class.jobs = 1
+        serial = list(repo_class._search(['s3cr3t', 'import'], commits))
+        repo_class.jobs = 3
+        repo_class.scanned_objects.clear()
+        self.assertEqual(get_matches(serial), get_matches(
+            repo_class._search(['s3cr3t', 'import'], commits)))
+        self.assertTrue(repo_class.scan_speedup > 0)
+
+    def test_get_commits_details(self):
+        repo_class, commits = create_local_repo_instance(self)
+        details = repo_class._get_commits_details(commits[:2])
+        self.assertEqual(set(commits[:2]), set(details))
+        username, email, commit_time = details[commits[0]]
+        self.assertEqual(('surch', 'surch@surch.com'), (username, email))
+        self.assertEqual(5, len(commit_time.split()))
+        self.assertNotIn('+', commit_time)
+        self.assertEqual(git(repo_class.repo_path, 'log', '-1',
+                             '--format=%ad').rsplit(' ', 1)[0], commit_time)
+
+    def test_object_reader_pool(self):
+        repo_class, commits = create_local_repo_instance(self)
+        ls_tree = git(repo_class.repo_path, 'ls-tree', '-r', commits[0])
+        self.assertEqual(
+            [tuple(line.split()[2:]) for line in ls_tree.splitlines()],
+            repo_class._list_tree(commits[0]))
+        repo_class._list_tree(commits[1])
+        # Only subtrees are cached, i.e. the two versions of conf/
+        self.assertEqual(2, len(repo_class.trees_cache))
+        with repo_class.object_readers.reader() as reader:
+            self.assertEqual('commit', reader.read_header(commits[0])[0])
+            self.assertEqual((None, None), reader.read('0' * 40))
+        self.assertEqual(1, len(repo_class.object_readers._readers))
+        repo_class.object_readers.close()
+
+    def test_write_results_uses_commits_details(self):
+        repo_class, commits = create_local_repo_instance(self)
+        results = list(repo_class._search(['s3cr3t'], commits))
+        with mock.patch.object(repo.subprocess, 'check_output') as show:
+            repo_class._write_results(results)
+            self.assertFalse(show.called)
+        self.assertEqual(5, repo_class.result_count)
+        self.assertEqual(set(commits[:4]), set(repo_class.commits_details))
+
+    def test_write_results_to_sqlite_store(self):
+        repo_class, commits = create_local_repo_instance(
+            self, results_store='sqlite')
+        self.assertTrue(repo_class.results_file_path.endswith('results.db'))
+        repo_class._write_results(repo_class._search(['s3cr3t'], commits))
+        results_store = store.open_store(repo_class.results_file_path)
+        self.assertIsInstance(results_store, store.SQLiteStore)
+        self.assertEqual(5, results_store.count())
+        results = json.loads(results_store.dump())
+        self.assertEqual('conf/copy.yaml', results[0]['filepath'])
+        self.assertEqual('local', results[0]['repository_name'])
+
+    def test_sqlite_store_adds_missing_fields(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        path = os.path.join(work_dir, 'results.db')
+        db = store.sqlite3.connect(path)
+        db.execute('CREATE TABLE results (id INTEGER PRIMARY KEY, {0})'.format(
+            ', '.join('{0} TEXT'.format(field)
+                      for field in store.RESULT_FIELDS[:-1])))
+        db.close()
+        results_store = store.SQLiteStore(path)
+        results_store.insert_many([dict(filepath='a', detector='entropy')])
+        self.assertEqual('entropy', json.loads(
+            results_store.dump())[0]['detector'])
+
+    def test_sqlite_store_connects_once(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        results_store = store.SQLiteStore(os.path.join(work_dir, 'results.db'))
+        results_store.batch_size = 10
+        with mock.patch.object(store.sqlite3, 'connect',
+                               wraps=store.sqlite3.connect) as connect:
+            with mock.patch.object(results_store, '_migrate',
+                                   wraps=results_store._migrate) as migrate:
+                results_store.insert_many(
+                    dict(filepath=str(index)) for index in range(35))
+                results_store.insert_many([dict(filepath='35')])
+        self.assertEqual(2, connect.call_count)
+        self.assertEqual(1, migrate.call_count)
+        self.assertEqual(36, results_store.count())
+
+    def test_write_results_to_tinydb_store_in_one_write(self):
+        repo_class, commits = create_local_repo_instance(self)
+        with mock.patch('tinydb.database.Table.insert') as insert:
+            repo_class._write_results(
+                list(repo_class._search(['s3cr3t'], commits)))
+            self.assertFalse(insert.called)
+        self.assertEqual(5, count_dicts_in_results_file(
+            repo_class.results_file_path))
+
+    def test_write_results_to_jsonl_store_while_scanning(self):
+        for results_store in ('jsonl', 'jsonl.gz'):
+            repo_class, commits = create_local_repo_instance(
+                self, results_store=results_store)
+            repo_class.results_store.flush_every = 1
+            results_file_path = repo_class.results_file_path
+            self.assertTrue(results_file_path.endswith(
+                'results.{0}'.format(results_store)))
+            written_while_scanning = []
+
+            def search_commit(commit, search_string):
+                written_while_scanning.append(
+                    store.open_store(results_file_path).count())
+                return repo.Repo._search_commit(
+                    repo_class, commit, search_string)
+
+            with mock.patch.object(repo_class, '_search_commit',
+                                   search_commit):
+                repo_class._write_results(
+                    repo_class._search(['s3cr3t'], commits))
+            self.assertEqual([0, 1, 3, 4, 5], written_while_scanning)
+            results_store = store.open_store(results_file_path)
+            self.assertEqual(5, results_store.count())
+            results = [json.loads(line)
+                       for line in results_store.dump().splitlines()]
+            self.assertEqual('conf/copy.yaml', results[0]['filepath'])
+
+    def test_write_results_to_jsonl_store_while_scanning_blobs(self):
+        repo_class, commits = create_local_repo_instance(
+            self, scan_mode='blobs', results_store='jsonl')
+        repo_class.results_store.flush_every = 1
+        written_while_scanning = []
+        original_grep_blobs = repo.grep_blobs
+
+        def grep_blobs(*args, **kwargs):
+            written_while_scanning.append(repo_class.results_store.count())
+            return original_grep_blobs(*args, **kwargs)
+
+        with mock.patch.object(repo, 'grep_blobs', grep_blobs):
+            repo_class._write_results(
+                repo_class._search(['s3cr3t'], commits))
+        # Every chunk holds one of the 4 blobs, the second one matching
+        self.assertEqual([0, 0, 5, 5], written_while_scanning)
+
+    def test_jsonl_store_flushes_while_waiting_for_results(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        results_store = store.JSONLinesStore(
+            os.path.join(work_dir, 'results.jsonl'))
+        results_store.flush_interval = 0.05
+        written_while_waiting = []
+
+        def results():
+            yield dict(filepath='a')
+            # Waiting for the next result, e.g. while scanning a big repo
+            deadline = time.time() + 5
+            while not results_store.count() and time.time() < deadline:
+                time.sleep(0.01)
+            written_while_waiting.append(results_store.count())
+            yield dict(filepath='b')
+
+        results_store.insert_many(results())
+        self.assertEqual([1], written_while_waiting)
+        self.assertEqual(2, results_store.count())
+
+    def test_incremental_scan(self):
+        repo_class, remote_path = create_cloned_repo_instance(
+            self, incremental=True)
+        repo_class.scan(['s3cr3t'])
+        self.assertEqual((5, 5), (repo_class.commits, repo_class.result_count))
+
+        commit_file(remote_path, 'conf/new.yaml', 'password: s3cr3t\n',
+                    'Add new settings')
+        repo_class.fetch()
+        repo_class.scan(['s3cr3t'])
+        self.assertEqual((1, 7), (repo_class.commits, repo_class.result_count))
+
+        repo_class.fetch()
+        repo_class.scan(['s3cr3t'])
+        self.assertEqual((0, 7), (repo_class.commits, repo_class.result_count))
+
+        # A different search list rescans everything
+        repo_class.scan(['s3cr3t', 'changed'])
+        self.assertEqual(6, repo_class.commits)
+
+    def test_get_all_commits_of_selected_refs(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        remote_path = os.path.join(work_dir, 'remotes', 'local')
+        create_local_repo(remote_path)
+        git(remote_path, 'checkout', '-q', '-b', 'feature', 'HEAD~2')
+        commit_file(remote_path, 'feature.py', 'import sys\n', 'Feature')
+        git(remote_path, 'tag', '-a', '-m', 'v1', 'v1', 'master~3')
+        orphan = git(remote_path, 'commit-tree', 'HEAD^{tree}',
+                     '-m', 'Orphan').strip()
+        git(remote_path, 'tag', 'orphan', orphan)
+        git(remote_path, 'tag', 'tree', 'HEAD^{tree}')
+
+        for refs, commit_count in ((None, 7),
+                                   (['branches'], 6),
+                                   ('tags', 3),
+                                   (['refs/remotes/origin/feature'], 4),
+                                   (['refs/tags/v*', 'tags'], 3)):
+            repo_class = repo.Repo(
+                repo_url=remote_path,
+                search_list=['s3cr3t'],
+                refs=refs,
+                results_dir=os.path.join(work_dir, 'results'),
+                cloned_repo_dir=os.path.join(work_dir, 'clones'))
+            repo_class.fetch()
+            commits = repo_class._get_all_commits()
+            self.assertEqual(commit_count, len(commits))
+            self.assertEqual(commit_count, len(set(commits)))
+            self.assertEqual(commit_count, repo_class.commits)
+
+    def test_mirror_clone_and_fetch(self):
+        repo_class, remote_path = create_cloned_repo_instance(
+            self, mirror=True)
+        self.assertTrue(repo_class.repo_path.endswith('local.git'))
+        self.assertEqual('true', git(
+            repo_class.repo_path, 'rev-parse', '--is-bare-repository').strip())
+        git(remote_path, 'checkout', '-q', '-b', 'feature')
+        commit_file(remote_path, 'feature.yaml', 'password: s3cr3t\n',
+                    'Feature')
+        # Diverge master from the mirror
+        git(remote_path, 'checkout', '-q', 'master')
+        git(remote_path, 'reset', '-q', '--hard', 'HEAD~1')
+        commit_file(remote_path, 'other.py', 'import re\n', 'Other')
+        git(remote_path, 'tag', 'v1', 'feature')
+        # Like GitHub's pull request refs, which aren't scanned
+        git(remote_path, 'update-ref', 'refs/pull/1/head', 'feature')
+        repo_class.fetch()
+        self.assertEqual([], repo_class.error_summary)
+        self.assertEqual(
+            ['refs/heads/feature', 'refs/heads/master', 'refs/tags/v1'],
+            git(repo_class.repo_path, 'for-each-ref',
+                '--format=%(refname)').split())
+        repo_class.scan(['s3cr3t'])
+        self.assertEqual(7, repo_class.commits)
+        # The original 5 results, copy.yaml and feature.yaml on feature,
+        # copy.yaml and settings.yaml on the rewritten master
+        self.assertEqual(9, repo_class.result_count)
+
+    def test_pack_object_reader(self):
+        repo_class, commits = create_local_repo_instance(self)
+        lines = ['line {0}\n'.format(i) for i in range(200)]
+        for i in range(5):
+            lines[i * 40] = 'password: s3cr3t{0}\n'.format(i)
+            commit_file(repo_class.repo_path, 'conf/big.yaml', ''.join(lines),
+                        'Big {0}'.format(i))
+        for use_offsets in ('true', 'false'):
+            git(repo_class.repo_path, '-c',
+                'repack.useDeltaBaseOffset={0}'.format(use_offsets),
+                'repack', '-a', '-d', '-f', '-q')
+            all_objects = git(
+                repo_class.repo_path, 'cat-file', '--batch-all-objects',
+                '--batch-check').splitlines()
+            with packs.PackObjectReader(repo_class.repo_path) as reader:
+                with objects.ObjectReader(repo_class.repo_path) as git_reader:
+                    for line in all_objects:
+                        sha, object_type, size = line.split()
+                        self.assertEqual((object_type, int(size)),
+                                         reader.read_header(sha))
+                        self.assertEqual(git_reader.read(sha),
+                                         reader.read(sha))
+                self.assertEqual(0, reader.fallback_count)
+        # Loose objects are read through git
+        commit_file(repo_class.repo_path, 'loose.txt', 's3cr3t\n', 'Loose')
+        loose_commit = git(repo_class.repo_path, 'rev-parse', 'HEAD').strip()
+        with packs.PackObjectReader(repo_class.repo_path) as reader:
+            self.assertEqual('commit', reader.read(loose_commit)[0])
+            self.assertEqual((None, None), reader.read('0' * 40))
+            self.assertEqual(2, reader.fallback_count)
+
+    def test_search_blobs_with_packs_backend(self):
+        repo_class, commits = create_local_repo_instance(
+            self, scan_mode='blobs')
+        git(repo_class.repo_path, 'gc', '-q')
+        results = []
+        for object_backend in constants.OBJECT_BACKENDS:
+            repo_class.object_backend = object_backend
+            repo_class.object_readers = objects.ObjectReaderPool(
+                repo_class.repo_path, repo.OBJECT_READERS[object_backend])
+            repo_class.trees_cache.clear()
+            repo_class.scanned_objects.clear()
+            results.append(list(repo_class._search(['s3cr3t'], commits)))
+            repo_class.object_readers.close()
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(5, sum(len(matches) for matches in results[1]))
+
+    def test_unknown_scan_mode(self):
+        result = self.assertRaises(
+            SystemExit, repo.Repo, repo_url='', search_list=['a'],
+            scan_mode='files')
+        self.assertEqual('1', str(result))
+
+
+class TestMatcher(testtools.TestCase):
+    def test_is_literal(self):
+        self.assertTrue(matcher.is_literal('s3cr3t'))
+        # Not a valid regular expression
+        self.assertTrue(matcher.is_literal('pass[word'))
+        self.assertTrue(matcher.is_literal('ab+c'))
+        self.assertFalse(matcher.is_literal('impo.t'))
+        self.assertFalse(matcher.is_literal('ab\\+c'))
+
+    def test_bre_to_python(self):
+        self.assertEqual(r'foo\|ab\+c', matcher.bre_to_python('foo|ab+c'))
+        self.assertEqual('(a|b)+', matcher.bre_to_python(r'\(a\|b\)\+'))
+        self.assertEqual('a{1,2}', matcher.bre_to_python(r'a\{1,2\}'))
+        self.assertEqual(r'\*a*$', matcher.bre_to_python('*a*$'))
+        self.assertEqual(r'x\^[0-9][^\]a\n]',
+                         matcher.bre_to_python('x^[[:digit:]][^]a]'))
+
+    def test_escaped_search_strings_are_literals(self):
+        # As read from Vault, escaped by `escape`, or by `re.escape` which
+        # escapes `-`, `_` and `/` too
+        secrets = ['s3-cr3t_x/y', 'AKIA/abc-def==', 'p@ss.w*rd']
+        for escape in (re.escape, matcher.escape):
+            search_list = [escape(secret) for secret in secrets]
+            self.assertEqual(
+                secrets, [matcher.get_literal(item) for item in search_list])
+            search_matcher = matcher.Matcher(search_list)
+            self.assertEqual(sorted(secrets), search_matcher.literals)
+            self.assertEqual([], search_matcher.regexes)
+            self.assertTrue(search_matcher.search('key: p@ss.w*rd'))
+            self.assertFalse(search_matcher.search('key: p@ssXw*rd'))
+        # `\+` is still an operator, but not `+` escaped by `escape`
+        self.assertEqual('ab+c', matcher.get_literal(matcher.escape('ab+c')))
+        self.assertIsNone(matcher.get_literal(re.escape('ab+c')))
+
+    def test_aho_corasick_overlapping_literals(self):
+        automaton = matcher.AhoCorasick(['he', 'she', 'hers', 'abcd'])
+        self.assertTrue(automaton.search('ushers'))
+        self.assertTrue(automaton.search('xxabcabcdxx'))
+        self.assertFalse(automaton.search('abcabxsh'))
+        # Found through the failure link of 'bce' to 'ce'
+        self.assertTrue(matcher.AhoCorasick(['bcd', 'ce']).search('bce'))
+
+    def test_matcher_combines_literals_and_regexes(self):
+        search_matcher = matcher.Matcher(
+            [u's3cr3t', 'pass[word', 'impo.t'])
+        self.assertEqual(['pass[word', 's3cr3t'], search_matcher.literals)
+        self.assertEqual(['impo.t'], search_matcher.regexes)
+        self.assertTrue(search_matcher.search('password: s3cr3t'))
+        self.assertTrue(search_matcher.search('my pass[word'))
+        self.assertTrue(search_matcher.search('import os'))
+        self.assertFalse(search_matcher.search('password'))
+
+    def test_matcher_with_many_literals(self):
+        search_list = ['secret-{0:05d}'.format(i) for i in range(10000)]
+        search_matcher = matcher.Matcher(search_list)
+        self.assertTrue(search_matcher.search('key = secret-09999;'))
+        self.assertFalse(search_matcher.search('key = secret-1;'))
+
+    def test_matcher_combines_few_literals_without_pyahocorasick(self):
+        with mock.patch.object(matcher, 'ahocorasick', None):
+            search_matcher = matcher.Matcher(['s3cr3t', 'a.b\\.c'])
+            self.assertIsNone(search_matcher.automaton)
+            self.assertTrue(search_matcher.search('password: s3cr3t'))
+            self.assertTrue(search_matcher.search('aXb.c'))
+            self.assertFalse(search_matcher.search('aXbXc'))
+            search_matcher = matcher.Matcher(
+                ['secret-{0}'.format(i)
+                 for i in range(matcher.MAX_REGEX_LITERALS + 1)])
+            self.assertIsInstance(search_matcher.automaton,
+                                  matcher.AhoCorasick)
+            self.assertEqual([], search_matcher.regex_list)
+
+    def test_hashed_matcher(self):
+        hashed_matcher = matcher.HashedMatcher(['s3cr3t', 'abc=='])
+        self.assertNotIn('s3cr3t', repr(vars(hashed_matcher)))
+        self.assertTrue(hashed_matcher.search('password: s3cr3t\n'))
+        self.assertTrue(hashed_matcher.search('password="s3cr3t";'))
+        self.assertTrue(hashed_matcher.search('PASSWORD=s3cr3t'))
+        self.assertTrue(hashed_matcher.search('key:abc=='))
+        # Only whole tokens match
+        self.assertFalse(hashed_matcher.search('password: s3cr3ts'))
+        self.assertFalse(hashed_matcher.search('abc'))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom_filter = matcher.BloomFilter(10000)
+        items = ['secret-{0}'.format(i) for i in range(10000)]
+        for item in items:
+            bloom_filter.add(item)
+        self.assertTrue(all(item in bloom_filter for item in items))
+        false_positives = sum(1 for i in range(10000)
+                              if 'other-{0}'.format(i) in bloom_filter)
+        self.assertTrue(false_positives < 300)
+
+    def test_hashed_pattern_set(self):
+        patterns = matcher.compile_patterns(
+            ['s3cr3t', 'two words', 'impo.t'], hashed=True)
+        self.assertEqual(['impo.t', 'two words'], patterns.patterns)
+        self.assertEqual(3, len(patterns))
+        self.assertTrue(patterns.match_in_process)
+        self.assertNotEqual(
+            matcher.compile_patterns(['s3cr3t', 'two words', 'impo.t'])
+            .fingerprint, patterns.fingerprint)
+        self.assertTrue(patterns.matcher.search('key = s3cr3t'))
+        self.assertTrue(patterns.matcher.search('two words'))
+        self.assertTrue(patterns.matcher.search('import os'))
+        self.assertFalse(patterns.matcher.search('s3cr3tive'))
+
+    def test_hashed_pattern_set_with_escaped_secrets(self):
+        secrets = ['s3-cr3t/{0}'.format(index) for index in range(10)]
+        with mock.patch.object(matcher.utils.logger, 'warn') as warn:
+            patterns = matcher.compile_patterns(
+                [matcher.escape(secret) for secret in secrets] +
+                ['impo.t', 'two words'], hashed=True)
+        self.assertEqual(['impo.t', 'two words'], patterns.patterns)
+        self.assertEqual(10, patterns.hashed_count)
+        self.assertIn('2 search strings', warn.call_args[0][0])
+        self.assertNotIn('s3-cr3t', repr(vars(patterns.matcher)))
+        self.assertTrue(patterns.matcher.search('key: s3-cr3t/9'))
+        self.assertFalse(patterns.matcher.search('key: s3-cr3t/10'))
+
+
+class TestDetectors(testtools.TestCase):
+    keys = ('9Tz2Qk7WmX4rB1vLc8YdN3pHs6JgE0aF5uKo',
+            'aws_secret = "wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY"',
+            'api_key: 3f5f01f0c2a94e9ab7d1e5c8b0f64a2d')
+    not_keys = ('import os\n',
+                # Git object names
+                'sha: 3f5f01f0c2a94e9ab7d1e5c8b0f64a2d97e31c55',
+                'https://github.com/surch-test/local/blob/'
+                '3f5f01f0c2a94e9ab7d1e5c8b0f64a2d97e31c55/README.md',
+                'sha256 3f5f01f0c2a94e9ab7d1e5c8b0f64a2d'
+                '97e31c55e8d1b4a7c06f92e3d5b18a47',
+                'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+                'surch/tests/config/test_config_with_all_plugins.yaml',
+                'TestSurchRepoCommandWithArgumentsAndFoundResults',
+                'a' * 100 + '0')
+
+    def test_entropy_detector(self):
+        detector = detectors.EntropyDetector()
+        for key in self.keys:
+            self.assertTrue(detector.search(key), key)
+        for content in self.not_keys:
+            self.assertFalse(detector.search(content), content)
+
+    def test_entropy_detector_without_numpy(self):
+        detector = detectors.EntropyDetector()
+        contents = self.keys + self.not_keys + (
+            ' '.join(self.keys * 1000), '', 'short')
+        for content in contents:
+            for charset in detectors.CHARSETS:
+                runs = charset.get_runs(content)
+                self.assertAlmostEqual(
+                    detector._get_max_entropy_numpy(runs, charset, None),
+                    detector._get_max_entropy_python(runs, charset, None))
+        with mock.patch.object(detectors, 'numpy', None):
+            detector = detectors.EntropyDetector()
+            for key in self.keys:
+                self.assertTrue(detector.search(key), key)
+            for content in self.not_keys:
+                self.assertFalse(detector.search(content), content)
+
+
+class TestPaths(testtools.TestCase):
+    def test_path_glob(self):
+        glob = paths.PathGlob('*.min.js')
+        self.assertTrue(glob.match('app.min.js'))
+        self.assertTrue(glob.match('static/js/app.min.js'))
+        self.assertFalse(glob.match('app.js'))
+        glob = paths.PathGlob('node_modules/')
+        self.assertTrue(glob.match('node_modules/lib/index.js'))
+        self.assertTrue(glob.match('web/node_modules/index.js'))
+        self.assertFalse(glob.match('node_modules'))
+        glob = paths.PathGlob('docs/*.md')
+        self.assertTrue(glob.match('docs/index.md'))
+        self.assertFalse(glob.match('docs/api/index.md'))
+        self.assertFalse(glob.match('web/docs/index.md'))
+        glob = paths.PathGlob('docs/**/*.md')
+        self.assertTrue(glob.match('docs/index.md'))
+        self.assertTrue(glob.match('docs/api/index.md'))
+
+    def test_path_filter(self):
+        path_filter = paths.PathFilter(['src/'], ['vendor', '*.min.js'])
+        self.assertTrue(path_filter.match('src/app.js'))
+        self.assertFalse(path_filter.match('setup.py'))
+        self.assertFalse(path_filter.match('src/vendor/lib.js'))
+        self.assertFalse(path_filter.match('src/app.min.js'))
+        self.assertTrue(path_filter.excludes_directory('src/vendor'))
+        self.assertFalse(path_filter.excludes_directory('src'))
+        self.assertEqual(
+            [':(glob)**/src/**',
+             ':(exclude,glob)**/vendor', ':(exclude,glob)**/vendor/**',
+             ':(exclude,glob)**/*.min.js', ':(exclude,glob)**/*.min.js/**'],
+            path_filter.get_pathspecs())
+        self.assertFalse(paths.PathFilter())
+
 
 class TestUtils(testtools.TestCase):
     def test_read_config_file(self):
@@ -168,6 +1076,64 @@ class TestUtils(testtools.TestCase):
             success = False
         self.assertTrue(success)
 
+    def test_load_config(self):
+        config_file_path = os.path.join(path, 'config/plugin_conf.yaml')
+        settings = utils.load_config(config_file_path)
+        self.assertEqual(config_file_path, settings.path)
+        self.assertEqual(('string-1', 'string-1'), settings.search_list)
+        self.assertEqual('secret_path', settings['vault'].secret_path)
+        self.assertIs(settings, utils.load_config(settings))
+        self.assertRaises(AttributeError, setattr, settings, 'verbose', True)
+
+        def set_item():
+            settings['verbose'] = True
+        self.assertRaises(TypeError, set_item)
+        self.assertIsNone(settings.get('organization'))
+
+    def test_load_invalid_config(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        config_file_path = os.path.join(work_dir, 'config.yaml')
+        for content in ('jobs: 0', 'detectors: [unknown]', 'mirror: maybe',
+                        'search_list: s3cr3t: [', 'max_blob_size: big',
+                        'vault: {vault_url: http://localhost:8200}',
+                        '[s3cr3t]'):
+            with open(config_file_path, 'w') as config_file:
+                config_file.write(content)
+            self.assertRaises(SystemExit, utils.load_config, config_file_path)
+        with open(config_file_path, 'w') as config_file:
+            config_file.write('max_blob_size: 10M\nsearch_list: s3cr3t')
+        settings = utils.load_config(config_file_path)
+        self.assertEqual(('s3cr3t',), settings.search_list)
+
+    @mock.patch('surch.plugins.vault.get_search_list',
+                mock.Mock(return_value=['v4ult']))
+    @mock.patch('surch.plugins.pagerduty.trigger')
+    def test_config_file_is_read_once(self, trigger):
+        settings = utils.load_config(
+            os.path.join(path, 'config/plugin_conf.yaml'))
+        with mock.patch.object(config.yaml, 'safe_load',
+                               side_effect=AssertionError):
+            search_list = handler.merge_all_search_list(
+                ['vault'], settings, ['s3cr3t'])
+            conf_vars = utils.read_config_file(settings)
+            handler.pagerduty_trigger(config_file=settings, log='results')
+        self.assertEqual(['v4ult', 's3cr3t', 'string-1', 'string-1'],
+                         search_list)
+        self.assertIs(settings, conf_vars['config_file'])
+        trigger.assert_called_once_with(
+            results_file_path='results', api_key='zOjKTFAIRSufjZeAExYD',
+            service_key='qq6ed4o6ytle6ohmusmhtm41n3fuihef')
+
+    def test_parse_size(self):
+        self.assertIsNone(utils.parse_size(None))
+        self.assertEqual(100, utils.parse_size(100))
+        self.assertEqual(100, utils.parse_size('100'))
+        self.assertEqual(512 * 1024, utils.parse_size('512k'))
+        self.assertEqual(10 * 1024 ** 2, utils.parse_size('10M'))
+        self.assertEqual('1.5M', utils.format_size(1536 * 1024))
+        self.assertRaises(SystemExit, utils.parse_size, 'big')
+
     def test_remove_folder(self):
         if not os.path.isdir(test_path):
             os.makedirs(test_path)
@@ -189,6 +1155,27 @@ class TestUtils(testtools.TestCase):
             os.remove('{0}.json.surch'.format(test_path))
         self.assertTrue(success)
 
+    def test_parallel_map_keeps_order(self):
+        results, speedup = utils.parallel_map(
+            lambda item: item * 2, range(20), jobs=4)
+        self.assertEqual([item * 2 for item in range(20)], results)
+        self.assertTrue(speedup > 0)
+
+    def test_parallel_map_speedup_excludes_consumer_time(self):
+        def func(item):
+            time.sleep(0.02)
+            return item
+
+        for jobs in (1, 4):
+            results = utils.ParallelMap(func, range(8), jobs=jobs)
+            for _ in results:
+                # A slow consumer, e.g. writing the results
+                time.sleep(0.05)
+            # Serially, the speedup is 1 however slow the consumer is
+            self.assertTrue(results.speedup > 0.8)
+        self.assertEqual(3, utils._get_covered_time(
+            [(10, 12), (11, 12), (11.5, 11.6), (14, 15)]))
+
     def test_check_if_executable_exists_else_exit(self):
         result = self.assertRaises(
             SystemExit, utils.check_if_executable_exists_else_exit,
@@ -282,6 +1269,256 @@ class TestOrg(testtools.TestCase):
         result = _invoke_click('surch_org', [self.args], opts)
         self.assertEqual(1, result.exit_code)
 
+    def test_search_repos_continues_after_repo_failure(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        remote_path = os.path.join(work_dir, 'remotes', 'local')
+        create_local_repo(remote_path)
+        org = organization.Organization(
+            organization='surch-test',
+            clone_jobs=2,
+            scan_jobs=2,
+            results_dir=os.path.join(work_dir, 'results'),
+            cloned_repos_dir=os.path.join(work_dir, 'clones'))
+        repos = [org._init_repo(repo_url, ['s3cr3t']) for repo_url in
+                 (os.path.join(work_dir, 'remotes', 'missing'), remote_path)]
+        errors = org._search_repos(repos, ['s3cr3t'])
+        self.assertEqual(1, len(errors))
+        self.assertIn('missing', errors[0])
+        self.assertEqual(5, repos[1].result_count)
+        self.assertEqual(5, count_dicts_in_results_file(
+            os.path.join(work_dir, 'results', 'results.json')))
+
+    def test_search_repos_with_shared_objects(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        remote_path = os.path.join(work_dir, 'remotes', 'local')
+        fork_path = os.path.join(work_dir, 'remotes', 'fork')
+        create_local_repo(remote_path)
+        subprocess.check_call(['git', 'clone', '-q', remote_path, fork_path])
+        commit_file(fork_path, 'fork.yaml', 'password: s3cr3t\n', 'Fork')
+        org = organization.Organization(
+            organization='surch-test',
+            shared_objects=True,
+            results_dir=os.path.join(work_dir, 'results'),
+            cloned_repos_dir=os.path.join(work_dir, 'clones'))
+        repos = [org._init_repo(repo_url, ['s3cr3t'])
+                 for repo_url in (remote_path, fork_path)]
+        search_commit = repo.Repo._search_commit
+        with mock.patch.object(repo.Repo, '_search_commit', autospec=True,
+                               side_effect=search_commit) as mocked:
+            self.assertEqual([], org._search_repos(repos, ['s3cr3t']))
+        # The 5 commits of the fork which are also in local are scanned once
+        self.assertEqual(6, mocked.call_count)
+        self.assertEqual(5, repos[0].result_count)
+        self.assertEqual(7, repos[1].result_count)
+        for repo_instance in repos:
+            with open(os.path.join(repo_instance.repo_path, '.git', 'objects',
+                                   'info', 'alternates')) as alternates:
+                self.assertEqual(os.path.join(org.objects_dir, 'objects'),
+                                 alternates.read().strip())
+        shared_refs = git(org.objects_dir, 'for-each-ref',
+                          '--format=%(refname)')
+        self.assertIn('refs/surch/local/remotes/origin/master', shared_refs)
+        self.assertIn('refs/surch/fork/remotes/origin/master', shared_refs)
+
+    def test_get_all_repos_list_fetches_pages_concurrently(self):
+        org, stand_in = create_org_instance(self, create_repos_data(250))
+        with mock.patch.object(github.ThreadPool, 'map',
+                               autospec=True,
+                               side_effect=github.ThreadPool.map) as pool_map:
+            repos = org._get_all_repos_list()
+        self.assertEqual(['repo-{0}'.format(index) for index in range(250)],
+                         [data['name'] for data in repos])
+        self.assertEqual(
+            ['https://github.com/surch-test/repo-0.git'],
+            [data['clone_url'] for data in repos[:1]])
+        # The pages after the first one are fetched together
+        self.assertEqual(1, pool_map.call_count)
+        self.assertEqual(['1', '2', '3'], sorted(
+            urlparse.parse_qs(request.partition('?')[2]).get('page', ['1'])[0]
+            for request in stand_in.requests))
+
+    def test_get_all_repos_list_with_exact_pages(self):
+        for count in (0, 100, 200):
+            org, stand_in = create_org_instance(
+                self, create_repos_data(count))
+            self.assertEqual(count, len(org._get_all_repos_list()))
+            self.assertEqual(max(1, count // 100), len(stand_in.requests))
+
+    def test_get_all_repos_list_selects_repo_types(self):
+        repos = create_repos_data(2) + [
+            dict(data, name=data['name'] + '-' + kind, **{kind: True})
+            for kind in ('private', 'fork', 'archived')
+            for data in create_repos_data(1)]
+        org, _ = create_org_instance(self, repos)
+        self.assertEqual(
+            ['repo-0', 'repo-1', 'repo-0-fork', 'repo-0-archived'],
+            [data['name'] for data in org._get_all_repos_list()])
+        org, stand_in = create_org_instance(
+            self, repos, include_private=True, include_forks=False,
+            include_archived=False)
+        self.assertEqual(['repo-0', 'repo-1', 'repo-0-private'],
+                         [data['name'] for data in org._get_all_repos_list()])
+        self.assertIn('type=all', stand_in.requests[0])
+
+    def test_get_all_repos_list_from_http_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        repos = create_repos_data(250)
+        with mock.patch.object(constants, 'HTTP_CACHE_PATH', cache_dir):
+            org, stand_in = create_org_instance(self, repos, http_cache=True)
+        expected = org._get_all_repos_list()
+        self.assertEqual(3, len(os.listdir(cache_dir)))
+        # A new run, in which the last page changed
+        repos[-1]['clone_url'] = 'https://github.com/surch-test/new.git'
+        stand_in.requests = []
+        org.github = github.GitHubClient(api_url=stand_in.url,
+                                         cache_dir=cache_dir)
+        repos_list = org._get_all_repos_list()
+        self.assertEqual(expected[:-1], repos_list[:-1])
+        self.assertEqual('https://github.com/surch-test/new.git',
+                         repos_list[-1]['clone_url'])
+        self.assertEqual(2, org.github.cache_hits)
+        self.assertEqual(3, len(stand_in.requests))
+
+    def test_get_all_repos_list_waits_for_rate_limit(self):
+        org, stand_in = create_org_instance(self, create_repos_data(10))
+        clock = FakeClock()
+        reset_time = int(clock.now) + 60
+        stand_in.failures = [
+            (403, [('X-RateLimit-Remaining', '0'),
+                   ('X-RateLimit-Reset', str(reset_time))]),
+            (429, [('Retry-After', '5')]),
+            (502, [])]
+        with mock.patch.object(github, 'time', clock):
+            self.assertEqual(10, len(org._get_all_repos_list()))
+        self.assertEqual(4, org.github.rate_limiter.calls)
+        self.assertTrue(59 < clock.waits[0] <= 61)
+        # The third attempt backs off for 4 seconds
+        self.assertEqual([5, 4], clock.waits[1:])
+        self.assertEqual(sum(clock.waits), org.github.rate_limiter.wait_time)
+        self.assertIn('4 GitHub API calls', org.github.get_summary())
+
+    def test_get_all_repos_list_spaces_out_requests(self):
+        org, stand_in = create_org_instance(self, create_repos_data(250))
+        clock = FakeClock()
+        stand_in.headers = [('X-RateLimit-Remaining', '10'),
+                            ('X-RateLimit-Reset', str(int(clock.now) + 100))]
+        with mock.patch.object(github, 'time', clock):
+            self.assertEqual(250, len(org._get_all_repos_list()))
+        # 10 requests are left for the 100 seconds until the reset, so the
+        # 2 remaining pages are requested about 10 seconds apart
+        self.assertEqual(2, len(clock.waits))
+        self.assertTrue(18 < org.github.rate_limiter.wait_time <= 20)
+
+    def test_get_all_repos_list_gives_up(self):
+        org, stand_in = create_org_instance(self, create_repos_data(10))
+        clock = FakeClock()
+        stand_in.failures = [(503, [])] * github.MAX_ATTEMPTS
+        with mock.patch.object(github, 'time', clock):
+            self.assertRaises(SystemExit, org._get_all_repos_list)
+            self.assertEqual([1, 2, 4, 8], clock.waits)
+            # Not rate limited, so not retried
+            stand_in.failures = [(403, [])]
+            self.assertRaises(SystemExit, org._get_all_repos_list)
+        self.assertEqual(4, len(clock.waits))
+
+    def test_search_skips_unchanged_repos(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        with mock.patch.object(constants, 'STATE_PATH', state_dir):
+            org, stand_in = create_org_instance(
+                self, create_repos_data(
+                    3, pushed_at='2016-09-01T10:00:00Z', size=100,
+                    default_branch='master'),
+                incremental=True)
+        failing_repos = set(['repo-2'])
+        scanned_repos = []
+
+        def scan_repo(repo_instance, search_list):
+            scanned_repos.append(repo_instance.repo_name)
+            if repo_instance.repo_name in failing_repos:
+                return 'Failed to scan repo {0}'.format(
+                    repo_instance.repo_name)
+
+        def search(search_list=('s3cr3t',)):
+            del scanned_repos[:]
+            org.search(search_list=list(search_list))
+            return sorted(scanned_repos)
+
+        with mock.patch.object(org, '_fetch_repo',
+                               side_effect=lambda repo: (repo, None)), \
+                mock.patch.object(org, '_scan_repo', side_effect=scan_repo):
+            self.assertEqual(['repo-0', 'repo-1', 'repo-2'], search())
+            # The failed repo is scanned again
+            failing_repos.clear()
+            self.assertEqual(['repo-2'], search())
+            self.assertEqual([], search())
+            stand_in.repos[1]['pushed_at'] = '2016-09-02T10:00:00Z'
+            self.assertEqual(['repo-1'], search())
+            # A different search list invalidates the previous scans
+            self.assertEqual(['repo-0', 'repo-1', 'repo-2'],
+                             search(['s3cr3t', 'p4ssw0rd']))
+        with open(os.path.join(state_dir, 'surch-test.json')) as state_file:
+            state = json.load(state_file)
+        self.assertEqual(dict(pushed_at='2016-09-02T10:00:00Z', size=100,
+                              default_branch='master'),
+                         state['repos']['repo-1'])
+
+    def test_search_orders_repos_by_cost(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        repos_data = create_repos_data(4)
+        for data, size in zip(repos_data, (10, 300, 50, 0)):
+            data['size'] = size
+        with mock.patch.object(constants, 'STATE_PATH', state_dir):
+            org, _ = create_org_instance(self, repos_data)
+        searched_repos = []
+
+        def search_repos(repos, search_list):
+            searched_repos[:] = [repo_instance.repo_name
+                                 for repo_instance in repos]
+            return []
+
+        with mock.patch.object(org, '_search_repos',
+                               side_effect=search_repos):
+            org.search(search_list=['s3cr3t'])
+            self.assertEqual(['repo-1', 'repo-2', 'repo-0', 'repo-3'],
+                             searched_repos)
+            # The durations of the last run take precedence, and the other
+            # repos are estimated by the time per KB they took
+            org._save_state(dict(stats={
+                'repo-0': dict(duration=100, commits=50),
+                'repo-1': dict(duration=10, commits=5)}))
+            org.search(search_list=['s3cr3t'])
+            self.assertEqual(['repo-0', 'repo-2', 'repo-1', 'repo-3'],
+                             searched_repos)
+
+    def test_search_logs_repo_durations(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        remote_path = os.path.join(work_dir, 'remotes', 'repo-0')
+        create_local_repo(remote_path)
+        repos_data = create_repos_data(1)
+        repos_data[0]['clone_url'] = remote_path
+        with mock.patch.object(constants, 'STATE_PATH', work_dir):
+            org, _ = create_org_instance(self, repos_data)
+        with mock.patch.object(org.logger, 'info') as info:
+            org.search(search_list=['s3cr3t'])
+        messages = [call[0][0] for call in info.call_args_list]
+        self.assertIn('Searched 1 repositories', ' '.join(messages))
+        self.assertTrue(any(message.startswith('  repo-0: ')
+                            for message in messages))
+        stats = org._load_state()['stats']['repo-0']
+        self.assertEqual(5, stats['commits'])
+        self.assertTrue(stats['duration'] > 0)
+
+    def test_get_all_repos_list_of_missing_org(self):
+        org, _ = create_org_instance(self, [])
+        org.organization = 'missing'
+        self.assertRaises(SystemExit, org._get_all_repos_list)
+
     def test_get_repo_include_list_with_repos_to_include(self):
         org = organization.Organization(organization='cloudify-cosmo')
         all_repo = [{'name': 'a', 'clone_url': 'a'},
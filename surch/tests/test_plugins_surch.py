@@ -15,12 +15,18 @@
 
 
 import os
+import json
+import time
 import mock
 import shutil
+import urlparse
+import threading
+import SocketServer
+import BaseHTTPServer
 
 import testtools
 
-from surch import utils
+from surch import utils, matcher
 from surch.plugins import vault
 from surch.plugins import handler
 from surch.plugins import pagerduty
@@ -56,6 +62,86 @@ temp_secrets = {u'lease_id': u'',
                 u'renewable': False}
 
 
+class VaultStandIn(object):
+    """A local stand-in for the Vault key/value secrets API, serving the
+    data of secrets by their paths, and listing their directories.
+    """
+
+    def __init__(self, secrets, token='token', delay=0.0):
+        self.secrets = secrets
+        self.token = token
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            # Keeps the connections alive
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, body = stand_in.handle(
+                    self.path, self.headers.get('X-Vault-Token'),
+                    self.client_address)
+                body = json.dumps(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs=dict(poll_interval=0.01))
+        thread.daemon = True
+        thread.start()
+
+    def handle(self, path, token, client_address):
+        with self.lock:
+            self.requests.append(path)
+            self.connections.add(client_address)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            return self.respond(path, token)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def respond(self, path, token):
+        if token != self.token:
+            return 403, dict(errors=['permission denied'])
+        path, _, query = path.partition('?')
+        path = path[len('/v1/'):]
+        if not urlparse.parse_qs(query).get('list'):
+            if path not in self.secrets:
+                return 404, dict(errors=[])
+            return 200, dict(data=self.secrets[path])
+        prefix = path.rstrip('/') + '/'
+        keys = set()
+        for name in self.secrets:
+            if name.startswith(prefix):
+                key, slash, _ = name[len(prefix):].partition('/')
+                keys.add(key + slash)
+        if not keys:
+            return 404, dict(errors=[])
+        return 200, dict(data=dict(keys=sorted(keys)))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
 class TestHandler(testtools.TestCase):
     def test_plugins_handle(self):
         plugins_list = (u'pagerduty',)
@@ -105,3 +191,58 @@ class TestVault(testtools.TestCase):
         self.assertIn('username', content)
         self.assertIn('jenkins', content)
         utils.remove_repos_folder(working_dir)
+
+    def test_vault_read_concurrently(self):
+        secrets = {
+            'secret/jenkins': dict(password='jenkins-s3cr3t', user='jenkins'),
+            'secret/aws/ec2': dict(access_key_id='AKIA1234',
+                                   secret='aws password', port=22),
+            'secret/aws/s3/backups': dict(secret_key='s3-s3cr3t'),
+            'secret/ssh': dict(private_key='ssh-rsa AAAA'),
+        }
+        for index in range(20):
+            secrets['secret/apps/app-{0}'.format(index)] = dict(
+                api_token='t0ken.{0}'.format(index))
+        stand_in = VaultStandIn(secrets, delay=0.02)
+        self.addCleanup(stand_in.close)
+        content = vault.get_search_list(
+            vault_url=stand_in.url, vault_token='token',
+            secret_path='secret',
+            key_list=('.*password.*', '.*key.*', '.*secret.*', '.*api.*',
+                      '*invalid*'),
+            jobs=4)
+        # Values containing 'password' and SSH keys aren't searched for
+        self.assertEqual(sorted(
+            ['AKIA1234', 's3-s3cr3t', 'jenkins-s3cr3t'] +
+            ['t0ken\\.{0}'.format(index) for index in range(20)]),
+            sorted(content))
+        # 4 directories listed and 24 secrets read
+        self.assertEqual(28, len(stand_in.requests))
+        self.assertEqual(4, stand_in.max_active)
+        self.assertTrue(len(stand_in.connections) <= 4)
+
+    def test_vault_values_are_matched_as_plain_strings(self):
+        vault_client = vault.Vault(vault_url='http://localhost:8200',
+                                   vault_token='token', secret_path='secret')
+        search_list = []
+        for index in range(2000):
+            search_list.extend(vault_client.get_values(dict(
+                secret_key='t0k3n-{0}_a/b+c.d*e[f]^g$'.format(index))))
+        patterns = matcher.compile_patterns(search_list)
+        self.assertTrue(patterns.literal)
+        self.assertTrue(patterns.match_in_process)
+        # All matched by the Aho-Corasick automaton, none as regexes
+        self.assertEqual([], patterns.matcher.regexes)
+        self.assertEqual(2000, len(patterns.matcher.literals))
+        self.assertTrue(patterns.matcher.search(
+            'token: t0k3n-1999_a/b+c.d*e[f]^g$\n'))
+        self.assertFalse(patterns.matcher.search(
+            'token: t0k3n-1999_a/b+c.dXe[f]^g$\n'))
+
+    def test_vault_read_with_wrong_token(self):
+        stand_in = VaultStandIn({'secret/jenkins': dict(password='s3cr3t')})
+        self.addCleanup(stand_in.close)
+        self.assertRaises(
+            vault.hvac.exceptions.VaultError, vault.get_search_list,
+            vault_url=stand_in.url, vault_token='wrong',
+            secret_path='secret')
@@ -17,11 +17,16 @@ import os
 import sys
 import shutil
 import logging
-
+import multiprocessing
+from time import time
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 from distutils.spawn import find_executable
 
-import yaml
+from . import constants, store, config
+
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
 
 
 def setup_logger():
@@ -50,6 +55,18 @@ def merge_2_list(list1, list2):
     return list
 
 
+def load_config(config_file):
+    """Return the `config.Settings` of the config file, which is read and
+    validated only once
+    """
+    try:
+        return config.load(config_file)
+    except config.ConfigError as error:
+        logger.error('Invalid config file {0}: {1}'.format(
+            config_file, error))
+        sys.exit(1)
+
+
 def read_config_file(config_file,
                      pager=None,
                      source=None,
@@ -57,27 +74,68 @@ def read_config_file(config_file,
                      search_list=None,
                      print_result=False,
                      is_organization=True,
-                     remove_cloned_dir=False):
-    """Define vars from "config.yaml" file
+                     remove_cloned_dir=False,
+                     scan_mode=constants.DEFAULT_SCAN_MODE,
+                     jobs=1,
+                     clone_jobs=1,
+                     scan_jobs=1,
+                     results_store=store.DEFAULT_RESULTS_STORE,
+                     incremental=False,
+                     refs=constants.DEFAULT_REFS,
+                     mirror=False,
+                     shared_objects=False,
+                     object_backend=constants.DEFAULT_OBJECT_BACKEND,
+                     match_mode=constants.DEFAULT_MATCH_MODE,
+                     detectors=(),
+                     max_blob_size=None,
+                     skip_binary=False,
+                     include_paths=(),
+                     exclude_paths=(),
+                     github_api_url=constants.GITHUB_API_URL,
+                     include_private=False,
+                     include_forks=True,
+                     include_archived=True,
+                     http_cache=True):
+    """Define vars from "config.yaml" file, or from its already loaded
+    `config.Settings`
     """
-    with open(config_file) as config:
-        conf_vars = yaml.load(config.read())
+    settings = load_config(config_file)
+    conf_vars = settings.to_dict()
 
     search_list = search_list or []
-    try:
-        for value in search_list:
-            value = value.encode('ascii')
-            conf_vars['search_list'].append(value)
-    except KeyError:
-        search_list = search_list
+    if 'search_list' in conf_vars:
+        conf_vars['search_list'].extend(
+            value.encode('ascii') for value in search_list)
     conf_vars.setdefault('pager', pager)
     conf_vars.setdefault('source', source)
-    conf_vars.setdefault('config_file', config_file)
+    # Passed along so the file isn't read again
+    conf_vars['config_file'] = settings
     conf_vars.setdefault('search_list', search_list)
     conf_vars.setdefault('print_result', print_result)
     conf_vars.setdefault('verbose', verbose)
     conf_vars.setdefault('is_organization', is_organization)
     conf_vars.setdefault('remove_cloned_dir', remove_cloned_dir)
+    conf_vars.setdefault('scan_mode', scan_mode)
+    conf_vars.setdefault('jobs', jobs)
+    conf_vars.setdefault('clone_jobs', clone_jobs)
+    conf_vars.setdefault('scan_jobs', scan_jobs)
+    conf_vars.setdefault('results_store', results_store)
+    conf_vars.setdefault('incremental', incremental)
+    conf_vars.setdefault('refs', refs)
+    conf_vars.setdefault('mirror', mirror)
+    conf_vars.setdefault('shared_objects', shared_objects)
+    conf_vars.setdefault('object_backend', object_backend)
+    conf_vars.setdefault('match_mode', match_mode)
+    conf_vars.setdefault('detectors', detectors)
+    conf_vars.setdefault('max_blob_size', max_blob_size)
+    conf_vars.setdefault('skip_binary', skip_binary)
+    conf_vars.setdefault('include_paths', include_paths)
+    conf_vars.setdefault('exclude_paths', exclude_paths)
+    conf_vars.setdefault('github_api_url', github_api_url)
+    conf_vars.setdefault('include_private', include_private)
+    conf_vars.setdefault('include_forks', include_forks)
+    conf_vars.setdefault('include_archived', include_archived)
+    conf_vars.setdefault('http_cache', http_cache)
     return conf_vars
 
 
@@ -93,15 +151,39 @@ def print_errors_summary(error_summary):
 
 
 def print_result_file(result_file=None):
-    with open(result_file) as results_file:
-        results = results_file.read()
-    logger.info(results)
+    logger.info(store.open_store(result_file).dump())
 
 
 def convert_to_seconds(start, end):
     return str(round(end - start, 3))
 
 
+def parse_size(size):
+    """Return the number of bytes of a size such as 1048576, '512K' or '10M'
+    """
+    if size is None or isinstance(size, (int, long)):
+        return size
+    size = str(size).strip().upper()
+    multiplier = SIZE_UNITS.get(size[-1:])
+    try:
+        if multiplier:
+            return int(float(size[:-1]) * multiplier)
+        return int(size)
+    except ValueError:
+        logger.error('Invalid size: {0}. Use a number of bytes with an '
+                     'optional K, M or G suffix.'.format(size))
+        sys.exit(1)
+
+
+def format_size(size):
+    """Return a human readable size, e.g. 1.5M
+    """
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit]:
+            return '{0:.1f}{1}'.format(float(size) / SIZE_UNITS[unit], unit)
+    return '{0}B'.format(size)
+
+
 def find_string_between_strings(string, first, last):
     try:
         start = string.index(first) + len(first)
@@ -111,6 +193,83 @@ def find_string_between_strings(string, first, last):
         return ' '
 
 
+class _TimedCall(object):
+    """Picklable wrapper returning the result of `func` together with the
+    times it started and ended.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        start = time()
+        result = self.func(item)
+        return result, (start, time())
+
+
+def _get_covered_time(intervals):
+    """Return the time covered by at least one of the (start, end)
+    intervals
+    """
+    covered = 0
+    covered_until = 0
+    for start, end in sorted(intervals):
+        start = max(start, covered_until)
+        if end > start:
+            covered += end - start
+        covered_until = max(covered_until, end)
+    return covered
+
+
+class ParallelMap(object):
+    """Iterable applying `func` to every item using a pool of `jobs`
+    threads (or processes, in which case `func` must be picklable).
+
+    The results are yielded in the order of the items, regardless of the
+    order in which they were completed, as soon as they are available.
+    Once the iteration is over, `speedup` holds the achieved speedup, which
+    is the total time spent in `func` divided by the wall-clock time during
+    which `func` was running. The time the consumer spends between results
+    while no call is running isn't counted.
+    """
+    def __init__(self, func, items, jobs=1, processes=False):
+        self.func = func
+        self.items = items
+        self.jobs = jobs
+        self.processes = processes
+        self.speedup = 1.0
+
+    def __iter__(self):
+        intervals = []
+        timed_func = _TimedCall(self.func)
+        pool = None
+        if self.jobs > 1 and len(self.items) > 1:
+            pool_class = multiprocessing.Pool if self.processes \
+                else ThreadPool
+            pool = pool_class(min(self.jobs, len(self.items)))
+            timed_results = pool.imap(timed_func, self.items, chunksize=1)
+        else:
+            timed_results = (timed_func(item) for item in self.items)
+        try:
+            for result, interval in timed_results:
+                intervals.append(interval)
+                yield result
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        busy_time = sum(end - start for start, end in intervals)
+        wall_time = _get_covered_time(intervals)
+        self.speedup = busy_time / wall_time if wall_time else 1.0
+
+
+def parallel_map(func, items, jobs=1, processes=False):
+    """Apply `func` to every item using a pool of `jobs` workers.
+    Return the list of results and the achieved speedup, see `ParallelMap`.
+    """
+    results = ParallelMap(func, items, jobs=jobs, processes=processes)
+    return list(results), results.speedup
+
+
 def check_if_executable_exists_else_exit(executable):
     if not find_executable(executable):
         logger.error(